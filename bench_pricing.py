@@ -0,0 +1,116 @@
+"""Benchmark of cart pricing with modifiers on very large carts.
+
+Fills a cart with --lines distinct lines, each a product with a random
+combination of the options its modifier groups offer, priced by a PriceBook
+as the terminal does. Then it makes --changes random quantity changes and
+removals, and compares the cart's running total with a full recomputation
+after every change, which is what pricing without the incremental total
+would cost:
+
+    python bench_pricing.py [--lines 10000] [--changes 2000] [--products 3000] [--db]
+
+Without --db, the products are made up and the modifiers are the defaults
+of modifiers.py, with one group restricted to a third of the products. With
+--db, the installed modifiers and the real catalog are used (nothing is
+written).
+"""
+import argparse
+import math
+import random
+import time
+from decimal import Decimal
+
+from cart import Cart
+from modifiers import DEFAULT_GROUPS, PriceBook, load_price_book
+
+
+def synthetic(products):
+    """(price_book, [(product_id, name, base_price)]) of made-up products."""
+    catalog = [
+        (product_id, f"product {product_id}", Decimal(random.randint(150, 600)) / 100)
+        for product_id in range(1, products + 1)
+    ]
+    # Exercise per-product applicability: only every third product offers sugar
+    book = PriceBook(DEFAULT_GROUPS, {"sugar": range(1, products + 1, 3)})
+    return book, catalog
+
+
+def from_database():
+    from catalog_sync import fetch_catalog
+    from db import connect
+
+    conn = connect()
+    try:
+        book = load_price_book(conn)
+        catalog = [(product_id, name, Decimal(str(price))) for product_id, name, price, *_ in fetch_catalog(conn)]
+        conn.rollback()
+    finally:
+        conn.close()
+    return book, catalog
+
+
+def recompute_total(cart, book, base_prices):
+    """Prices every line from scratch, as a cart without a running total would after each change."""
+    return sum(
+        (book.unit_price(base_prices[line.product_id], line.size, line.state, line.sugar) * line.quantity
+         for line in cart),
+        Decimal("0.00")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price very large carts with modifiers.")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--changes", type=int, default=2000, help="quantity changes and removals after filling")
+    parser.add_argument("--products", type=int, default=3000, help="made-up products (without --db)")
+    parser.add_argument("--db", action="store_true", help="use the installed modifiers and catalog")
+    args = parser.parse_args()
+
+    book, catalog = from_database() if args.db else synthetic(args.products)
+    base_prices = {product_id: price for product_id, _, price in catalog}
+    combinations = sum(
+        math.prod(len(group.options) for group in book.groups_for(product_id)) for product_id, _, _ in catalog
+    )
+    if combinations < args.lines:
+        parser.error(f"Only {combinations} distinct lines are possible; use more products or fewer lines.")
+
+    cart = Cart()
+    adds = 0
+    started = time.perf_counter()
+    while len(cart) < args.lines:
+        adds += 1
+        product_id, name, price = random.choice(catalog)
+        options = {group.code: random.choice(group.options)[0] for group in book.groups_for(product_id)}
+        cart.add(product_id, name, book.unit_price(price, **options), random.randint(1, 3), **options)
+    fill_s = time.perf_counter() - started
+
+    line_ids = [line.line_id for line in cart]
+    incremental_s = recompute_s = 0.0
+    changes = mismatches = 0
+    while changes < args.changes and cart:
+        line_id = random.choice(line_ids)
+        if cart.get(line_id) is None:
+            continue
+        changes += 1
+        started = time.perf_counter()
+        if random.random() < 0.2:
+            cart.remove(line_id)
+        else:
+            cart.set_quantity(line_id, random.randint(1, 5))
+        total = cart.total
+        incremental_s += time.perf_counter() - started
+
+        started = time.perf_counter()
+        full = recompute_total(cart, book, base_prices)
+        recompute_s += time.perf_counter() - started
+        mismatches += full != total
+
+    print(f"{len(catalog)} product(s), {len(book.groups)} modifier group(s), {args.lines} cart lines")
+    print(f"  fill:        {fill_s * 1000:.1f} ms, {fill_s * 1e6 / adds:.2f} µs per add ({adds - args.lines} merged into a line)")
+    print(f"  per change:  {incremental_s * 1e6 / changes:.2f} µs with the running total, "
+          f"{recompute_s * 1000 / changes:.2f} ms repricing every line")
+    print(f"  final total: {cart.total} over {len(cart)} lines, {mismatches} mismatch(es) with a full recomputation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Contention benchmark for the checkout stock update.
+
+Simulated terminals, each a thread with its own connection, sell random
+lines of a few scarce products at the same time until the stock runs out
+or time is up:
+
+    python bench_stock.py [--terminals 8] [--products 4] [--stock 200] [--seconds 10]
+                          [--mode clamp|conditional|reserve]
+
+clamp is the old unchecked `GREATEST(stock - n, 0)` update, conditional is
+sales.take_stock(), and reserve takes a reservation for every line first,
+like a terminal with STOCK_RESERVATIONS on. Only the stock step runs; no
+sales are written. The benchmark products are created with a "bench-" name
+and deleted at the end. Oversold units are units a terminal believed it
+sold beyond what actually left the stock.
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+
+import psycopg2
+from psycopg2 import errors
+
+from db import connect
+from reservations import release_all, reserve
+from sales import OutOfStockError, take_stock
+
+
+def clamp_stock(cur, quantities):
+    """The pre-reservation checkout update: never fails, silently clamps at zero."""
+    for product_id, quantity in sorted(quantities.items()):
+        cur.execute("UPDATE products SET stock = GREATEST(stock - %s, 0) WHERE id = %s", (quantity, product_id))
+
+
+def terminal(mode, product_ids, deadline, results):
+    conn = connect()
+    holder = str(uuid.uuid4())
+    sold = dict.fromkeys(product_ids, 0)
+    latencies, refused, deadlocks = [], 0, 0
+    try:
+        while time.monotonic() < deadline:
+            lines = random.sample(product_ids, random.randint(1, min(3, len(product_ids))))
+            quantities = {product_id: random.randint(1, 3) for product_id in lines}
+            start = time.perf_counter()
+            try:
+                if mode == "reserve":
+                    for product_id, quantity in quantities.items():
+                        if not reserve(conn, holder, product_id, quantity):
+                            raise OutOfStockError([(product_id, quantity, None)])
+                        conn.commit()
+                with conn.cursor() as cur:
+                    if mode == "clamp":
+                        clamp_stock(cur, quantities)
+                    else:
+                        take_stock(cur, quantities, holder if mode == "reserve" else None)
+                conn.commit()
+            except OutOfStockError:
+                conn.rollback()
+                if mode == "reserve":
+                    release_all(conn, holder)
+                    conn.commit()
+                refused += 1
+                if len(quantities) == len(product_ids) or not _any_left(conn, product_ids):
+                    break
+                continue
+            except errors.DeadlockDetected:
+                conn.rollback()
+                deadlocks += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            for product_id, quantity in quantities.items():
+                sold[product_id] += quantity
+    finally:
+        conn.close()
+    results.append((sold, latencies, refused, deadlocks))
+
+
+def _any_left(conn, product_ids):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(sum(stock - reserved), 0) FROM products WHERE id = ANY(%s)", (product_ids,))
+        left = cur.fetchone()[0]
+    conn.rollback()
+    return left > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent checkouts competing for scarce stock.")
+    parser.add_argument("--terminals", type=int, default=8)
+    parser.add_argument("--products", type=int, default=4)
+    parser.add_argument("--stock", type=int, default=200, help="starting stock of every benchmark product")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--mode", choices=("clamp", "conditional", "reserve"), default="conditional")
+    args = parser.parse_args()
+
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (name, stock, price)
+            SELECT 'bench-' || g, %s, 1.00 FROM generate_series(1, %s) g
+            RETURNING id
+        """, (args.stock, args.products))
+        product_ids = sorted(row[0] for row in cur.fetchall())
+    conn.commit()
+
+    try:
+        results = []
+        deadline = time.monotonic() + args.seconds
+        threads = [
+            threading.Thread(target=terminal, args=(args.mode, product_ids, deadline, results))
+            for _ in range(args.terminals)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, stock, reserved FROM products WHERE id = ANY(%s)", (product_ids,))
+            final = {product_id: (stock, reserved) for product_id, stock, reserved in cur.fetchall()}
+        conn.rollback()
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM stock_reservations WHERE product_id = ANY(%s)", (product_ids,))
+            cur.execute("DELETE FROM products WHERE id = ANY(%s)", (product_ids,))
+        conn.commit()
+        conn.close()
+
+    latencies = sorted(seconds for _, lats, _, _ in results for seconds in lats)
+    sold = sum(sum(s.values()) for s, _, _, _ in results)
+    taken = sum(args.stock - stock for stock, _ in final.values())
+    leaked = sum(reserved for _, reserved in final.values())
+    print(f"Mode {args.mode}: {args.terminals} terminals, {args.products} products x {args.stock} units")
+    print(f"  checkouts:  {len(latencies)} in {elapsed:.2f} s ({len(latencies) / elapsed:.0f}/s)")
+    if latencies:
+        print(f"  latency:    p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"  refused:    {sum(r for _, _, r, _ in results)}, deadlocks: {sum(d for _, _, _, d in results)}")
+    print(f"  units sold: {sold}, units taken off stock: {taken}, oversold: {sold - taken}, "
+          f"still reserved: {leaked}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except psycopg2.OperationalError as e:
+        print(f"Could not reach the database: {e}")
@@ -0,0 +1,100 @@
+"""The current sale: cart lines indexed for constant-time updates.
+
+Each line has a stable line_id, used as its Treeview iid, and lines are also
+indexed by (product_id, size, state, sugar) so adding a product that is
+already in the cart merges into its line without scanning. The cart total is
+adjusted on every change instead of being summed again.
+"""
+from decimal import Decimal
+
+
+class CartLine:
+    __slots__ = ("line_id", "product_id", "name", "size", "state", "sugar", "price", "quantity")
+
+    def __init__(self, line_id, product_id, name, size, state, sugar, price, quantity):
+        self.line_id = line_id
+        self.product_id = product_id
+        self.name = name
+        self.size = size
+        self.state = state
+        self.sugar = sugar
+        self.price = price
+        self.quantity = quantity
+
+    @property
+    def key(self):
+        return (self.product_id, self.size, self.state, self.sugar)
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    def __init__(self):
+        self._lines = {}   # line_id -> CartLine, in the order lines were added
+        self._by_key = {}  # (product_id, size, state, sugar) -> CartLine
+        self._product_quantities = {}  # product_id -> quantity across all of its lines
+        self._next_line_id = 1
+        self.total = Decimal("0.00")
+
+    def __iter__(self):
+        return iter(self._lines.values())
+
+    def __len__(self):
+        return len(self._lines)
+
+    def get(self, line_id):
+        return self._lines.get(line_id)
+
+    def find(self, product_id, size=None, state=None, sugar=None):
+        """Returns the line for this product and options, or None."""
+        return self._by_key.get((product_id, size, state, sugar))
+
+    def add(self, product_id, name, price, quantity=1, size=None, state=None, sugar=None):
+        """Adds quantity to the matching line, creating it if needed, and returns the line."""
+        price = Decimal(str(price))
+        line = self._by_key.get((product_id, size, state, sugar))
+        if line is None:
+            line = CartLine(self._next_line_id, product_id, name, size, state, sugar, price, 0)
+            self._next_line_id += 1
+            self._lines[line.line_id] = line
+            self._by_key[line.key] = line
+        line.quantity += quantity
+        self._adjust(line, quantity)
+        return line
+
+    def set_quantity(self, line_id, quantity):
+        """Changes a line's quantity; a quantity of zero or less removes the line."""
+        line = self._lines[line_id]
+        if quantity <= 0:
+            return self.remove(line_id)
+        delta = quantity - line.quantity
+        line.quantity = quantity
+        self._adjust(line, delta)
+        return line
+
+    def remove(self, line_id):
+        """Removes a line and returns it."""
+        line = self._lines.pop(line_id)
+        del self._by_key[line.key]
+        self._adjust(line, -line.quantity)
+        return line
+
+    def _adjust(self, line, delta):
+        self.total += line.price * delta
+        remaining = self._product_quantities.get(line.product_id, 0) + delta
+        if remaining:
+            self._product_quantities[line.product_id] = remaining
+        else:
+            self._product_quantities.pop(line.product_id, None)
+
+    def quantity_of(self, product_id):
+        """Total quantity of a product across all of its option lines."""
+        return self._product_quantities.get(product_id, 0)
+
+    def clear(self):
+        self._lines.clear()
+        self._by_key.clear()
+        self._product_quantities.clear()
+        self.total = Decimal("0.00")
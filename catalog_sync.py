@@ -0,0 +1,197 @@
+"""Catalog changes pushed from PostgreSQL to every terminal.
+
+Statement-level triggers on products send a NOTIFY on CHANNEL when a
+transaction that inserted, updated or deleted products commits. That
+includes the stock update of every checkout. The payload is the operation
+and the changed ids, e.g. "update:3,17", or the operation and "*" when the
+ids do not fit in a notification. Install the triggers with
+`python catalog_sync.py --install` (the same SQL is in tbt.txt).
+
+CatalogListener keeps one dedicated connection LISTENing on a background
+thread. It gathers the ids that arrive within CATALOG_NOTIFY_COALESCE_MS and
+hands them to a callback on the Tk thread. The first callback after
+connecting, and the first after every reconnect, asks for everything,
+because changes made while nobody was listening were not announced.
+"""
+import argparse
+import queue
+import random
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+from config import (
+    CATALOG_NOTIFY_COALESCE_MS, CATALOG_LISTEN_KEEPALIVE_S, POOL_BACKOFF_BASE_S, POOL_BACKOFF_MAX_S,
+)
+from db import connect
+
+CHANNEL = "products_changed"
+POLL_INTERVAL_MS = 50
+
+TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION notify_products_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    ids text;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT string_agg(id::text, ',') INTO ids FROM old_rows;
+    ELSE
+        SELECT string_agg(id::text, ',') INTO ids FROM new_rows;
+    END IF;
+    IF ids IS NOT NULL THEN
+        -- Payloads are limited to 8000 bytes; listeners reload everything on '*'
+        PERFORM pg_notify('products_changed',
+                          lower(TG_OP) || ':' || CASE WHEN length(ids) > 7900 THEN '*' ELSE ids END);
+    END IF;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS products_notify_insert ON products;
+CREATE TRIGGER products_notify_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_products_changed();
+DROP TRIGGER IF EXISTS products_notify_update ON products;
+CREATE TRIGGER products_notify_update AFTER UPDATE ON products
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_products_changed();
+DROP TRIGGER IF EXISTS products_notify_delete ON products;
+CREATE TRIGGER products_notify_delete AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_products_changed();
+"""
+
+
+def fetch_catalog(conn, product_ids=None):
+    """Database job: catalog rows (id, name, price, stock, photo_hash, barcode) in name order.
+
+    With `product_ids`, only those products are read; ids missing from the
+    result were deleted.
+    """
+    query = "SELECT id, name, price, stock, photo_hash, barcode FROM products"
+    with conn.cursor() as cur:
+        if product_ids is None:
+            cur.execute(query + " ORDER BY name ASC")
+        else:
+            cur.execute(query + " WHERE id = ANY(%s) ORDER BY name ASC", (list(product_ids),))
+        return cur.fetchall()
+
+
+def parse_payload(payload):
+    """Returns (ids, everything) for a notification payload such as "update:3,17"."""
+    _, _, ids = payload.partition(":")
+    if ids == "*":
+        return set(), True
+    try:
+        return {int(product_id) for product_id in ids.split(",") if product_id}, False
+    except ValueError:
+        return set(), True
+
+
+class CatalogListener:
+    def __init__(self, root, on_change, coalesce_ms=CATALOG_NOTIFY_COALESCE_MS):
+        """on_change(product_ids, everything) runs on the Tk thread for every batch of changes."""
+        self.root = root
+        self.on_change = on_change
+        self.coalesce = coalesce_ms / 1000
+        self.notifications = 0
+        self.reconnects = 0
+        self._changes = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="catalog-listener", daemon=True)
+        self._poll_id = None
+
+    def start(self):
+        self._thread.start()
+        self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+
+    def _run(self):
+        attempt = 0
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                conn = connect()
+            except psycopg2.OperationalError:
+                delay = min(POOL_BACKOFF_BASE_S * 2 ** attempt, POOL_BACKOFF_MAX_S)
+                self._stop.wait(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+                if connected_before:
+                    self.reconnects += 1
+                connected_before = True
+                attempt = 0
+                # Nothing was announced before LISTEN, so the catalog is read in full first
+                self._changes.put((set(), True))
+                self._listen(conn)
+            except psycopg2.Error as e:
+                print(f"Catalog listener lost its connection: {e}")
+            finally:
+                conn.close()
+
+    def _listen(self, conn):
+        changed, everything, deadline = set(), False, None
+        last_traffic = time.monotonic()
+        while not self._stop.is_set():
+            timeout = 0.5 if deadline is None else max(deadline - time.monotonic(), 0)
+            if select.select([conn], [], [], timeout)[0]:
+                conn.poll()
+                last_traffic = time.monotonic()
+            elif time.monotonic() - last_traffic > CATALOG_LISTEN_KEEPALIVE_S:
+                # A silent connection may be dead; a round trip finds out
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                last_traffic = time.monotonic()
+            while conn.notifies:
+                ids, all_ids = parse_payload(conn.notifies.pop(0).payload)
+                self.notifications += 1
+                changed |= ids
+                everything |= all_ids
+                if deadline is None:
+                    deadline = time.monotonic() + self.coalesce
+            if deadline is not None and time.monotonic() >= deadline:
+                self._changes.put((changed, everything))
+                changed, everything, deadline = set(), False, None
+
+    def _drain(self):
+        while True:
+            try:
+                product_ids, everything = self._changes.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.on_change(product_ids, everything)
+            except Exception as e:
+                print(f"Error applying catalog changes: {e}")
+        self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+
+    def stop(self):
+        self._stop.set()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._thread.join(timeout=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog change notifications for the POS terminals.")
+    parser.add_argument("--install", action="store_true", help="create or replace the triggers on products")
+    args = parser.parse_args()
+    if not args.install:
+        parser.print_help()
+        return
+
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(TRIGGER_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Triggers installed; changes are announced on channel '{CHANNEL}'.")
+
+
+if __name__ == "__main__":
+    main()
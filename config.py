@@ -0,0 +1,78 @@
+import os
+
+# --- Database Configuration ---
+# IMPORTANT: Replace with your actual PostgreSQL connection details
+DB_NAME = "pos_db"
+DB_USER = "_pos_user"
+DB_PASSWORD = "123"
+DB_HOST = "localhost"  # Or your DB host
+DB_PORT = "5432"      # Default PostgreSQL port
+DB_CONNECT_TIMEOUT_S = 3  # Give up on an unreachable server quickly instead of hanging
+
+# --- Thumbnail Cache ---
+# Pre-resized product pictures are kept on disk here and in memory up to the byte bound below.
+THUMB_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pospy", "thumbs")
+THUMB_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# --- Photo Variants ---
+VARIANT_RENDER_WORKERS = None  # Processes rendering picture variants in bulk; None uses every CPU
+
+# --- Menu Grid ---
+MENU_OVERSCAN_ROWS = 1  # Rows of tiles kept ready above and below the visible ones
+
+# --- Product Search ---
+SEARCH_DEBOUNCE_MS = 150    # Wait this long after the last keystroke before filtering
+SEARCH_SERVER_SIDE = False  # Search in PostgreSQL (pg_trgm index) instead of the in-memory index
+
+# --- Barcode Scanner ---
+SCANNER_ENABLED = True  # Add items scanned with a keyboard-wedge scanner straight to the cart
+SCAN_MAX_GAP_MS = 40    # Digits closer together than this are one scanner burst; people type slower
+SCAN_MIN_LENGTH = 6     # Shorter bursts ending in Enter are left alone
+
+# --- Connection Pool ---
+POOL_MAX_CONNECTIONS = 6        # Shared by the database workers and the image loader
+POOL_HEALTH_CHECK_IDLE_S = 2.0  # Ping connections that sat idle longer than this before reuse
+POOL_CONNECT_RETRIES = 6        # Reconnect attempts per checkout while the server is unreachable
+POOL_BACKOFF_BASE_S = 0.2       # First retry delay, doubled on every attempt...
+POOL_BACKOFF_MAX_S = 5.0        # ...up to this
+
+# --- Offline Checkout Journal ---
+# Sales made while PostgreSQL is unreachable are kept here and replayed when it is back.
+JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pospy", "sale_journal.sqlite3")
+JOURNAL_REPLAY_BATCH = 50
+JOURNAL_REPLAY_INTERVAL_S = 2.0
+JOURNAL_STATUS_INTERVAL_MS = 1000  # How often the navbar shows the replay backlog
+JOURNAL_SLOT_WAIT_S = 2.0  # A checkout waits this long for a pooled connection before journaling the sale
+
+# --- Checkout History ---
+HISTORY_PAGE_SIZE = 50  # Rows fetched per page as the history list is scrolled
+
+# --- Sales Export ---
+EXPORT_COPY_BUFFER_BYTES = 256 * 1024  # CSV read from the COPY stream per write
+EXPORT_GZIP_LEVEL = 3  # Most of level 9's saving on CSV, at a fraction of the CPU
+EXPORT_ZSTD_LEVEL = 3
+
+# --- Partitions ---
+# sales, sale_items and history are partitioned by month, see partitions.py
+PARTITION_MONTHS_AHEAD = 3  # Months created ahead of the current one, at startup and by --maintain
+PARTITION_KEEP_MONTHS = 24  # Months `python partitions.py --maintain` keeps attached, this one included; 0 keeps all
+
+# --- Reports ---
+ROLLUP_REBUILD_BATCH_DAYS = 31  # Days of sales recomputed per transaction by `python rollups.py --rebuild`
+ROLLUP_SHARDS = 16  # Rows per hour and day the sales totals are split into, so checkouts seldom share one
+REPORT_RANGES = {"Today": 1, "Yesterday and today": 2, "Last 7 days": 7, "Last 30 days": 30, "Last 365 days": 365}
+
+# --- Query Diagnostics ---
+SLOW_QUERY_MS = 200  # Statements at least this slow are written to the slow query log
+SLOW_QUERY_LOG_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pospy", "slow_queries.log")
+QUERY_STATS_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pospy", "query_stats.json")  # Written on exit
+QUERY_STATS_MEASURE_BYTES = True  # Add up the size of fetched values (costs a little on large fetches)
+
+# --- Catalog Updates ---
+CATALOG_NOTIFY_COALESCE_MS = 100  # Changes announced within this window are fetched together
+CATALOG_LISTEN_KEEPALIVE_S = 10   # Check a silent listener connection this often
+
+# --- Stock Reservations ---
+STOCK_RESERVATIONS = False    # Hold stock for items while they are in the cart, see reservations.py
+RESERVATION_TTL_S = 15 * 60   # A reservation not checked out or renewed within this is given back
+RESERVATION_SWEEP_MS = 60000  # How often each terminal gives back expired reservations
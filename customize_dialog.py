@@ -0,0 +1,154 @@
+"""The product customization dialog, built once and reused for every tap.
+
+Building a Toplevel with its option groups takes longer than a tap should,
+so CustomizeDialog builds the window and its widgets once, hidden. show()
+only re-binds it to the tapped product: the title, name, price and picture
+are swapped, the option groups the product offers are shown with their
+defaults, and the window is shown again. Confirm and Cancel hide it
+instead of destroying it. The groups come from the PriceBook (see
+modifiers.py) and are only built again when it is replaced; the price
+shown follows the chosen options.
+
+The caller supplies the product from the catalog held in memory and the
+picture from the thumbnail cache, so opening the dialog needs no query. A
+picture that is not in memory yet can be handed over later with
+set_picture().
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from PIL import ImageTk
+
+BACKGROUND = "#232323"
+FOREGROUND = "#f5f5dc"
+
+
+class CustomizeDialog:
+    def __init__(self, root, book, placeholder, on_confirm):
+        """on_confirm(product_id, name, price, stock, options) runs after Confirm, with the dialog hidden.
+
+        `price` is the base price given to show(); `options` maps each group
+        code the product offers to the chosen option.
+        """
+        self.root = root
+        self.placeholder = placeholder
+        self.on_confirm = on_confirm
+        self.product = None  # (product_id, name, price, stock) shown, None while hidden
+        self.book = None     # PriceBook the option groups were built from
+        self._shown_groups = ()  # Groups currently packed, in order
+        self._photo = None   # PhotoImage shown, dropped when the dialog is hidden
+
+        self.top = tk.Toplevel(root)
+        self.top.withdraw()
+        self.top.transient(root)
+        self.top.configure(bg=BACKGROUND)  # Dark mode background
+        self.top.protocol("WM_DELETE_WINDOW", self.hide)
+        self.top.bind("<Escape>", lambda event: self.hide())
+        self.top.bind("<Return>", lambda event: self._confirm())
+
+        # Card-like frame for modern look
+        card = ttk.Frame(self.top, style="TFrame", padding="30 20 30 20")
+        card.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+
+        self.picture = ttk.Label(card, image=placeholder, background=BACKGROUND)
+        self.picture.pack(pady=(0, 15))
+        self.heading = ttk.Label(card, font=("Segoe UI", 16, "bold"), background=BACKGROUND, foreground=FOREGROUND)
+        self.heading.pack(pady=(0, 18))
+
+        self.options_frame = ttk.Frame(card, style="TFrame")
+        self.options_frame.pack(fill=tk.X)
+        self.choices = {}        # group code -> StringVar
+        self._group_frames = {}  # group code -> LabelFrame
+
+        buttons = ttk.Frame(card, style="TFrame")
+        buttons.pack(pady=(20, 0), side=tk.BOTTOM, fill=tk.X)
+        ttk.Button(buttons, text="Cancel", command=self.hide).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+        ttk.Button(buttons, text="Confirm", command=self._confirm, style="Accent.TButton").pack(
+            side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 0))
+        self._placed = False
+        self.set_price_book(book)
+
+    def set_price_book(self, book):
+        """Builds the option groups of a new PriceBook; the current widgets are replaced."""
+        if self.product is not None:
+            # The prices shown may be gone; the cashier taps the product again
+            self.hide()
+        self.book = book
+        for frame in self._group_frames.values():
+            frame.destroy()
+        self.choices = {}
+        self._group_frames = {}
+        self._shown_groups = ()
+        for group in book.groups:
+            frame = ttk.LabelFrame(self.options_frame, text=group.label, padding=10, style="TFrame")
+            var = tk.StringVar(value=group.default)
+            for name, delta in group.options:
+                text = f"{name} ({delta:+.2f} €)" if delta else name
+                ttk.Radiobutton(frame, text=text, variable=var, value=name, style="TRadiobutton").pack(anchor=tk.W, padx=5, pady=2)
+            var.trace_add("write", lambda *_: self._show_price())
+            self.choices[group.code] = var
+            self._group_frames[group.code] = frame
+
+    def show(self, product_id, name, price, stock=None, image=None):
+        """Re-binds the dialog to a product and shows it; `image` is its picture or None for now.
+
+        Returns the binding to pass to set_picture() when the picture arrives later.
+        """
+        product = self.product = (product_id, name, price, stock)
+        self.top.title(f"Customize {name}")
+        groups = self.book.groups_for(product_id)
+        if groups != self._shown_groups:
+            # Most products offer the same groups, so this is rarely needed
+            for group in self._shown_groups:
+                self._group_frames[group.code].pack_forget()
+            for group in groups:
+                self._group_frames[group.code].pack(fill=tk.X, padx=5, pady=7)
+            self._shown_groups = groups
+        for group in groups:
+            self.choices[group.code].set(group.default)
+        self._show_price()
+        self.set_picture(product, image)
+        if not self._placed:
+            # Centered over the main window the first time; later the cashier's position is kept
+            self.top.update_idletasks()
+            x = self.root.winfo_rootx() + (self.root.winfo_width() - self.top.winfo_reqwidth()) // 2
+            y = self.root.winfo_rooty() + (self.root.winfo_height() - self.top.winfo_reqheight()) // 2
+            self.top.geometry(f"+{max(0, x)}+{max(0, y)}")
+            self._placed = True
+        self.top.deiconify()
+        self.top.lift()
+        self.top.grab_set()
+        self.top.focus_set()
+        return product
+
+    def _options(self):
+        return {group.code: self.choices[group.code].get() for group in self._shown_groups}
+
+    def _show_price(self):
+        if self.product is None:
+            return
+        _, name, price, _ = self.product
+        self.heading.configure(text=f"{name}   {self.book.unit_price(price, **self._options()):.2f} €")
+
+    def set_picture(self, product, image):
+        """Shows `image` if the dialog is still bound to `product` (from show()); None shows the placeholder."""
+        if product is not self.product:
+            return
+        self._photo = ImageTk.PhotoImage(image) if image is not None else None
+        self.picture.configure(image=self.placeholder if self._photo is None else self._photo)
+
+    def hide(self):
+        """Hides the dialog for reuse, releasing its picture."""
+        self.product = None
+        self._photo = None
+        self.picture.configure(image=self.placeholder)
+        self.top.grab_release()
+        self.top.withdraw()
+
+    def _confirm(self):
+        product = self.product
+        if product is None:
+            return
+        options = self._options()
+        self.hide()
+        self.on_confirm(*product, options)
@@ -0,0 +1,174 @@
+"""Connections to the PostgreSQL database configured in config.py.
+
+ConnectionPool hands out pooled connections to the worker threads. Each
+checkout waits for a free slot, checks that a connection which sat idle is
+still alive, and replaces dead ones, retrying with exponential backoff
+while the server is unreachable, so a Postgres restart or failover does
+not need an application restart. Connections are opened on first use and
+every returned one is kept for reuse.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from query_stats import InstrumentedCursor
+from config import (
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_CONNECT_TIMEOUT_S,
+    POOL_MAX_CONNECTIONS, POOL_HEALTH_CHECK_IDLE_S, POOL_CONNECT_RETRIES,
+    POOL_BACKOFF_BASE_S, POOL_BACKOFF_MAX_S,
+)
+
+
+def connection_params():
+    return dict(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        connect_timeout=DB_CONNECT_TIMEOUT_S,
+        cursor_factory=InstrumentedCursor  # Every statement is timed, see query_stats.py
+    )
+
+
+def connect():
+    """Opens a new connection to the PostgreSQL database from config.py."""
+    return psycopg2.connect(**connection_params())
+
+
+def is_disconnect(exc):
+    """True if `exc` means the connection itself is unusable rather than the statement failing."""
+    return isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+class ConnectionPool:
+    def __init__(self, maxconn=POOL_MAX_CONNECTIONS, retries=POOL_CONNECT_RETRIES,
+                 backoff_base=POOL_BACKOFF_BASE_S, backoff_max=POOL_BACKOFF_MAX_S,
+                 health_check_idle=POOL_HEALTH_CHECK_IDLE_S):
+        # A slot per connection bounds how many exist; the idle ones wait in _idle
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()  # Guards _idle, _closed and the counters
+        self._idle = []  # (conn, time it was returned), most recently returned last
+        self._closed = False
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_check_idle = health_check_idle
+        self.checkouts = 0
+        self.reconnects = 0        # dead connections found and replaced
+        self.connect_failures = 0  # attempts that could not reach the server
+        self.wait_time = 0.0       # seconds spent waiting for a slot or a reconnect
+        self.max_wait = 0.0
+
+    def _alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if last_used is not None and time.monotonic() - last_used < self.health_check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, retries=None, wait=None):
+        """Returns a live connection, waiting for a free slot and reconnecting as needed.
+
+        With `wait`, gives up after that many seconds without a free slot and
+        raises OperationalError, like an unreachable server.
+        """
+        retries = self.retries if retries is None else retries
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=wait):
+            raise psycopg2.OperationalError(f"no free connection after {wait} s")
+        try:
+            attempt = 0
+            while True:
+                with self._lock:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    conn, last_used = self._idle.pop() if self._idle else (None, None)
+                if conn is None:
+                    try:
+                        conn = connect()
+                    except psycopg2.OperationalError:
+                        with self._lock:
+                            self.connect_failures += 1
+                        if attempt >= retries:
+                            raise
+                        delay = min(self.backoff_base * 2 ** attempt, self.backoff_max)
+                        time.sleep(delay * random.uniform(0.5, 1.0))
+                        attempt += 1
+                        continue
+                    break  # Fresh connections need no check
+                if self._alive(conn, last_used):
+                    break
+                conn.close()
+                with self._lock:
+                    self.reconnects += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        waited = time.monotonic() - start
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection; discarded or broken connections are closed instead of reused."""
+        try:
+            if not conn.closed and not discard:
+                # Reused connections start outside a transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                with self._lock:
+                    if not self._closed:
+                        self._idle.append((conn, time.monotonic()))
+                        return
+            conn.close()
+        except psycopg2.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, retries=None, wait=None):
+        """with pool.connection() as conn: ... commits on success and rolls back on error."""
+        conn = self.getconn(retries, wait)
+        discard = False
+        try:
+            with conn:
+                yield conn
+        except Exception as e:
+            discard = is_disconnect(e)
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "reconnects": self.reconnects,
+                "connect_failures": self.connect_failures,
+                "wait_time_s": round(self.wait_time, 3),
+                "max_wait_s": round(self.max_wait, 3),
+            }
+
+    def closeall(self):
+        """Closes the idle connections; connections still checked out are closed when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
@@ -0,0 +1,101 @@
+"""Database work off the Tk thread.
+
+DatabaseExecutor runs jobs on a small thread pool. A job is a function
+called as job(conn, *args) with a connection checked out of the shared
+ConnectionPool; it is committed when the job returns and rolled back if it
+raises, and a connection that broke is discarded rather than reused.
+Results are queued and handed to the on_done/on_error callbacks by a
+`root.after` poll, so callbacks may touch widgets. submit() also returns the Future for code
+that is not driven by Tk.
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 20
+
+
+def fetchall(conn, query, params=None):
+    """Job returning every row of a query."""
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def fetchone(conn, query, params=None):
+    """Job returning the first row of a query, or None."""
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchone()
+
+
+class DatabaseExecutor:
+    def __init__(self, root, pool, workers=2, on_busy=None, on_error=None):
+        """on_busy(busy) is called on the Tk thread when work starts or all work has finished;
+        on_error(exc) handles failures of jobs submitted without their own error callback."""
+        self.root = root
+        self.pool = pool
+        self.on_busy = on_busy
+        self.on_error = on_error
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._results = queue.Queue()
+        self._pending = 0  # submitted jobs whose callbacks have not run yet, Tk thread only
+        self._busy = 0  # those of them submitted with busy=True
+        self._poll_id = None
+
+    def submit(self, job, *args, on_done=None, on_error=None, with_connection=True, busy=True):
+        """Runs job(conn, *args) on a worker; on_done(result) or on_error(exc) runs on the Tk thread.
+
+        With with_connection=False the job is called as job(*args) and manages connections itself.
+        Background jobs the user did not ask for pass busy=False and leave on_busy alone.
+        """
+        self._pending += 1
+        if busy:
+            self._busy += 1
+            if self._busy == 1 and self.on_busy:
+                self.on_busy(True)
+        if with_connection:
+            future = self._executor.submit(self._run, job, args)
+        else:
+            future = self._executor.submit(job, *args)
+        future.add_done_callback(lambda f: self._results.put((f, on_done, on_error, busy)))
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+        return future
+
+    def _run(self, job, args):
+        with self.pool.connection() as conn:
+            return job(conn, *args)
+
+    def _drain(self):
+        self._poll_id = None
+        while True:
+            try:
+                future, on_done, on_error, busy = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if busy:
+                self._busy -= 1
+                if self._busy == 0 and self.on_busy:
+                    self.on_busy(False)
+            exc = future.exception()
+            try:
+                if exc is not None:
+                    handler = on_error or self.on_error
+                    if handler:
+                        handler(exc)
+                    else:
+                        print(f"Database job failed: {exc}")
+                elif on_done:
+                    on_done(future.result())
+            except Exception as e:
+                print(f"Error in database callback: {e}")
+        if self._pending > 0:
+            self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+
+    def shutdown(self):
+        """Stops the workers; the pool's connections are closed by its owner."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
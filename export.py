@@ -0,0 +1,149 @@
+"""Sales export to CSV for accounting.
+
+The rows are produced by PostgreSQL with `COPY (query) TO STDOUT WITH CSV`
+and written to the file as they arrive, through gzip or zstd when the file
+name ends in .gz or .zst. Nothing is collected in memory: the client holds
+one COPY buffer and the compressor's window, however many rows there are.
+The file is written under a temporary name and only renamed when complete.
+partitions.py archives detached months of sales the same way.
+
+    python export.py sales-2025.csv.gz [--from 2025-01-01] [--to 2025-12-31] [--kind items|sales|history]
+
+`items` (the default) has one row per sale line, `sales` one row per sale,
+and `history` the checkouts of the legacy history table. Both dates are
+inclusive and optional. zstd needs the zstandard package.
+"""
+import argparse
+import gzip
+import os
+import time
+from datetime import datetime
+
+from config import EXPORT_COPY_BUFFER_BYTES, EXPORT_GZIP_LEVEL, EXPORT_ZSTD_LEVEL
+from db import connect
+from history import time_bounds
+
+# Each query takes the lower and upper timestamp bounds; rows come in time order. The bounds
+# are repeated on sale_items so that only the months in range are read from either table.
+EXPORT_QUERIES = {
+    "items": """
+        SELECT s.id AS sale_id, s.sale_timestamp, s.client_ref, si.product_id, p.name AS product,
+               si.options, si.quantity, si.price_at_sale, si.quantity * si.price_at_sale AS line_total
+        FROM sales s
+        JOIN sale_items si ON si.sale_id = s.id AND si.sale_timestamp = s.sale_timestamp
+        JOIN products p ON p.id = si.product_id
+        WHERE s.sale_timestamp >= %(lower)s AND s.sale_timestamp < %(upper)s
+          AND si.sale_timestamp >= %(lower)s AND si.sale_timestamp < %(upper)s
+        ORDER BY s.sale_timestamp, s.id, si.id
+    """,
+    "sales": """
+        SELECT s.id AS sale_id, s.sale_timestamp, s.client_ref, s.total_amount,
+               (SELECT count(*) FROM sale_items si
+                WHERE si.sale_id = s.id AND si.sale_timestamp = s.sale_timestamp) AS lines
+        FROM sales s
+        WHERE s.sale_timestamp >= %(lower)s AND s.sale_timestamp < %(upper)s
+        ORDER BY s.sale_timestamp, s.id
+    """,
+    "history": """
+        SELECT date, items, total
+        FROM history
+        WHERE date >= %(lower)s AND date < %(upper)s
+        ORDER BY date
+    """,
+}
+
+
+class _CountingWriter:
+    """File wrapper handed to copy_expert; counts the CSV bytes before compression."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+
+def _open_compressed(path, f):
+    """Wraps the open binary file `f` in the compressor its name asks for."""
+    if path.endswith(".gz"):
+        return gzip.GzipFile(filename=os.path.basename(path)[:-3], mode="wb", fileobj=f, compresslevel=EXPORT_GZIP_LEVEL)
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Exporting to .zst needs the zstandard package (pip install zstandard).") from None
+        # Compresses on a second thread while the first one receives rows
+        return zstandard.ZstdCompressor(level=EXPORT_ZSTD_LEVEL, threads=1).stream_writer(f)
+    return None
+
+
+def copy_to_file(cur, query, params, path):
+    """Streams the rows of `query` into the CSV file `path`, compressed as its name says.
+
+    The file is written under a temporary name and renamed when complete.
+    Returns (rows, csv_bytes).
+    """
+    tmp_path = f"{path}.part"
+    copy = cur.mogrify(query, params).decode()
+    try:
+        with open(tmp_path, "wb") as f:
+            compressed = _open_compressed(path, f)
+            out = _CountingWriter(f if compressed is None else compressed)
+            cur.copy_expert(f"COPY ({copy}) TO STDOUT WITH (FORMAT csv, HEADER)", out, size=EXPORT_COPY_BUFFER_BYTES)
+            if compressed is not None:
+                compressed.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return cur.rowcount, out.bytes
+
+
+def export_sales(path, kind="items", date_from=None, date_to=None):
+    """Writes the sales of the date range to the CSV file `path`, compressed as its name says.
+
+    Opens its own connection, so a long export does not hold a pooled one.
+    Returns (rows, csv_bytes, seconds).
+    """
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        lower, upper = time_bounds(date_from, date_to)
+        with conn.cursor() as cur:
+            rows, csv_bytes = copy_to_file(cur, EXPORT_QUERIES[kind], {"lower": lower, "upper": upper}, path)
+        conn.rollback()
+    finally:
+        conn.close()
+    return rows, csv_bytes, time.perf_counter() - started
+
+
+def describe(rows, csv_bytes, seconds):
+    """One line about a finished export, for the console and the UI."""
+    return (f"{rows} row(s), {csv_bytes / 1e6:.1f} MB of CSV in {seconds:.1f} s "
+            f"({rows / seconds if seconds else 0:,.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export sales to CSV, optionally gzip or zstd compressed.")
+    parser.add_argument("path", help="output file; a .gz or .zst suffix compresses it")
+    parser.add_argument("--kind", choices=sorted(EXPORT_QUERIES), default="items",
+                        help="items: one row per sale line, sales: one per sale, history: the legacy table")
+    parser.add_argument("--from", dest="date_from", type=lambda text: datetime.strptime(text, "%Y-%m-%d").date(),
+                        help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=lambda text: datetime.strptime(text, "%Y-%m-%d").date(),
+                        help="last day, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    try:
+        rows, csv_bytes, seconds = export_sales(args.path, args.kind, args.date_from, args.date_to)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Exported {describe(rows, csv_bytes, seconds)} to {args.path} "
+          f"({os.path.getsize(args.path) / 1e6:.1f} MB on disk).")
+
+
+if __name__ == "__main__":
+    main()
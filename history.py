@@ -0,0 +1,98 @@
+"""Paged reads of checkout history.
+
+HistoryPager walks sales newest first with keyset pagination: each page
+continues strictly after the (timestamp, id) of the last row already shown,
+so fetching page 100 costs the same as page 1 and nothing is re-sorted or
+skipped with OFFSET. Pages are read through a named (server-side) cursor, so
+only one page is ever buffered on the client. Checkouts saved in the legacy
+history table are merged in by timestamp with a cursor of their own.
+Both walks are served by the timestamp indexes documented in tbt.txt.
+
+The tables are partitioned by month (see partitions.py). Every condition
+on the timestamp is spelled out as a plain comparison with it, including
+the redundant `sale_timestamp <= after` next to the row comparison, so the
+planner skips the months a page cannot reach and reads the rest newest
+month first. A page of recent sales costs the same after years of sales.
+"""
+from datetime import datetime, timedelta
+
+from config import HISTORY_PAGE_SIZE
+
+SALES_PAGE_QUERY = """
+    SELECT 'sale-' || s.id, s.sale_timestamp,
+           (SELECT string_agg(p.name || ' x' || si.quantity || COALESCE(' [' || si.options || ']', ''), '; ' ORDER BY si.id)
+            FROM sale_items si JOIN products p ON p.id = si.product_id
+            WHERE si.sale_id = s.id AND si.sale_timestamp = s.sale_timestamp),
+           s.total_amount, s.id
+    FROM sales s
+    WHERE (s.sale_timestamp, s.id) < (%(after)s, %(after_id)s) AND s.sale_timestamp <= %(after)s
+      AND s.sale_timestamp >= %(lower)s AND s.sale_timestamp < %(upper)s
+    ORDER BY s.sale_timestamp DESC, s.id DESC
+    LIMIT %(limit)s
+"""
+
+# The legacy table has no id; rows sharing a timestamp (always in the same partition) are told
+# apart by ctid, which is stable while nothing rewrites the table, as nothing writes to it any more
+LEGACY_PAGE_QUERY = """
+    SELECT 'history-' || date || '-' || ctid, date, items, total, ctid::text
+    FROM history
+    WHERE (date, ctid) < (%(after)s::timestamp, %(after_ctid)s::tid) AND date <= %(after)s
+      AND date >= %(lower)s AND date < %(upper)s
+    ORDER BY date DESC, ctid DESC
+    LIMIT %(limit)s
+"""
+
+
+def _fetch(conn, name, query, params, page_size):
+    with conn.cursor(name=name) as cur:
+        cur.itersize = page_size
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def time_bounds(date_from=None, date_to=None):
+    """Lower and upper timestamp bounds of inclusive dates; None leaves that end open."""
+    lower = datetime.combine(date_from, datetime.min.time()) if date_from else "-infinity"
+    upper = datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else "infinity"
+    return lower, upper
+
+
+class HistoryPager:
+    def __init__(self, page_size=HISTORY_PAGE_SIZE, date_from=None, date_to=None):
+        """date_from and date_to are inclusive dates; None leaves that end open."""
+        self.page_size = page_size
+        self.date_from = date_from
+        self.date_to = date_to
+        self.lower, self.upper = time_bounds(date_from, date_to)
+        self._sales_after = ("infinity", 0)  # (sale_timestamp, id) of the last sale handed out
+        self._legacy_after = ("infinity", "(0,0)")  # (date, ctid) of the last legacy row handed out
+        self.exhausted = False
+
+    def fetch_next(self, conn):
+        """Database job: the next page as (key, timestamp, items, total) rows, newest first."""
+        if self.exhausted:
+            return []
+        sales = _fetch(
+            conn, "history_sales", SALES_PAGE_QUERY,
+            {"after": self._sales_after[0], "after_id": self._sales_after[1],
+             "lower": self.lower, "upper": self.upper, "limit": self.page_size},
+            self.page_size
+        )
+        legacy = _fetch(
+            conn, "history_legacy", LEGACY_PAGE_QUERY,
+            {"after": self._legacy_after[0], "after_ctid": self._legacy_after[1],
+             "lower": self.lower, "upper": self.upper, "limit": self.page_size},
+            self.page_size
+        )
+
+        # Merge both walks by timestamp (the sort is stable, so ties keep their query order);
+        # rows not used now are read again with the next page
+        page = sorted(sales + legacy, key=lambda row: row[1], reverse=True)[:self.page_size]
+        for row in page:
+            if row[0].startswith("sale-"):
+                self._sales_after = (row[1], row[4])
+            else:
+                self._legacy_after = (row[1], row[4])
+        if len(sales) < self.page_size and len(legacy) < self.page_size and len(page) == len(sales) + len(legacy):
+            self.exhausted = True
+        return [row[:4] for row in page]
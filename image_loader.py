@@ -0,0 +1,94 @@
+"""Background loading of product thumbnails for the menu grid.
+
+Pictures are the pre-rendered variant nearest to the requested size (see
+photo_variants.py), read from the thumbnail cache or fetched from the
+database and decoded on a small thread pool, using connections from the
+shared pool. Nothing is resized here. Finished
+images are queued and handed to their callbacks on the Tk thread by a
+`root.after` poll, since Tk must only be touched from the main thread.
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_variants import load_variant, nearest_variant
+
+POLL_INTERVAL_MS = 30
+
+
+class ImageLoader:
+    def __init__(self, root, thumbnails, pool, workers=4):
+        self.root = root
+        self.thumbnails = thumbnails
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-loader")
+        self._results = queue.Queue()
+        self._generations = {}  # requester -> count bumped by cancel_pending(requester), so its stale results are dropped
+        self._closed = False
+        self._poll_id = None
+        self._pending = 0  # requests whose result has not been drained yet, Tk thread only
+
+    def request(self, product_id, photo_hash, size, callback, requester=None):
+        """Loads one thumbnail in the background; callback(image) runs on the Tk thread.
+
+        Pictures already in memory are handed over at once, so scrolling back
+        to a row does not wait for a worker. `requester` identifies the caller
+        for cancel_pending().
+        """
+        variant = nearest_variant(size).name
+        image = self.thumbnails.peek(photo_hash, variant) if photo_hash else None
+        if image is not None:
+            callback(image)
+            return
+        generation = (requester, self._generations.get(requester, 0))
+        self._pending += 1
+        self._executor.submit(self._load, generation, product_id, photo_hash, variant, callback)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+
+    def cancel_pending(self, requester=None):
+        """Drops the results of the requests `requester` made so far, e.g. for tiles scrolled away.
+
+        Requests of other requesters, such as the customization dialog's
+        picture, are not affected.
+        """
+        self._generations[requester] = self._generations.get(requester, 0) + 1
+
+    def _current(self, generation):
+        requester, count = generation
+        return not self._closed and self._generations.get(requester, 0) == count
+
+    def _load(self, generation, product_id, photo_hash, variant, callback):
+        image = None
+        if self._current(generation):
+            try:
+                image = self.thumbnails.get(photo_hash, variant)
+                if image is None and photo_hash:
+                    with self.pool.connection() as conn:
+                        data = load_variant(conn, photo_hash, variant)
+                    if data is not None:
+                        image = self.thumbnails.put(photo_hash, variant, data)
+            except Exception as e:
+                print(f"Error loading image for product {product_id}: {e}")
+        # Always report back so the Tk side knows when every request has finished
+        self._results.put((generation, callback, image))
+
+    def _drain(self):
+        self._poll_id = None
+        while True:
+            try:
+                generation, callback, image = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if self._current(generation) and image is not None:
+                callback(image)
+        if self._pending > 0:
+            self._poll_id = self.root.after(POLL_INTERVAL_MS, self._drain)
+
+    def shutdown(self):
+        """Stops the workers; the pool's connections are closed by its owner."""
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
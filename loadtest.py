@@ -0,0 +1,244 @@
+"""Load test of the checkout path with simulated terminals.
+
+Every terminal is a thread with its own connection and its own PosCore,
+doing what a cashier does: it fills a cart with a few random products from
+the catalog (with menu options or scanned plain), optionally reserving each
+unit, checks out, and starts the next sale. Its catalog is kept current by
+fetching the products it sold after every sale, standing in for the change
+notifications the app receives. A sampler watches pg_stat_activity for
+terminals waiting on locks.
+
+    python loadtest.py [--terminals 8] [--seconds 30] [--max-lines 4] [--think-ms 0]
+                       [--reservations] [--restock 100000] [--json report.json]
+
+It records real sales, so point config.py at a scratch copy of the
+database. --restock raises every product's stock to at least the given
+amount first, so a long run does not end in a sold-out catalog.
+"""
+import argparse
+import random
+import threading
+import time
+
+import psycopg2
+
+from catalog_sync import fetch_catalog
+from config import DB_NAME, DB_HOST
+from db import connection_params
+from modifiers import load_price_book
+from pos_core import PosCore
+from query_stats import query_stats
+from sales import OutOfStockError
+
+APPLICATION_NAME = "pospy-loadtest"
+SAMPLE_INTERVAL_S = 0.02
+
+
+def connect():
+    # Tagged, so the lock sampler can tell the terminals' connections from everyone else's
+    return psycopg2.connect(**connection_params(), application_name=APPLICATION_NAME)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Terminal(threading.Thread):
+    def __init__(self, number, deadline, max_lines, think_s, use_reservations):
+        super().__init__(name=f"terminal-{number}", daemon=True)
+        self.deadline = deadline
+        self.max_lines = max_lines
+        self.think_s = think_s
+        self.core = PosCore(use_reservations)
+        self.latencies = []  # Seconds per recorded sale, as measured by record_sale
+        self.lines_sold = 0
+        self.refused = 0     # Carts or reservations turned away for lack of stock
+        self.errors = []
+
+    def run(self):
+        conn = connect()
+        try:
+            self.core.catalog.replace(fetch_catalog(conn))
+            self.core.prices = load_price_book(conn)
+            conn.commit()
+            while time.monotonic() < self.deadline:
+                self._fill_cart(conn)
+                if self.core.cart:
+                    self._checkout(conn)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            if self.core.use_reservations and not conn.closed:
+                conn.rollback()
+                self.core.release_all(conn)
+                conn.commit()
+            conn.close()
+
+    def _fill_cart(self, conn):
+        in_stock = self.core.catalog.in_stock()
+        if not in_stock:
+            raise RuntimeError("Every product is sold out; run again with --restock.")
+        for _ in range(random.randint(1, self.max_lines)):
+            if self.think_s:
+                time.sleep(self.think_s)
+            product_id, name, _ = random.choice(in_stock)
+            price = self.core.catalog.products[product_id]["price"]
+            quantity = random.choice((1, 1, 1, 2))
+            # Menu taps come with options, scans without
+            options = random.choice((
+                {}, {group.code: random.choice(group.options)[0] for group in self.core.prices.groups_for(product_id)}
+            ))
+            try:
+                self.core.check_stock(product_id, quantity)
+            except OutOfStockError:
+                self.refused += 1
+                continue
+            if self.core.use_reservations:
+                reserved = self.core.reserve(conn, product_id, quantity)
+                conn.commit()
+                if not reserved:
+                    self.refused += 1
+                    continue
+            self.core.add_checked(product_id, name, price, quantity, **options)
+
+    def _checkout(self, conn):
+        product_ids = {line.product_id for line in self.core.cart}
+        lines = len(self.core.cart)
+        try:
+            _, elapsed = self.core.checkout(conn)
+        except OutOfStockError as e:
+            # Like a cashier adjusting the cart: drop the short products and catch up on stock
+            self.refused += 1
+            short = {product_id for product_id, _, _ in e.shortages}
+            for line in list(self.core.cart):
+                if line.product_id in short:
+                    self.core.remove(line.line_id)
+                    if self.core.use_reservations:
+                        self.core.release(conn, line.product_id, line.quantity)
+                        conn.commit()
+        else:
+            self.latencies.append(elapsed)
+            self.lines_sold += lines
+        self.core.catalog.merge(product_ids, fetch_catalog(conn, product_ids))
+        conn.commit()
+
+
+class LockSampler(threading.Thread):
+    """Counts, every SAMPLE_INTERVAL_S, the terminals waiting for a lock and on what."""
+
+    def __init__(self):
+        super().__init__(name="lock-sampler", daemon=True)
+        self.stop = threading.Event()
+        self.samples = 0
+        self.waiting_samples = 0  # Samples in which at least one terminal waited
+        self.waiter_samples = 0   # Sum of waiting terminals over all samples
+        self.max_waiters = 0
+        self.by_event = {}        # wait_event (transactionid, tuple, relation, ...) -> waiter samples
+
+    def run(self):
+        conn = psycopg2.connect(**connection_params())
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self.stop.wait(SAMPLE_INTERVAL_S):
+                    cur.execute("""
+                        SELECT wait_event, count(*) FROM pg_stat_activity
+                        WHERE application_name = %s AND wait_event_type = 'Lock'
+                        GROUP BY wait_event
+                    """, (APPLICATION_NAME,))
+                    rows = cur.fetchall()
+                    waiters = sum(count for _, count in rows)
+                    self.samples += 1
+                    self.waiting_samples += waiters > 0
+                    self.waiter_samples += waiters
+                    self.max_waiters = max(self.max_waiters, waiters)
+                    for event, count in rows:
+                        self.by_event[event] = self.by_event.get(event, 0) + count
+        finally:
+            conn.close()
+
+
+def deadlock_count():
+    conn = psycopg2.connect(**connection_params())
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def restock(minimum):
+    conn = psycopg2.connect(**connection_params())
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE products SET stock = %s WHERE stock < %s", (minimum, minimum))
+            print(f"Restocked {cur.rowcount} product(s) to {minimum} units.")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated terminals checking out against PostgreSQL.")
+    parser.add_argument("--terminals", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--max-lines", type=int, default=4, help="most products per sale")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause before each item, like a cashier")
+    parser.add_argument("--reservations", action="store_true", help="reserve every unit as it is added")
+    parser.add_argument("--restock", type=int, help="raise every product's stock to at least this first")
+    parser.add_argument("--json", help="also write the per-statement query figures here")
+    args = parser.parse_args()
+
+    if args.restock:
+        restock(args.restock)
+    deadlocks_before = deadlock_count()
+    query_stats.reset()
+
+    deadline = time.monotonic() + args.seconds
+    terminals = [
+        Terminal(number, deadline, args.max_lines, args.think_ms / 1000, args.reservations)
+        for number in range(args.terminals)
+    ]
+    sampler = LockSampler()
+    sampler.start()
+    started = time.perf_counter()
+    for terminal in terminals:
+        terminal.start()
+    for terminal in terminals:
+        terminal.join()
+    elapsed = time.perf_counter() - started
+    sampler.stop.set()
+    sampler.join()
+
+    latencies = sorted(seconds for terminal in terminals for seconds in terminal.latencies)
+    sales = len(latencies)
+    print(f"{args.terminals} terminal(s) for {elapsed:.1f} s against {DB_NAME} on {DB_HOST}"
+          f"{' with reservations' if args.reservations else ''}:")
+    print(f"  sales:     {sales} ({sales / elapsed:.1f}/s), "
+          f"{sum(terminal.lines_sold for terminal in terminals)} lines")
+    print(f"  checkout:  p50 {percentile(latencies, 0.50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+          f"max {(latencies[-1] if latencies else 0) * 1000:.1f} ms")
+    if sampler.samples:
+        events = ", ".join(f"{event} {count}" for event, count in sorted(sampler.by_event.items(), key=lambda item: -item[1]))
+        print(f"  lock waits: in {sampler.waiting_samples * 100 / sampler.samples:.1f}% of {sampler.samples} samples, "
+              f"{sampler.waiter_samples / sampler.samples:.2f} terminal(s) waiting on average, "
+              f"at most {sampler.max_waiters}{f' ({events})' if events else ''}")
+    print(f"  refused:   {sum(terminal.refused for terminal in terminals)} for lack of stock, "
+          f"deadlocks: {deadlock_count() - deadlocks_before}")
+    for terminal in terminals:
+        for e in terminal.errors:
+            print(f"  {terminal.name} stopped: {e}")
+    print("  slowest statements by total time:")
+    for row in query_stats.snapshot()[:5]:
+        print(f"    {row['total_ms']:9.1f} ms  {row['calls']:6} calls  p99 {row['p99_ms']:7.2f} ms  {row['statement'][:70]}")
+    if args.json:
+        query_stats.dump_json(args.json, {"sales": sales, "seconds": elapsed, "terminals": args.terminals})
+        print(f"Query statistics saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Scrollable, virtualized grid of menu tiles.
+
+A MenuGrid draws a product list of any length on a Canvas whose scroll
+region is as tall as the whole grid would be, but it only has tile widgets
+for the rows in view plus MENU_OVERSCAN_ROWS above and below. When the view
+scrolls, tiles that left it are unbound from their product, dropping their
+PhotoImage, and reused for the rows coming into view. The number of
+widgets and images therefore depends on the window size, not on the size of
+the catalog, and so does the time it takes to lay the menu out.
+
+Pictures are requested from the image loader when a tile is bound; a
+result arriving after the tile moved on to another product is dropped.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from PIL import ImageTk
+
+from config import MENU_OVERSCAN_ROWS
+from thumbcache import MENU_THUMB_SIZE
+
+CELL_WIDTH = 210   # Pixels per column, gaps included
+CELL_HEIGHT = 250  # Pixels per row, gaps included
+GAP = 10           # Space around each tile inside its cell
+SCROLL_STEP = CELL_HEIGHT // 5  # Pixels per mouse wheel notch
+
+
+class _Tile:
+    def __init__(self, grid):
+        self.frame = ttk.Frame(grid.canvas, padding=10)
+        self.picture = ttk.Label(self.frame, image=grid.placeholder)
+        self.picture.pack()
+        self.name = ttk.Label(self.frame, anchor="center", wraplength=CELL_WIDTH - 4 * GAP)
+        self.name.pack(fill=tk.X)
+        self.button = ttk.Button(self.frame, text="Select", command=lambda: grid.on_select(self.product_id))
+        self.button.pack(pady=8)
+        for widget in (self.frame, self.picture, self.name, self.button):
+            grid.bind_wheel(widget)
+        self.window = grid.canvas.create_window(
+            0, 0, window=self.frame, anchor="nw",
+            width=CELL_WIDTH - 2 * GAP, height=CELL_HEIGHT - 2 * GAP, state="hidden"
+        )
+        self.product = None  # (product_id, name, photo_hash) shown, None while spare
+        self.photo = None    # PhotoImage shown, released when the tile is unbound
+
+    @property
+    def product_id(self):
+        return self.product[0] if self.product else None
+
+
+class MenuGrid:
+    def __init__(self, parent, image_loader, placeholder, on_select, overscan_rows=MENU_OVERSCAN_ROWS):
+        """on_select(product_id) runs when a tile's button is pressed."""
+        self.image_loader = image_loader
+        self.placeholder = placeholder
+        self.on_select = on_select
+        self.overscan_rows = overscan_rows
+        self.products = []  # (product_id, name, photo_hash) in display order
+        self.columns = 1
+        self._tiles = {}   # product index -> bound tile
+        self._spare = []   # unbound tiles, hidden
+        self._layout_id = None
+
+        self.frame = ttk.Frame(parent)
+        self.canvas = tk.Canvas(
+            self.frame, highlightthickness=0, background=ttk.Style().lookup("TFrame", "background"),
+            yscrollincrement=1
+        )
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._scrolled)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._empty = self.canvas.create_text(
+            0, 30, text="No products found.", font=("Arial", 16), anchor="n",
+            fill=ttk.Style().lookup("TLabel", "foreground"), state="hidden"
+        )
+        self.canvas.bind("<Configure>", self._resized)
+        self.bind_wheel(self.canvas)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def bind_wheel(self, widget):
+        """Makes the mouse wheel scroll the grid while the pointer is over `widget`."""
+        widget.bind("<MouseWheel>", self._wheel)  # Windows and macOS
+        widget.bind("<Button-4>", self._wheel)    # X11
+        widget.bind("<Button-5>", self._wheel)
+
+    def _wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-SCROLL_STEP, "units")
+        else:
+            self.canvas.yview_scroll(SCROLL_STEP, "units")
+        return "break"
+
+    def set_products(self, products):
+        """Shows `products` in order, keeping the scroll position; only tiles whose product changed are redrawn."""
+        self.products = list(products)
+        for index, tile in list(self._tiles.items()):
+            if index >= len(self.products) or self.products[index] != tile.product:
+                self._unbind(index)
+        self.canvas.itemconfigure(self._empty, state="hidden" if self.products else "normal")
+        self._update_scroll_region()
+        self._schedule_layout()
+
+    def _resized(self, event):
+        columns = max(1, event.width // CELL_WIDTH)
+        if columns != self.columns:
+            # Every product moves to another cell
+            self.columns = columns
+            for index in list(self._tiles):
+                self._unbind(index)
+        else:
+            for index, tile in self._tiles.items():
+                self._place(index, tile, event.width)
+        self.canvas.coords(self._empty, event.width // 2, 30)
+        self._update_scroll_region()
+        self._schedule_layout()
+
+    def _update_scroll_region(self):
+        rows = -(-len(self.products) // self.columns)
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), rows * CELL_HEIGHT))
+
+    def _scrolled(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_layout()
+
+    def _schedule_layout(self):
+        # Scrolling reports every step; the tiles are moved once per idle turn
+        if self._layout_id is None:
+            self._layout_id = self.canvas.after_idle(self._layout)
+
+    def _layout(self):
+        self._layout_id = None
+        if not self.canvas.winfo_exists():
+            return
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // CELL_HEIGHT) - self.overscan_rows)
+        last_row = int((top + self.canvas.winfo_height()) // CELL_HEIGHT) + self.overscan_rows
+        wanted = range(first_row * self.columns, min(len(self.products), (last_row + 1) * self.columns))
+
+        gone = [index for index in self._tiles if index not in wanted]
+        for index in gone:
+            self._unbind(index)
+        if gone:
+            # Pictures still queued for tiles that scrolled away are not worth loading; only the
+            # grid's own requests are dropped, not those of other users of the shared loader
+            self.image_loader.cancel_pending(self)
+            for tile in self._tiles.values():
+                if tile.photo is None:
+                    self._request_picture(tile)
+
+        width = self.canvas.winfo_width()
+        for index in wanted:
+            if index in self._tiles:
+                continue
+            tile = self._spare.pop() if self._spare else _Tile(self)
+            self._place(index, tile, width)
+            self._bind(index, tile)
+
+    def _place(self, index, tile, width):
+        """Moves a tile to the cell of product `index`, with the grid centered in `width`."""
+        left = max(0, (width - self.columns * CELL_WIDTH) // 2)
+        row, column = divmod(index, self.columns)
+        self.canvas.coords(tile.window, left + column * CELL_WIDTH + GAP, row * CELL_HEIGHT + GAP)
+
+    def _bind(self, index, tile):
+        tile.product = self.products[index]
+        tile.name.configure(text=tile.product[1])
+        self.canvas.itemconfigure(tile.window, state="normal")
+        self._tiles[index] = tile
+        self._request_picture(tile)
+
+    def _unbind(self, index):
+        tile = self._tiles.pop(index)
+        tile.product = None
+        tile.photo = None
+        tile.picture.configure(image=self.placeholder)
+        self.canvas.itemconfigure(tile.window, state="hidden")
+        self._spare.append(tile)
+
+    def _request_picture(self, tile):
+        product = tile.product
+        if not product[2]:
+            return  # No picture; the placeholder stays
+        self.image_loader.request(
+            product[0], product[2], MENU_THUMB_SIZE,
+            lambda image: self._show_picture(tile, product, image), requester=self
+        )
+
+    def _show_picture(self, tile, product, image):
+        """Swaps a tile's placeholder for its loaded picture, unless the tile moved on meanwhile."""
+        if tile.product != product or not tile.picture.winfo_exists():
+            return
+        tile.photo = ImageTk.PhotoImage(image)
+        tile.picture.configure(image=tile.photo)
+
+    def tile_count(self):
+        """Tile widgets in existence, bound or spare."""
+        return len(self._tiles) + len(self._spare)
@@ -0,0 +1,202 @@
+"""Product modifiers and their prices.
+
+The choices of the customization dialog are data: modifier_groups holds the
+option groups, modifiers the options of each group with the amount they
+add to (or take off) a product's price, and product_modifier_groups the
+products a group is offered for when it is not offered for all of them.
+Install the tables with their default contents and the change trigger with
+`python modifiers.py --install` (the same SQL is in tbt.txt).
+
+Every terminal loads the tables once into a PriceBook, a compiled form that
+answers "which groups does this product offer" and "what does this
+combination of options add" with dictionary lookups. The cart therefore
+prices a line once, when it is added, and keeps its total up to date per
+change. A change to any modifier table announces a full catalog reload, so
+terminals load the new PriceBook along with the catalog.
+
+The cart stores a line's options in fixed fields, so group codes are the
+names of those fields (GROUP_CODES); rows with other codes are skipped.
+"""
+import argparse
+from collections import namedtuple
+from decimal import Decimal
+
+from db import connect
+
+GROUP_CODES = ("size", "state", "sugar")  # The option fields of a cart line, see cart.py
+
+# A group as the dialog shows it: options are (name, price delta) in display order
+ModifierGroup = namedtuple("ModifierGroup", "code label options default")
+
+# The groups a new installation starts with, and what terminals use without the tables.
+# No option changes the price, as before modifiers were priced; a shop sets its own deltas.
+DEFAULT_GROUPS = (
+    ModifierGroup("size", "Size", (("Small", Decimal("0.00")), ("Medium", Decimal("0.00")), ("Large", Decimal("0.00"))), "Medium"),
+    ModifierGroup("state", "State", (("Hot", Decimal("0.00")), ("Cold", Decimal("0.00"))), "Hot"),
+    ModifierGroup("sugar", "Sugar", (("No Sugar", Decimal("0.00")), ("Less", Decimal("0.00")),
+                                     ("Normal", Decimal("0.00")), ("Extra", Decimal("0.00"))), "Normal"),
+)
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS modifier_groups (
+    code TEXT PRIMARY KEY,  -- the cart line field it fills: size, state or sugar
+    label TEXT NOT NULL,
+    position INT NOT NULL DEFAULT 0,
+    all_products BOOLEAN NOT NULL DEFAULT TRUE  -- else only for the products in product_modifier_groups
+);
+CREATE TABLE IF NOT EXISTS modifiers (
+    group_code TEXT NOT NULL REFERENCES modifier_groups(code) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    price_delta NUMERIC(10, 2) NOT NULL DEFAULT 0,
+    position INT NOT NULL DEFAULT 0,
+    is_default BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (group_code, name)
+);
+CREATE TABLE IF NOT EXISTS product_modifier_groups (
+    product_id INT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    group_code TEXT NOT NULL REFERENCES modifier_groups(code) ON DELETE CASCADE,
+    PRIMARY KEY (product_id, group_code)
+);
+
+CREATE OR REPLACE FUNCTION notify_modifiers_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    -- Prices of every product may have changed; terminals reload the catalog and modifiers
+    PERFORM pg_notify('products_changed', 'modifiers:*');
+    RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS modifier_groups_notify ON modifier_groups;
+CREATE TRIGGER modifier_groups_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON modifier_groups
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_modifiers_changed();
+DROP TRIGGER IF EXISTS modifiers_notify ON modifiers;
+CREATE TRIGGER modifiers_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON modifiers
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_modifiers_changed();
+DROP TRIGGER IF EXISTS product_modifier_groups_notify ON product_modifier_groups;
+CREATE TRIGGER product_modifier_groups_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product_modifier_groups
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_modifiers_changed();
+"""
+
+
+class PriceBook:
+    def __init__(self, groups=DEFAULT_GROUPS, restricted=()):
+        """`groups` in display order; `restricted` maps codes of groups not offered for all products to product ids."""
+        self.groups = tuple(group for group in groups if group.code in GROUP_CODES)
+        self._deltas = {group.code: dict(group.options) for group in self.groups}
+        restricted = {code: set(product_ids) for code, product_ids in dict(restricted).items()}
+        self._general = tuple(group for group in self.groups if group.code not in restricted)
+        self._by_product = {}  # product_id -> groups offered, for products with restricted groups
+        for product_id in set().union(*restricted.values()):
+            self._by_product[product_id] = tuple(
+                group for group in self.groups
+                if group.code not in restricted or product_id in restricted[group.code]
+            )
+        self._combinations = {}  # (size, state, sugar) -> total delta, filled as combinations are priced
+
+    def groups_for(self, product_id):
+        """The groups offered for a product, in display order."""
+        return self._by_product.get(product_id, self._general)
+
+    def defaults(self, product_id):
+        """{code: default option} of the groups offered for a product."""
+        return {group.code: group.default for group in self.groups_for(product_id)}
+
+    def delta(self, size=None, state=None, sugar=None):
+        """What a combination of options adds to a price; raises ValueError for an unknown option."""
+        key = (size, state, sugar)
+        total = self._combinations.get(key)
+        if total is None:
+            total = Decimal("0.00")
+            for code, option in zip(GROUP_CODES, key):
+                if option is None:
+                    continue
+                try:
+                    total += self._deltas[code][option]
+                except KeyError:
+                    raise ValueError(f"Unknown {code} option: {option}") from None
+            self._combinations[key] = total
+        return total
+
+    def unit_price(self, base_price, size=None, state=None, sugar=None):
+        """The price of one unit of a product with the given options; never below zero."""
+        return max(base_price + self.delta(size, state, sugar), Decimal("0.00"))
+
+
+def load_price_book(conn):
+    """Database job: the PriceBook of the modifier tables, or of DEFAULT_GROUPS if they are not installed."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('product_modifier_groups') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return PriceBook()
+        cur.execute("""
+            SELECT g.code, g.label, g.all_products, m.name, m.price_delta, m.is_default
+            FROM modifier_groups g JOIN modifiers m ON m.group_code = g.code
+            ORDER BY g.position, g.code, m.position, m.name
+        """)
+        rows = cur.fetchall()
+        cur.execute("SELECT group_code, product_id FROM product_modifier_groups")
+        offered = cur.fetchall()
+
+    groups = []
+    restricted = {}
+    skipped = set()
+    for code, label, all_products, name, price_delta, is_default in rows:
+        if code not in GROUP_CODES:
+            if code not in skipped:
+                print(f"Skipping modifier group '{code}': the cart has no field for it.")
+                skipped.add(code)
+            continue
+        if not groups or groups[-1].code != code:
+            groups.append(ModifierGroup(code, label, (), None))
+            if not all_products:
+                restricted[code] = set()
+        group = groups[-1]
+        default = name if is_default and group.default is None else group.default
+        groups[-1] = group._replace(options=group.options + ((name, price_delta),), default=default)
+    # A group without a marked default starts at its first option
+    groups = [group if group.default else group._replace(default=group.options[0][0]) for group in groups]
+    for code, product_id in offered:
+        if code in restricted:
+            restricted[code].add(product_id)
+    return PriceBook(groups, restricted)
+
+
+def install(cur):
+    """Creates the modifier tables and their trigger, and fills empty tables with DEFAULT_GROUPS."""
+    cur.execute(SCHEMA_SQL)
+    cur.execute("SELECT EXISTS (SELECT 1 FROM modifier_groups)")
+    if cur.fetchone()[0]:
+        return
+    for position, group in enumerate(DEFAULT_GROUPS):
+        cur.execute(
+            "INSERT INTO modifier_groups (code, label, position) VALUES (%s, %s, %s)",
+            (group.code, group.label, position)
+        )
+        for option_position, (name, price_delta) in enumerate(group.options):
+            cur.execute(
+                "INSERT INTO modifiers (group_code, name, price_delta, position, is_default) VALUES (%s, %s, %s, %s, %s)",
+                (group.code, name, price_delta, option_position, name == group.default)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product modifiers (size, state, sugar) and their prices.")
+    parser.add_argument("--install", action="store_true", help="create the modifier tables and fill in the defaults")
+    args = parser.parse_args()
+    if not args.install:
+        parser.print_help()
+        return
+
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            install(cur)
+        conn.commit()
+        book = load_price_book(conn)
+    finally:
+        conn.close()
+    for group in book.groups:
+        options = ", ".join(f"{name} {delta:+.2f}" for name, delta in group.options)
+        print(f"{group.label}: {options} (default {group.default})")
+
+
+if __name__ == "__main__":
+    main()
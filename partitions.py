@@ -0,0 +1,314 @@
+"""Monthly partitions of sales, sale_items and the legacy history table.
+
+The three tables are partitioned by month on their timestamp (declarative
+RANGE partitioning, one table per month named like sales_2026_10). Queries
+that bound the timestamp, which are every history page, export and rollup
+rebuild, only read the months in range. The newest-first history walk reads
+the newest month's index first. Their cost therefore depends on the months
+asked for, not on how many years are stored. sale_items carries the
+timestamp of its sale, so its lines are in the same month as the sale and
+the two are joined month by month.
+
+A sale can only be written once the partition of its month exists. The
+terminal creates the current and the next PARTITION_MONTHS_AHEAD months at
+startup, and so does maintenance, which also takes months older than
+PARTITION_KEEP_MONTHS out of the tables:
+
+    python partitions.py --migrate     # once, to partition the tables of an existing database
+    python partitions.py --maintain [--archive DIR | --drop]
+
+A month taken out is detached, not deleted. It stays in the database as a
+plain table such as sales_2023_01 until it is archived to DIR (one gzip CSV
+per table, then dropped) or dropped. Reports read the rollups, which keep
+the totals of detached months (see rollups.py). The DDL is also in tbt.txt.
+"""
+import argparse
+import os
+from datetime import date, datetime
+
+from config import PARTITION_KEEP_MONTHS, PARTITION_MONTHS_AHEAD
+from db import connect
+from export import copy_to_file
+
+# (table, partition key) in creation order; months are detached in reverse, lines before their sales
+PARTITIONED = (("sales", "sale_timestamp"), ("sale_items", "sale_timestamp"), ("history", "date"))
+
+SCHEMA_SQL = """
+CREATE SEQUENCE IF NOT EXISTS sales_id_seq;
+CREATE SEQUENCE IF NOT EXISTS sale_items_id_seq;
+CREATE TABLE sales (
+    id INT NOT NULL DEFAULT nextval('sales_id_seq'),
+    sale_timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    total_amount DECIMAL(10, 2) NOT NULL,
+    client_ref UUID,
+    PRIMARY KEY (id, sale_timestamp),
+    UNIQUE (client_ref, sale_timestamp)  -- Journal replays keep the original timestamp, see sales.write_sale
+) PARTITION BY RANGE (sale_timestamp);
+CREATE TABLE sale_items (
+    id INT NOT NULL DEFAULT nextval('sale_items_id_seq'),
+    sale_id INT NOT NULL,
+    sale_timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,  -- The sale's, so a line is in its sale's month
+    product_id INT NOT NULL REFERENCES products(id) ON DELETE RESTRICT,
+    quantity INT NOT NULL,
+    price_at_sale DECIMAL(10, 2) NOT NULL,
+    options TEXT,
+    PRIMARY KEY (id, sale_timestamp),
+    FOREIGN KEY (sale_id, sale_timestamp) REFERENCES sales (id, sale_timestamp) ON DELETE CASCADE
+) PARTITION BY RANGE (sale_timestamp);
+CREATE TABLE history (
+    date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    items TEXT,
+    total NUMERIC(10, 2)
+) PARTITION BY RANGE (date);
+ALTER SEQUENCE sales_id_seq OWNED BY sales.id;
+ALTER SEQUENCE sale_items_id_seq OWNED BY sale_items.id;
+CREATE INDEX sales_sale_timestamp_idx ON sales (sale_timestamp DESC, id DESC);
+CREATE INDEX sale_items_sale_id_idx ON sale_items (sale_id);
+CREATE INDEX history_date_idx ON history (date DESC);
+"""
+
+
+def add_months(month, count):
+    """The first day of the month `count` months after `month` (before it if negative)."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(moment):
+    """The first day of the month of a date or timestamp."""
+    return date(moment.year, moment.month, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def attached_months(cur, table):
+    """{month: partition name} of the partitions attached to `table`, from their names."""
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+        (table,)
+    )
+    months = {}
+    for (name,) in cur.fetchall():
+        try:
+            months[datetime.strptime(name[len(table) + 1:], "%Y_%m").date()] = name
+        except ValueError:
+            print(f"Ignoring partition {name} of {table}: its name is not {table}_YYYY_MM.")
+    return months
+
+
+def oldest_month(cur, table):
+    """The first month still attached to `table`, or None if it is not partitioned or has no partitions."""
+    if not is_partitioned(cur, table):
+        return None
+    return min(attached_months(cur, table), default=None)
+
+
+def ensure_partitions(cur, months_ahead=PARTITION_MONTHS_AHEAD, first_month=None, last_month=None):
+    """Creates the missing monthly partitions from `first_month` (default: this month) to `months_ahead` ahead.
+
+    `last_month` extends the range further if it is later. Tables that are
+    not partitioned yet are left alone. Returns the names of the partitions
+    created.
+    """
+    this_month = month_of(date.today())
+    last = max(add_months(this_month, months_ahead), last_month or this_month)
+    created = []
+    for table, _ in PARTITIONED:
+        if not is_partitioned(cur, table):
+            continue
+        existing = attached_months(cur, table)
+        month = first_month or this_month
+        while month <= last:
+            if month not in existing:
+                name = partition_name(table, month)
+                # Only missing months are created: attaching one locks the whole table
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                    (month.isoformat(), add_months(month, 1).isoformat())
+                )
+                created.append(name)
+            month = add_months(month, 1)
+    return created
+
+
+def create_upcoming(conn):
+    """Database job run by the terminal at startup: creates the partitions of the coming months."""
+    with conn.cursor() as cur:
+        if not is_partitioned(cur, "sales"):
+            print("The sales tables are not partitioned yet; run `python partitions.py --migrate`.")
+            return []
+        return ensure_partitions(cur)
+
+
+def migrate(conn):
+    """Replaces unpartitioned sales, sale_items and history by partitioned tables with the same rows.
+
+    Runs in one transaction that locks the tables, so run it while the
+    terminals are closed. Ids and their sequences are kept. Returns False if
+    sales is already partitioned.
+    """
+    with conn.cursor() as cur:
+        if is_partitioned(cur, "sales"):
+            return False
+        cur.execute("SELECT to_regclass('history') IS NOT NULL")
+        has_history = cur.fetchone()[0]
+        old_tables = ["sales", "sale_items"] + (["history"] if has_history else [])
+        cur.execute(f"LOCK TABLE {', '.join(old_tables)} IN ACCESS EXCLUSIVE MODE")
+
+        cur.execute("SELECT count(*) FROM sales WHERE sale_timestamp IS NULL")
+        undated = cur.fetchone()[0]
+        if has_history:
+            cur.execute("SELECT count(*) FROM history WHERE date IS NULL")
+            undated += cur.fetchone()[0]
+        if undated:
+            raise RuntimeError(f"{undated} sale(s) or history row(s) have no timestamp and fit no month; "
+                               "give them one before migrating.")
+        # Rows dated after the months kept ahead, e.g. by a wrong terminal clock, get their months too
+        cur.execute("SELECT min(sale_timestamp), max(sale_timestamp) FROM sales")
+        bounds = list(cur.fetchone())
+        if has_history:
+            cur.execute("SELECT min(date), max(date) FROM history")
+            bounds += cur.fetchone()
+        moments = [moment for moment in bounds if moment is not None]
+        first, last = (min(moments), max(moments)) if moments else (None, None)
+
+        # The old tables and their indexes step aside, so the new ones take over their names
+        for table in old_tables:
+            cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+                        (table,))
+            for (index,) in cur.fetchall():
+                cur.execute(f"ALTER INDEX {index} RENAME TO {index}_unpartitioned")
+            cur.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+
+        cur.execute(SCHEMA_SQL)
+        ensure_partitions(cur, first_month=month_of(first) if first else None,
+                          last_month=month_of(last) if last else None)
+        cur.execute("""
+            INSERT INTO sales (id, sale_timestamp, total_amount, client_ref)
+            SELECT id, sale_timestamp, total_amount, client_ref FROM sales_unpartitioned
+        """)
+        print(f"Copied {cur.rowcount} sale(s).")
+        cur.execute("""
+            INSERT INTO sale_items (id, sale_id, sale_timestamp, product_id, quantity, price_at_sale, options)
+            SELECT si.id, si.sale_id, s.sale_timestamp, si.product_id, si.quantity, si.price_at_sale, si.options
+            FROM sale_items_unpartitioned si JOIN sales_unpartitioned s ON s.id = si.sale_id
+        """)
+        print(f"Copied {cur.rowcount} sale line(s).")
+        if has_history:
+            cur.execute("INSERT INTO history (date, items, total) SELECT date, items, total FROM history_unpartitioned")
+            print(f"Copied {cur.rowcount} history row(s).")
+        cur.execute(f"DROP TABLE {', '.join(f'{table}_unpartitioned' for table in old_tables)}")
+    conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE sales, sale_items, history")
+    conn.commit()
+    return True
+
+
+def detach_old(conn, keep_months=PARTITION_KEEP_MONTHS):
+    """Detaches the months before the last `keep_months` (this one included) from every partitioned table.
+
+    Each month is detached in its own short transaction. Returns the names
+    of the detached tables.
+    """
+    cutoff = add_months(month_of(date.today()), 1 - keep_months)
+    detached = []
+    with conn.cursor() as cur:
+        old = {}
+        for table, _ in PARTITIONED:
+            if is_partitioned(cur, table):
+                old[table] = {month: name for month, name in attached_months(cur, table).items() if month < cutoff}
+    conn.commit()
+
+    for month in sorted(set().union(*old.values())):
+        with conn.cursor() as cur:
+            for table, _ in reversed(PARTITIONED):
+                name = old.get(table, {}).get(month)
+                if name is None:
+                    continue
+                cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                if table == "sale_items":
+                    # A detached month of lines would still point at sales and keep its month attached
+                    cur.execute("""
+                        SELECT conname FROM pg_constraint
+                        WHERE conrelid = to_regclass(%s) AND contype = 'f' AND confrelid = 'sales'::regclass
+                    """, (name,))
+                    for (constraint,) in cur.fetchall():
+                        cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {constraint}")
+                detached.append(name)
+        conn.commit()
+        print(f"Detached {month:%Y-%m}.")
+    return detached
+
+
+def archive(conn, names, directory):
+    """Writes each detached table to `directory` as <name>.csv.gz, then drops it."""
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        path = os.path.join(directory, f"{name}.csv.gz")
+        with conn.cursor() as cur:
+            rows, _ = copy_to_file(cur, f"SELECT * FROM {name}", None, path)
+            cur.execute(f"DROP TABLE {name}")
+        conn.commit()
+        print(f"Archived {rows} row(s) of {name} to {path}.")
+
+
+def drop(conn, names):
+    with conn.cursor() as cur:
+        for name in names:
+            cur.execute(f"DROP TABLE {name}")
+    conn.commit()
+    print(f"Dropped {len(names)} detached table(s).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monthly partitions of sales, sale_items and history.")
+    parser.add_argument("--migrate", action="store_true", help="partition the tables of an existing database, once")
+    parser.add_argument("--maintain", action="store_true",
+                        help="create the coming months and detach the months older than --keep-months")
+    parser.add_argument("--keep-months", type=int, default=PARTITION_KEEP_MONTHS,
+                        help="months kept attached, this one included; 0 keeps them all")
+    parser.add_argument("--archive", metavar="DIR", help="write detached months to DIR as gzip CSV, then drop them")
+    parser.add_argument("--drop", action="store_true", help="drop detached months without archiving them")
+    args = parser.parse_args()
+    if not (args.migrate or args.maintain):
+        parser.print_help()
+        return
+    if args.archive and args.drop:
+        parser.error("--archive and --drop exclude each other.")
+
+    conn = connect()
+    try:
+        if args.migrate:
+            try:
+                if not migrate(conn):
+                    print("sales is already partitioned.")
+            except RuntimeError as e:
+                parser.exit(1, f"{e}\n")
+        if args.maintain:
+            with conn.cursor() as cur:
+                if not is_partitioned(cur, "sales"):
+                    parser.exit(1, "The sales tables are not partitioned yet; run with --migrate first.\n")
+                created = ensure_partitions(cur)
+            conn.commit()
+            print(f"Created {len(created)} partition(s){': ' + ', '.join(created) if created else ''}.")
+            detached = detach_old(conn, args.keep_months) if args.keep_months else []
+            if detached and args.archive:
+                archive(conn, detached, args.archive)
+            elif detached and args.drop:
+                drop(conn, detached)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Product photos in a content-addressed table.
+
+Photos live in product_photos, one row per distinct image keyed by the
+SHA-256 of its bytes. products only carries photo_hash. The hot products
+rows, which every checkout updates and every catalog read scans, stay a
+few dozen bytes; SELECT *, vacuum and backups of products no longer drag
+image data along; and products sharing a picture share one stored copy.
+
+Databases created before the photo store keep their pictures inline in
+products.photo. Move them over with
+
+    python photo_store.py --migrate [--batch-size 50]
+
+which copies them batch by batch and clears products.photo as it goes, so
+terminals keep selling while it runs. Once every terminal runs this
+version, `--drop-column` removes the empty column, and `--gc` deletes
+stored photos no product refers to any more.
+
+Photos stored with store_photos() also get their display variants rendered
+(see photo_variants.py). Migrated photos get them on first use, or all at
+once with `python photo_variants.py --regenerate`.
+"""
+import argparse
+import hashlib
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import connect
+from photo_variants import ensure_variant_schema, render_many, store_variants
+
+MIGRATE_BATCH_SIZE = 50  # Rows copied per transaction; photos are up to a few hundred KB each
+
+
+def photo_hash(photo_bytes):
+    """The key a photo is stored under: the hex SHA-256 of its bytes."""
+    return hashlib.sha256(photo_bytes).hexdigest()
+
+
+def ensure_photo_schema(cur):
+    """Creates product_photos if it does not exist yet (see also tbt.txt)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_photos (
+            hash TEXT PRIMARY KEY,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # PNG and JPEG are already compressed; storing them out of line without another
+    # compression pass saves CPU on every write and read
+    cur.execute("ALTER TABLE product_photos ALTER COLUMN data SET STORAGE EXTERNAL")
+    cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS photo_hash TEXT")
+    ensure_variant_schema(cur)
+
+
+def store_photos(cur, photos):
+    """Stores photo bytes that are not stored yet, with their variants, in the caller's transaction.
+
+    Returns their hashes in order.
+    """
+    hashes = [photo_hash(photo_bytes) for photo_bytes in photos]
+    distinct = dict(zip(hashes, photos))
+    if distinct:
+        inserted = execute_values(
+            cur,
+            "INSERT INTO product_photos (hash, data) VALUES %s ON CONFLICT (hash) DO NOTHING RETURNING hash",
+            [(key, psycopg2.Binary(photo_bytes)) for key, photo_bytes in distinct.items()],
+            page_size=len(distinct),
+            fetch=True
+        )
+        # Rendered at ingest, so terminals only ever decode a picture of the size they show
+        store_variants(cur, render_many((key, distinct[key]) for key, in inserted))
+    return hashes
+
+
+def _has_inline_photos(cur):
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'products' AND column_name = 'photo'
+    """)
+    return cur.fetchone() is not None
+
+
+def migrate(conn, batch_size=MIGRATE_BATCH_SIZE):
+    """Moves inline products.photo values into product_photos; returns (products moved, photos stored)."""
+    with conn.cursor() as cur:
+        ensure_photo_schema(cur)
+        inline = _has_inline_photos(cur)
+    conn.commit()
+    if not inline:
+        return 0, 0
+
+    moved = stored = 0
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            # Each batch locks only its own rows, so checkouts of other products carry on
+            cur.execute("""
+                SELECT id FROM products WHERE id > %s AND photo IS NOT NULL
+                ORDER BY id LIMIT %s FOR UPDATE
+            """, (last_id, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            cur.execute("""
+                INSERT INTO product_photos (hash, data)
+                SELECT encode(sha256(photo), 'hex'), photo FROM products WHERE id = ANY(%s)
+                ON CONFLICT (hash) DO NOTHING
+            """, (ids,))
+            stored += cur.rowcount
+            cur.execute("""
+                UPDATE products SET photo_hash = encode(sha256(photo), 'hex'), photo = NULL
+                WHERE id = ANY(%s)
+            """, (ids,))
+            moved += cur.rowcount
+        conn.commit()
+        last_id = ids[-1]
+        print(f"Moved photos of {moved} product(s), {stored} distinct so far")
+    return moved, stored
+
+
+def drop_inline_column(conn):
+    """Drops products.photo once it is empty; returns False if photos are still waiting to move."""
+    with conn.cursor() as cur:
+        if not _has_inline_photos(cur):
+            return True
+        cur.execute("SELECT count(*) FROM products WHERE photo IS NOT NULL")
+        if cur.fetchone()[0]:
+            conn.rollback()
+            return False
+        cur.execute("ALTER TABLE products DROP COLUMN photo")
+    conn.commit()
+    return True
+
+
+def delete_unused(conn):
+    """Deletes stored photos that no product refers to; returns how many."""
+    with conn.cursor() as cur:
+        # Waits for seeding transactions that may point products at a photo being deleted
+        cur.execute("LOCK TABLE product_photos IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("""
+            DELETE FROM product_photos ph
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.photo_hash = ph.hash)
+        """)
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed product photo store.")
+    parser.add_argument("--migrate", action="store_true", help="move inline products.photo values into the store")
+    parser.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE, help="products moved per transaction")
+    parser.add_argument("--drop-column", action="store_true", help="drop the emptied products.photo column")
+    parser.add_argument("--gc", action="store_true", help="delete stored photos no product uses")
+    args = parser.parse_args()
+    if not (args.migrate or args.drop_column or args.gc):
+        parser.print_help()
+        return
+
+    conn = connect()
+    try:
+        if args.migrate:
+            moved, stored = migrate(conn, args.batch_size)
+            print(f"Migration done: {moved} product(s) moved, {stored} photo(s) stored.")
+            if stored:
+                print("Run `python photo_variants.py --regenerate` to render their variants now.")
+        if args.drop_column:
+            if drop_inline_column(conn):
+                print("products.photo is gone; run VACUUM products to reclaim the space.")
+            else:
+                print("Some products still have inline photos; run --migrate first.")
+        if args.gc:
+            print(f"Deleted {delete_unused(conn)} unused photo(s).")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
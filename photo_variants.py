@@ -0,0 +1,207 @@
+"""Pre-rendered picture variants.
+
+Every stored photo is rendered once, when it is stored, into the fixed
+VARIANTS: a menu tile, a larger popup picture, and a grayscale receipt
+picture for printing. Variants are encoded compactly (WebP for the screen,
+optimized grayscale PNG for the printer) and kept in photo_variants next to
+the originals, keyed by (photo hash, variant). The UI asks for the variant
+nearest to the size it displays (nearest_variant()) and only decodes it; it
+never resizes an original. A variant that is missing, e.g. for photos
+stored before variants existed or after VARIANTS changed, is rendered on
+first use off the Tk thread and stored for every terminal.
+
+Rendering many photos at once (seeding, `python photo_variants.py
+--regenerate`) uses a process pool, so it is not held back by the GIL.
+"""
+import argparse
+import io
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+from PIL import Image, ImageOps, features
+from psycopg2.extras import execute_values
+
+from config import VARIANT_RENDER_WORKERS
+from db import connect
+
+# mode: PIL mode rendered to (screen variants keep transparency); fit: "crop" fills the box,
+# "contain" fits inside it; screen: offered to the UI by nearest_variant()
+Variant = namedtuple("Variant", "name size mode fit format screen")
+
+_SCREEN_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+VARIANTS = (
+    Variant("tile", (130, 130), "RGB", "crop", _SCREEN_FORMAT, True),
+    Variant("popup", (260, 260), "RGB", "crop", _SCREEN_FORMAT, True),
+    # 384 dots is the printable width of a 58 mm thermal receipt printer
+    Variant("receipt", (384, 384), "L", "contain", "PNG", False),
+)
+VARIANTS_BY_NAME = {variant.name: variant for variant in VARIANTS}
+REGENERATE_BATCH = 32  # Originals rendered and stored per transaction
+
+
+def nearest_variant(size):
+    """The smallest screen variant at least as large as `size`, else the largest one."""
+    screen = sorted((variant for variant in VARIANTS if variant.screen), key=lambda variant: variant.size)
+    for variant in screen:
+        if variant.size[0] >= size[0] and variant.size[1] >= size[1]:
+            return variant
+    return screen[-1]
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def render_variant(image, variant):
+    """Encodes one variant of a decoded original; returns the bytes."""
+    if _has_alpha(image) and variant.format == "WEBP" and variant.mode == "RGB":
+        image = image.convert("RGBA")  # WebP keeps transparent backgrounds transparent
+    elif _has_alpha(image):
+        # Formats without alpha (and paper) get a white background
+        background = Image.new("RGBA", image.size, "white")
+        background.alpha_composite(image.convert("RGBA"))
+        image = background.convert(variant.mode)
+    else:
+        image = image.convert(variant.mode)
+    if variant.fit == "crop":
+        rendered = ImageOps.fit(image, variant.size, Image.LANCZOS)
+    else:
+        rendered = image.copy()
+        rendered.thumbnail(variant.size, Image.LANCZOS)
+    out = io.BytesIO()
+    if variant.format == "PNG":
+        rendered.save(out, format="PNG", optimize=True)
+    else:
+        rendered.save(out, format=variant.format, quality=80, method=4)
+    return out.getvalue()
+
+
+def render_variants(photo_bytes, names=None):
+    """Renders the named variants (all by default) of an original; returns [(name, bytes)].
+
+    A top-level function, so process pools can run it.
+    """
+    image = Image.open(io.BytesIO(photo_bytes))
+    image.load()
+    return [
+        (variant.name, render_variant(image, variant))
+        for variant in VARIANTS if names is None or variant.name in names
+    ]
+
+
+def render_many(photos, workers=VARIANT_RENDER_WORKERS):
+    """Renders every variant of each (photo_hash, photo_bytes); returns {photo_hash: [(name, bytes)]}."""
+    photos = list(photos)
+    if len(photos) <= 1:
+        return {photo_hash: render_variants(photo_bytes) for photo_hash, photo_bytes in photos}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rendered = pool.map(render_variants, [photo_bytes for _, photo_bytes in photos], chunksize=4)
+        return {photo_hash: variants for (photo_hash, _), variants in zip(photos, rendered)}
+
+
+def ensure_variant_schema(cur):
+    """Creates photo_variants if it does not exist yet (see also tbt.txt)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS photo_variants (
+            hash TEXT NOT NULL REFERENCES product_photos(hash) ON DELETE CASCADE,
+            variant TEXT NOT NULL,
+            data BYTEA NOT NULL,
+            PRIMARY KEY (hash, variant)
+        )
+    """)
+    cur.execute("ALTER TABLE photo_variants ALTER COLUMN data SET STORAGE EXTERNAL")
+
+
+def store_variants(cur, rendered, replace=False):
+    """Stores {photo_hash: [(name, bytes)]} in the caller's transaction."""
+    rows = [
+        (photo_hash, name, psycopg2.Binary(data))
+        for photo_hash, variants in rendered.items() for name, data in variants
+    ]
+    if not rows:
+        return
+    conflict = "DO UPDATE SET data = EXCLUDED.data" if replace else "DO NOTHING"
+    execute_values(
+        cur,
+        f"INSERT INTO photo_variants (hash, variant, data) VALUES %s ON CONFLICT (hash, variant) {conflict}",
+        rows,
+        page_size=len(rows)
+    )
+
+
+def load_variant(conn, photo_hash, name):
+    """Reads the encoded bytes of one variant, rendering and storing it first if it is missing.
+
+    Runs on worker threads; returns None for photos that are not stored.
+    """
+    if not photo_hash:
+        return None
+    with conn.cursor() as cur:
+        cur.execute("SELECT data FROM photo_variants WHERE hash = %s AND variant = %s", (photo_hash, name))
+        row = cur.fetchone()
+        if row is not None:
+            return bytes(row[0])
+        cur.execute("SELECT data FROM product_photos WHERE hash = %s", (photo_hash,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        variants = render_variants(bytes(row[0]), (name,))
+        store_variants(cur, {photo_hash: variants})
+    return variants[0][1]
+
+
+def regenerate(conn, everything=False, workers=VARIANT_RENDER_WORKERS, batch_size=REGENERATE_BATCH):
+    """Renders the variants of stored photos that lack any (or of all photos); returns how many photos."""
+    with conn.cursor() as cur:
+        ensure_variant_schema(cur)
+    conn.commit()
+
+    done = 0
+    last_hash = ""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT ph.hash, ph.data FROM product_photos ph
+                    WHERE ph.hash > %s AND (%s OR (
+                        SELECT count(*) FROM photo_variants v WHERE v.hash = ph.hash AND v.variant = ANY(%s)
+                    ) < %s)
+                    ORDER BY ph.hash LIMIT %s
+                """, (last_hash, everything, list(VARIANTS_BY_NAME), len(VARIANTS), batch_size))
+                photos = [(photo_hash, bytes(data)) for photo_hash, data in cur.fetchall()]
+            if not photos:
+                break
+            rendered = pool.map(render_variants, [photo_bytes for _, photo_bytes in photos])
+            with conn.cursor() as cur:
+                store_variants(cur, dict(zip((photo_hash for photo_hash, _ in photos), rendered)), replace=True)
+            conn.commit()
+            done += len(photos)
+            last_hash = photos[-1][0]
+            print(f"Rendered variants of {done} photo(s)")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the pre-sized variants of the stored product photos.")
+    parser.add_argument("--regenerate", action="store_true", help="render variants of photos missing any")
+    parser.add_argument("--all", action="store_true", help="with --regenerate, render every photo again")
+    parser.add_argument("--workers", type=int, default=VARIANT_RENDER_WORKERS, help="rendering processes")
+    args = parser.parse_args()
+    if not args.regenerate:
+        parser.print_help()
+        return
+
+    conn = connect()
+    try:
+        started = time.perf_counter()
+        count = regenerate(conn, args.all, args.workers)
+        print(f"Variants of {count} photo(s) rendered in {time.perf_counter() - started:.1f} s.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Point-of-sale logic without the window.
+
+PosCore is what a terminal knows and does apart from drawing: the catalog
+held in memory with its name and barcode indexes, the modifier prices, the
+cart with its stock checks, stock reservations, and checking the cart out. POSApp drives one
+PosCore from Tk callbacks and only draws the results; loadtest.py drives
+many of them, one per simulated terminal.
+
+PosCore is not thread-safe: its cart and catalog belong to one thread, the
+Tk thread in the app. reserve(), release() and release_all() are database
+jobs that do not touch the cart, so the app runs them on its workers.
+checkout() records the sale and empties the cart on the calling thread; the
+app instead records with sale_lines() on a worker and calls
+finish_checkout() when the sale is saved.
+"""
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+
+import reservations
+from cart import Cart
+from config import STOCK_RESERVATIONS
+from modifiers import PriceBook
+from product_search import ProductSearchIndex
+from sales import OutOfStockError, format_options, record_sale
+from scanner import BarcodeIndex
+
+# What Catalog.merge() changed: the names (search index rebuilt), the set of products on
+# the menu, and the (product_id, photo_hash) of products whose picture alone changed
+CatalogChanges = namedtuple("CatalogChanges", "names_changed menu_changed new_pictures")
+
+
+class Catalog:
+    def __init__(self):
+        self.products = {}  # product_id -> {name, price, stock, photo_hash, barcode}
+        self.search_index = ProductSearchIndex()  # Name search over products
+        self.barcodes = BarcodeIndex()  # Barcode lookup over products, see scanner.py
+        self.loaded = False  # Set once a full catalog has been read
+        self._names = {}  # name -> product_id shown under that name (duplicates are hidden)
+
+    def replace(self, rows):
+        """Replaces the catalog with (id, name, price, stock, photo_hash, barcode) rows from fetch_catalog."""
+        self.products.clear()
+        self._names.clear()
+        for product_id, name, price, stock, photo_hash, barcode in rows:
+            # Remove duplicates by name (keep first occurrence)
+            if name in self._names:
+                continue
+            self._names[name] = product_id
+            self.products[product_id] = {
+                "name": name, "price": Decimal(str(price)), "stock": stock, "photo_hash": photo_hash,
+                "barcode": barcode
+            }
+        self.search_index.build((product_id, product["name"]) for product_id, product in self.products.items())
+        self.barcodes.build((product_id, product["barcode"]) for product_id, product in self.products.items())
+        self.loaded = True
+
+    def merge(self, product_ids, rows):
+        """Applies fetched rows of the changed `product_ids`; ids without a row were deleted.
+
+        Returns CatalogChanges, so the caller redraws only what is affected.
+        """
+        names_changed = menu_changed = False
+        new_pictures = []
+        found = set()
+        for product_id, name, price, stock, photo_hash, barcode in rows:
+            found.add(product_id)
+            owner = self._names.get(name)
+            if owner is not None and owner != product_id:
+                continue  # Same name as a product already shown, hidden like in a full load
+            old = self.products.get(product_id)
+            if old is None or old["name"] != name:
+                names_changed = menu_changed = True
+                if old is not None:
+                    del self._names[old["name"]]
+                self._names[name] = product_id
+            elif (old["stock"] > 0) != (stock > 0):
+                menu_changed = True
+            elif old["photo_hash"] != photo_hash:
+                new_pictures.append((product_id, photo_hash))
+            self.products[product_id] = {
+                "name": name, "price": Decimal(str(price)), "stock": stock, "photo_hash": photo_hash,
+                "barcode": barcode
+            }
+            self.barcodes.put(product_id, old and old["barcode"], barcode)
+        for product_id in product_ids - found:
+            old = self.products.pop(product_id, None)
+            if old is not None:
+                names_changed = menu_changed = True
+                del self._names[old["name"]]
+                self.barcodes.put(product_id, old["barcode"], None)
+
+        if names_changed:
+            self.search_index.build((product_id, product["name"]) for product_id, product in self.products.items())
+        return CatalogChanges(names_changed, menu_changed, new_pictures)
+
+    def replace_search_results(self, rows):
+        """Holds only the (id, name, price, stock) rows of a server-side search (SEARCH_SERVER_SIDE)."""
+        self.products.clear()
+        for product_id, name, price, stock in rows:
+            self.products[product_id] = {"name": name, "price": Decimal(str(price)), "stock": stock}
+
+    def in_stock(self):
+        """(product_id, name, photo_hash) of the products in stock, in name order."""
+        return sorted(
+            ((product_id, product["name"], product["photo_hash"])
+             for product_id, product in self.products.items() if product["stock"] > 0),
+            key=lambda product: product[1]
+        )
+
+
+class PosCore:
+    def __init__(self, use_reservations=STOCK_RESERVATIONS):
+        self.terminal_id = str(uuid.uuid4())  # Holder of this terminal's stock reservations
+        self.use_reservations = use_reservations
+        self.catalog = Catalog()
+        self.prices = PriceBook()  # Modifier groups and prices, see modifiers.py
+        self.cart = Cart()  # Lines of the current sale, see cart.py
+
+    @property
+    def holder(self):
+        """The reservation holder checkouts consume, or None without reservations."""
+        return self.terminal_id if self.use_reservations else None
+
+    def check_stock(self, product_id, quantity, stock=None):
+        """Raises OutOfStockError if the cart cannot take `quantity` more of a product.
+
+        The catalog is kept current by notifications; `stock` is used for
+        products it does not hold.
+        """
+        if quantity <= 0:
+            raise ValueError("Quantity must be greater than zero.")
+        product = self.catalog.products.get(product_id)
+        available = product["stock"] if product is not None else stock
+        wanted = self.cart.quantity_of(product_id) + quantity
+        if available is not None and wanted > available:
+            raise OutOfStockError([(product_id, wanted, available)])
+
+    def add(self, product_id, name, price, quantity=1, stock=None, **options):
+        """Checks stock, then adds to the cart and returns the line; see check_stock() and add_checked()."""
+        self.check_stock(product_id, quantity, stock)
+        return self.add_checked(product_id, name, price, quantity, **options)
+
+    def add_checked(self, product_id, name, price, quantity=1, **options):
+        """Adds to the cart without a stock check, at the base `price` plus the options' modifiers.
+
+        Returns the line. Raises ValueError for an option the price book does not know.
+        """
+        return self.cart.add(product_id, name, self.prices.unit_price(price, **options), quantity, **options)
+
+    def take_back(self, line_id, quantity=1):
+        """Takes `quantity` off a line, e.g. when its reservation was refused; returns the line or None."""
+        line = self.cart.get(line_id)
+        if line is not None:
+            self.cart.set_quantity(line_id, line.quantity - quantity)
+        return line
+
+    def remove(self, line_id):
+        """Removes a cart line and returns it."""
+        return self.cart.remove(line_id)
+
+    def reserve(self, conn, product_id, quantity=1):
+        """Database job: reserves stock for this terminal's cart; returns False if not enough is free."""
+        return reservations.reserve(conn, self.terminal_id, product_id, quantity)
+
+    def release(self, conn, product_id, quantity):
+        """Database job: gives back stock this terminal reserved for a line that left the cart."""
+        return reservations.release(conn, self.terminal_id, product_id, quantity)
+
+    def release_all(self, conn):
+        """Database job: gives back everything this terminal reserved."""
+        return reservations.release_all(conn, self.terminal_id)
+
+    def sale_lines(self):
+        """The cart as a sale: (checked_out, lines).
+
+        `lines` holds the (product_id, quantity, price, options) tuples sales.py
+        writes; `checked_out` holds (line_id, quantity) for finish_checkout().
+        """
+        checked_out = [(line.line_id, line.quantity) for line in self.cart]
+        lines = [
+            (line.product_id, line.quantity, line.price, format_options(line.size, line.state, line.sugar))
+            for line in self.cart
+        ]
+        return checked_out, lines
+
+    def finish_checkout(self, checked_out):
+        """Takes the sold quantities out of the cart; anything added while the sale was saving stays."""
+        for line_id, quantity in checked_out:
+            line = self.cart.get(line_id)
+            if line is not None:
+                self.cart.set_quantity(line_id, line.quantity - quantity)
+
+    def checkout(self, conn):
+        """Records the cart as one sale on `conn` and empties it; returns (sale_id, elapsed_seconds).
+
+        Raises OutOfStockError, leaving the cart as it was, if stock ran out.
+        """
+        if not self.cart:
+            raise ValueError("Cannot checkout with an empty cart.")
+        checked_out, lines = self.sale_lines()
+        result = record_sale(conn, lines, str(uuid.uuid4()), None, self.holder)
+        self.finish_checkout(checked_out)
+        return result
@@ -1,81 +1,85 @@
+import time
+_STARTED = time.perf_counter()  # Startup phases are measured from here, see startup.py
+
 import tkinter as tk
-from tkinter import ttk, messagebox
-import psycopg2
-from psycopg2 import sql
+from tkinter import ttk, messagebox, filedialog
+from collections import deque
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-import os
 from PIL import Image, ImageTk
-import io
-
-# --- Database Configuration ---
-# IMPORTANT: Replace with your actual PostgreSQL connection details
-DB_NAME = "pos_db"
-DB_USER = "_pos_user"
-DB_PASSWORD = "123"
-DB_HOST = "localhost"  # Or your DB host
-DB_PORT = "5432"      # Default PostgreSQL port
-
-# Example mapping: filename (without extension) to (stock, price, barcode)
-product_info = {
-    "espresso": (50, 2.50, "1234567890123"),
-    "latte macchiato": (30, 3.00, "1234567890124"),
-    "cappucino": (20, 3.50, "1234567890125"),
-    "espresso macchiato": (40, 2.00, "1234567890126"),
-    "mocha": (25, 3.75, "1234567890127"),
-    "macchiato": (15, 3.25, "1234567890128"),
-    "caffe late": (10, 4.00, "1234567890129"),
-    "cortado": (5, 4.50, "1234567890130"),
-    "flat white": (8, 3.50, "1234567890131"),
-    
-}
-
-pics_dir = os.path.join(os.path.dirname(__file__), "pics")
-
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
+
+from db import ConnectionPool
+from db_worker import DatabaseExecutor, fetchall, fetchone
+from thumbcache import ThumbnailCache, MENU_THUMB_SIZE, POPUP_THUMB_SIZE
+from image_loader import ImageLoader
+from menu_grid import MenuGrid
+from customize_dialog import CustomizeDialog
+from modifiers import load_price_book
+from tree_binding import TreeBinding
+from sales import OutOfStockError
+from sale_journal import SaleJournal, SaleRecorder
+from history import HistoryPager
+from partitions import create_upcoming
+from export import EXPORT_QUERIES, describe, export_sales
+from reservations import release_expired
+from rollups import load_report
+from product_search import search_products_db
+from scanner import ScanDetector, find_barcode
+from pos_core import PosCore
+from catalog_sync import CatalogListener, fetch_catalog
+from query_stats import query_stats
+from startup import PhaseTimer
+from config import (
+    SEARCH_DEBOUNCE_MS, SEARCH_SERVER_SIDE, JOURNAL_STATUS_INTERVAL_MS, REPORT_RANGES,
+    SLOW_QUERY_LOG_PATH, QUERY_STATS_PATH, RESERVATION_SWEEP_MS, SCANNER_ENABLED,
 )
-cur = conn.cursor()
-
-for filename in os.listdir(pics_dir):
-    if filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
-        name = os.path.splitext(filename)[0]
-        if name not in product_info:
-            print(f"Skipping {filename}: no info in mapping.")
-            continue
-        stock, price, barcode = product_info[name]
-        with open(os.path.join(pics_dir, filename), "rb") as f:
-            photo_bytes = f.read()
-        cur.execute(
-            "INSERT INTO products (name, photo, stock, price, barcode) VALUES (%s, %s, %s, %s, %s)",
-            (name, psycopg2.Binary(photo_bytes), stock, price, barcode)
-        )
-        print(f"Inserted {name}")
 
-conn.commit()
-cur.close()
-conn.close()
+_IMPORTED = time.perf_counter()
 
 class POSApp:
-    def __init__(self, root):
+    def __init__(self, root, startup=None):
         self.root = root
         self.root.title("Python POS System")
         self.root.geometry("1000x700") # Adjusted size
-
-        self.db_conn = None
-        self.db_cursor = None
-        self.connect_db()
-
-        self.cart = [] # To store items added to the current sale {product_id, name, price, quantity}
-        self.products_data = {} # To store product details fetched from DB {product_id: {name, price, stock}}
+        self.startup = startup or PhaseTimer()  # Startup phase timings, see startup.py
+
+        self.pool = None
+        self.db = None  # Runs every query on a worker thread, see db_worker.py
+        with self.startup.phase("database setup"):
+            self.connect_db()
+
+        self.core = PosCore()  # Catalog, cart and checkout logic, see pos_core.py
+        self.scanner = ScanDetector()
+        self.scan_times = deque(maxlen=200)  # Seconds from Enter to cart of recent scans
+        self.popup_times = deque(maxlen=200)  # Seconds from menu tap to customization dialog shown
+        self._catalog_reload = False  # A full catalog read is due, see _sync_catalog
+        self._catalog_dirty = set()  # Products announced as changed and not fetched yet
+        self._catalog_syncing = False  # A catalog fetch is in flight
+        self._menu_waiting = None  # Menu page frame waiting for the catalog, see _setup_menu_page
+        self.menu_grid = None  # Scrollable menu tiles, built with the menu page
+        self.customize_dialog = None  # Built with the menu page, see _setup_menu_page
+        self._search_after_id = None  # Pending debounced search, see filter_products
+        self._search_seq = 0  # Latest server-side search, see show_products
         self.current_user = None  # Store the currently logged-in user
-
-        self._setup_styles()
-        self._setup_ui()
-        self.load_products()
+        with self.startup.phase("thumbnail cache"):
+            self.thumbnails = ThumbnailCache()  # Pre-rendered product pictures, in memory and on disk
+            self.image_loader = ImageLoader(self.root, self.thumbnails, self.pool)
+            self.menu_placeholder = ImageTk.PhotoImage(Image.new("RGB", MENU_THUMB_SIZE, "#333333"))
+            self.popup_placeholder = ImageTk.PhotoImage(Image.new("RGB", POPUP_THUMB_SIZE, "#333333"))
+
+        with self.startup.phase("styles and navbar"):
+            self._setup_styles()
+            self._setup_ui()
+        # The listener's first notice reads the whole catalog, in the background while the user
+        # logs in; after that only products announced as changed are fetched again.
+        self.catalog_listener = CatalogListener(self.root, self._catalog_changed)
+        self.catalog_listener.start()
+        if self.core.use_reservations:
+            self.root.after(RESERVATION_SWEEP_MS, self._sweep_reservations)
+        if SCANNER_ENABLED:
+            # Runs after the focused widget's own bindings, see _on_key
+            self.root.bind_all("<Key>", self._on_key, add="+")
+        self.root.after_idle(self.startup.ready)
 
     def _setup_styles(self, dark_mode=True):
         """Sets up modern dark styles for ttk widgets."""
@@ -122,21 +126,63 @@ class POSApp:
         pass
 
     def connect_db(self):
-        """Establishes connection to the PostgreSQL database."""
-        try:
-            self.db_conn = psycopg2.connect(
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                host=DB_HOST,
-                port=DB_PORT
-            )
-            self.db_cursor = self.db_conn.cursor()
+        """Starts the database workers and checks that PostgreSQL is reachable."""
+        self.pool = ConnectionPool()  # Reconnects with backoff, so a database restart is survived
+        self.db = DatabaseExecutor(self.root, self.pool, on_busy=self.set_busy, on_error=self.show_db_error)
+        self.exports = DatabaseExecutor(self.root, self.pool, workers=1)  # Long sales exports, see export.py
+        # Checkouts never queue behind background jobs that retry the connection during an outage
+        self.checkouts = DatabaseExecutor(self.root, self.pool, workers=1)
+        # Checkouts go to a local journal while the database is unreachable and are replayed later
+        self.journal = SaleJournal()
+        self.recorder = SaleRecorder(self.pool, self.journal)
+
+        connect_started = time.perf_counter()
+
+        def connected(result):
+            self.startup.add("first database connection (background)", time.perf_counter() - connect_started)
             print("Successfully connected to PostgreSQL database.")
-        except psycopg2.Error as e:
+
+        def connection_failed(e):
             messagebox.showerror("Database Connection Error", f"Could not connect to database: {e}\nPlease check your connection details and ensure PostgreSQL is running.")
             self.root.quit() # Exit if DB connection fails
 
+        self.db.submit(
+            fetchone, "SELECT 1",
+            on_done=connected,
+            on_error=connection_failed
+        )
+
+        def partitions_created(created):
+            if created:
+                print(f"Created sales partitions: {', '.join(created)}")
+
+        # A sale needs the partition of its month; maintenance creates them too, but may not be scheduled
+        self.db.submit(
+            create_upcoming,
+            on_done=partitions_created,
+            on_error=lambda e: print(f"Could not create the coming sales partitions: {e}"),
+            busy=False
+        )
+
+    def set_busy(self, busy):
+        """Shows a busy cursor and status while database work is in flight."""
+        self.root.configure(cursor="watch" if busy else "")
+        if hasattr(self, "status_label"):
+            self.status_label.config(text="Working..." if busy else "")
+
+    def _poll_journal(self):
+        """Shows how many offline sales are still waiting to be replayed, and how many were refused."""
+        backlog, failed = self.recorder.backlog, self.recorder.failed
+        status = [f"Offline: {backlog} sale(s) pending"] if backlog else []
+        if failed:
+            # Kept in the journal's failed_sales table, see sale_journal.py
+            status.append(f"{failed} offline sale(s) failed")
+        self.journal_label.config(text="\n".join(status))
+        self.root.after(JOURNAL_STATUS_INTERVAL_MS, self._poll_journal)
+
+    def show_db_error(self, e):
+        messagebox.showerror("Database Error", f"Database operation failed: {e}")
+
     def _setup_ui(self):
         """Creates the main UI layout."""
 
@@ -155,6 +201,9 @@ class POSApp:
             ("Menu", self.show_menu_page),
             ("Order", self.show_order_page),
             ("Stock", self.show_stock_page),
+            ("History", self.show_history_page),
+            ("Reports", self.show_reports_page),
+            ("Diagnostics", self.show_diagnostics_page),
             ("Login", self.show_settings_page),
             ("Logout", self.logout),
         ]
@@ -166,29 +215,42 @@ class POSApp:
                 btn.pack(fill=tk.X, pady=12, ipadx=10, ipady=12)
                 self.nav_buttons[text] = btn
 
-        # Hide Menu, Order, Stock buttons initially
-        for key in ("Menu", "Order", "Stock"):
+        # Hide the page buttons until someone logs in
+        for key in ("Menu", "Order", "Stock", "History", "Reports", "Diagnostics"):
             self.nav_buttons[key].pack_forget()
 
         # Add user label at the bottom of the navbar
         self.user_label = ttk.Label(self.navbar, text="", font=("Segoe UI", 11, "italic"), style="TLabel")
         self.user_label.pack(side=tk.BOTTOM, pady=(30, 0), anchor="s")
+        self.status_label = ttk.Label(self.navbar, text="", font=("Segoe UI", 10, "italic"), style="TLabel")
+        self.status_label.pack(side=tk.BOTTOM, anchor="s")
+        self.journal_label = ttk.Label(self.navbar, text="", font=("Segoe UI", 10, "bold"), foreground="#ffc107", style="TLabel")
+        self.journal_label.pack(side=tk.BOTTOM, anchor="s")
+        self._poll_journal()
 
         # --- Content Area (Pages) ---
         self.pages = {}
         self.content_frame = ttk.Frame(main_frame)
         self.content_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # Menu Page
-        menu_page = ttk.Frame(self.content_frame)
-        self.pages["menu"] = menu_page
-        self._setup_menu_page(menu_page)
+        # Pages are built the first time they are shown, see ensure_page
+        self.page_builders = {
+            "menu": self._setup_menu_page,
+            "order": self._setup_order_page,
+            "stock": self._setup_stock_page,
+            "history": self._setup_history_page,
+            "reports": self._setup_reports_page,
+            "diagnostics": self._setup_diagnostics_page,
+            "settings": self._setup_settings_page,
+        }
+
+        # Show Login page by default
+        self.show_page("settings")
 
-        # Order Page (Cart and Checkout only)
-        order_page = ttk.Frame(self.content_frame)
-        self.pages["order"] = order_page
+    def _setup_order_page(self, parent):
+        """Sets up the order page: the cart and checkout."""
         # --- Right Panel: Cart and Checkout ---
-        right_panel = ttk.Frame(order_page, padding="10")
+        right_panel = ttk.Frame(parent, padding="10")
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5)
 
         ttk.Label(right_panel, text="Current Sale", font=("Arial", 16, "bold")).pack(pady=(0,10))
@@ -204,6 +266,8 @@ class POSApp:
             else:
                 self.cart_tree.column(col, width=100, anchor=tk.CENTER)
         self.cart_tree.pack(fill=tk.BOTH, expand=True, pady=5)
+        # Rows use the cart line ids as iids, so adding an item touches one row
+        self.cart_view = TreeBinding(self.cart_tree, key=lambda line: line.line_id, values=self._cart_row)
 
         remove_button = ttk.Button(right_panel, text="Remove Selected", command=self.remove_from_cart, style="Danger.TButton")
         remove_button.pack(pady=5, fill=tk.X)
@@ -214,20 +278,22 @@ class POSApp:
         self.total_amount_var = tk.StringVar(value="0.00")
         ttk.Label(total_frame, textvariable=self.total_amount_var, font=("Arial", 14, "bold")).pack(side=tk.RIGHT)
 
-        checkout_button = ttk.Button(right_panel, text="Checkout", command=self.checkout, style="Success.TButton")
-        checkout_button.pack(fill=tk.X, pady=10, ipady=5)
+        self.checkout_button = ttk.Button(right_panel, text="Checkout", command=self.checkout, style="Success.TButton")
+        self.checkout_button.pack(fill=tk.X, pady=10, ipady=5)
 
-        # Stock Page (move Available Products here)
-        stock_page = ttk.Frame(self.content_frame)
-        self.pages["stock"] = stock_page
+        # Lines may have been added from the menu before this page existed
+        self.update_cart_display()
+        self.update_total_amount()
 
-        ttk.Label(stock_page, text="Available Products", font=("Arial", 16, "bold")).pack(pady=(0,10))
+    def _setup_stock_page(self, parent):
+        """Sets up the stock page listing the available products."""
+        ttk.Label(parent, text="Available Products", font=("Arial", 16, "bold")).pack(pady=(0,10))
 
         # --- Refresh Button ---
-        refresh_btn = ttk.Button(stock_page, text="Refresh", command=lambda: self.load_products(self.search_var.get()))
+        refresh_btn = ttk.Button(parent, text="Refresh", command=lambda: self.load_products(self.search_var.get()))
         refresh_btn.pack(pady=(0, 5), anchor="e", padx=10)
 
-        search_frame = ttk.Frame(stock_page)
+        search_frame = ttk.Frame(parent)
         search_frame.pack(fill=tk.X, pady=5)
         ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=(0,5))
         self.search_var = tk.StringVar()
@@ -237,25 +303,165 @@ class POSApp:
 
         # Only show name and price columns in the stock page
         cols = ("name", "price")
-        self.product_tree = ttk.Treeview(stock_page, columns=cols, show="headings", selectmode="browse")
+        self.product_tree = ttk.Treeview(parent, columns=cols, show="headings", selectmode="browse")
         for col in cols:
             self.product_tree.heading(col, text=col.capitalize())
             self.product_tree.column(col, width=200 if col == "name" else 100, anchor=tk.W if col == "name" else tk.CENTER)
         self.product_tree.pack(fill=tk.BOTH, expand=True, pady=5)
         self.product_tree.bind("<<TreeviewSelect>>", self.on_product_select)
+        # Rows are keyed by product id, so a refresh only redraws products that changed
+        self.product_view = TreeBinding(
+            self.product_tree,
+            key=lambda product_id: product_id,
+            values=lambda product_id: (
+                self.core.catalog.products[product_id]["name"],
+                f"{self.core.catalog.products[product_id]['price']:.2f}"
+            )
+        )
 
-        # History Page
-        history_page = ttk.Frame(self.content_frame)
-        self.pages["history"] = history_page
-        self._setup_history_page(history_page)
+        if SEARCH_SERVER_SIDE or self.core.catalog.loaded:
+            self.show_products()
 
-        # Settings Page
-        settings_page = ttk.Frame(self.content_frame)
-        self.pages["settings"] = settings_page
-        self._setup_settings_page(settings_page)
+    def show_reports_page(self):
+        self.show_page("reports")
+        self.refresh_report()
 
-        # Show Login page by default
-        self.show_page("settings")
+    def _setup_reports_page(self, parent):
+        """Sets up the reports page; every figure comes from the rollup tables (rollups.py)."""
+        ttk.Label(parent, text="Reports", font=("Segoe UI", 18, "bold")).pack(pady=20)
+
+        range_frame = ttk.Frame(parent)
+        range_frame.pack(fill=tk.X, padx=30)
+        ttk.Label(range_frame, text="Period:").pack(side=tk.LEFT)
+        self.report_range_var = tk.StringVar(value="Today")
+        range_box = ttk.Combobox(range_frame, textvariable=self.report_range_var, state="readonly", width=15,
+                                 values=list(REPORT_RANGES))
+        range_box.pack(side=tk.LEFT, padx=(5, 15))
+        range_box.bind("<<ComboboxSelected>>", lambda e: self.refresh_report())
+        ttk.Button(range_frame, text="Refresh", command=self.refresh_report).pack(side=tk.LEFT)
+
+        self.report_summary_var = tk.StringVar(value="")
+        ttk.Label(parent, textvariable=self.report_summary_var, font=("Segoe UI", 13, "bold")).pack(pady=10)
+
+        tables = ttk.Frame(parent)
+        tables.pack(fill=tk.BOTH, expand=True, padx=30, pady=(0, 10))
+
+        cols = ("period", "sales", "revenue")
+        self.report_series_tree = ttk.Treeview(tables, columns=cols, show="headings")
+        for col in cols:
+            self.report_series_tree.heading(col, text=col.capitalize())
+            self.report_series_tree.column(col, width=140 if col == "period" else 90, anchor=tk.CENTER)
+        self.report_series_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
+        self.report_series_view = TreeBinding(
+            self.report_series_tree,
+            key=lambda row: row[0],
+            values=lambda row: (row[0], row[1], f"{row[2]:.2f}")
+        )
+
+        cols = ("product", "quantity", "revenue")
+        self.report_products_tree = ttk.Treeview(tables, columns=cols, show="headings")
+        for col in cols:
+            self.report_products_tree.heading(col, text=col.capitalize())
+            self.report_products_tree.column(col, width=180 if col == "product" else 90,
+                                             anchor=tk.W if col == "product" else tk.CENTER)
+        self.report_products_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.report_products_view = TreeBinding(
+            self.report_products_tree,
+            key=lambda row: row[0],
+            values=lambda row: (row[0], row[1], f"{row[2]:.2f}")
+        )
+
+    def refresh_report(self):
+        """Reads the selected period from the rollups on a database worker."""
+        days = REPORT_RANGES[self.report_range_var.get()]
+        date_to = date.today()
+        date_from = date_to - timedelta(days=days - 1)
+        self.db.submit(
+            load_report, date_from, date_to,
+            on_done=self._show_report,
+            on_error=lambda e: self.report_summary_var.set(f"Could not load the report: {e}")
+        )
+
+    def _show_report(self, report):
+        sales_count, items_count, revenue = report["summary"]
+        self.report_summary_var.set(
+            f"{sales_count} sale(s), {items_count} item(s), revenue {revenue:.2f}"
+            f"  ({report['elapsed'] * 1000:.1f} ms)"
+        )
+        bucket_format = "%Y-%m-%d %H:00" if report["hourly"] else "%Y-%m-%d"
+        self.report_series_view.update(
+            (bucket.strftime(bucket_format), count, rev) for bucket, count, rev in report["series"]
+        )
+        self.report_products_view.update(report["products"])
+
+    def show_diagnostics_page(self):
+        self.show_page("diagnostics")
+        self.refresh_diagnostics()
+
+    def _setup_diagnostics_page(self, parent):
+        """Sets up the diagnostics page: per-statement query figures from query_stats.py."""
+        ttk.Label(parent, text="Query Diagnostics", font=("Segoe UI", 18, "bold")).pack(pady=20)
+
+        button_frame = ttk.Frame(parent)
+        button_frame.pack(fill=tk.X, padx=30)
+        ttk.Button(button_frame, text="Refresh", command=self.refresh_diagnostics).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Save JSON...", command=self.save_query_stats).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="Reset", command=self.reset_query_stats).pack(side=tk.LEFT)
+
+        self.diagnostics_summary_var = tk.StringVar(value="")
+        ttk.Label(parent, textvariable=self.diagnostics_summary_var, wraplength=700).pack(pady=10, padx=30, anchor="w")
+
+        tree_frame = ttk.Frame(parent)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=30, pady=(0, 10))
+        cols = ("statement", "calls", "mean_ms", "p95_ms", "p99_ms", "max_ms", "rows", "bytes_in")
+        headings = ("Statement", "Calls", "Mean ms", "p95 ms", "p99 ms", "Max ms", "Rows", "Bytes in")
+        self.diagnostics_tree = ttk.Treeview(tree_frame, columns=cols, show="headings")
+        for col, heading in zip(cols, headings):
+            self.diagnostics_tree.heading(col, text=heading)
+            self.diagnostics_tree.column(col, width=320 if col == "statement" else 70,
+                                         anchor=tk.W if col == "statement" else tk.CENTER)
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.diagnostics_tree.yview)
+        self.diagnostics_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.diagnostics_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.diagnostics_view = TreeBinding(
+            self.diagnostics_tree,
+            key=lambda row: row["statement"],
+            values=lambda row: tuple(row[col] for col in cols)
+        )
+
+    def refresh_diagnostics(self):
+        """Shows the statements that took the most total time first."""
+        self.diagnostics_view.update(query_stats.snapshot())
+        self.diagnostics_summary_var.set(
+            f"Since {query_stats.started:%H:%M:%S}: {query_stats.slow_count} slow quer(ies) over "
+            f"{query_stats.slow_ms} ms (logged to {SLOW_QUERY_LOG_PATH}). Pool: {self.pool.stats()}"
+            + self._timing_summary("scan(s) to cart", self.scan_times)
+            + self._timing_summary("menu tap(s) to dialog", self.popup_times)
+        )
+
+    def _timing_summary(self, what, seconds):
+        if not seconds:
+            return ""
+        times = sorted(seconds)
+        return (f" Last {len(times)} {what}: median {times[len(times) // 2] * 1000:.2f} ms, "
+                f"slowest {times[-1] * 1000:.2f} ms.")
+
+    def reset_query_stats(self):
+        query_stats.reset()
+        self.refresh_diagnostics()
+
+    def save_query_stats(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.root, defaultextension=".json", initialfile="query_stats.json",
+            filetypes=[("JSON", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            query_stats.dump_json(path, {"pool": self.pool.stats(), "startup": self.startup.as_dict()})
+        except OSError as e:
+            messagebox.showerror("Save Error", f"Could not save the query statistics: {e}")
 
     def show_history_page(self):
         self.show_page("history")
@@ -267,29 +473,151 @@ class POSApp:
 
         ttk.Label(parent, text="Checkout History", font=("Segoe UI", 18, "bold")).pack(pady=20)
 
+        # Date range filter, both ends optional and inclusive
+        filter_frame = ttk.Frame(parent)
+        filter_frame.pack(fill=tk.X, padx=30)
+        ttk.Label(filter_frame, text="From (YYYY-MM-DD):").pack(side=tk.LEFT)
+        self.history_from_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.history_from_var, width=12).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Label(filter_frame, text="To:").pack(side=tk.LEFT)
+        self.history_to_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.history_to_var, width=12).pack(side=tk.LEFT, padx=(5, 15))
+        ttk.Button(filter_frame, text="Apply", command=self.reset_history).pack(side=tk.LEFT)
+        ttk.Button(filter_frame, text="Export CSV...", command=self.export_history).pack(side=tk.RIGHT)
+        self.export_kind_var = tk.StringVar(value="items")
+        ttk.Combobox(filter_frame, textvariable=self.export_kind_var, values=sorted(EXPORT_QUERIES),
+                     state="readonly", width=8).pack(side=tk.RIGHT, padx=5)
+
+        tree_frame = ttk.Frame(parent)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=30, pady=10)
         cols = ("date", "items", "total")
-        history_tree = ttk.Treeview(parent, columns=cols, show="headings", selectmode="browse")
+        self.history_tree = ttk.Treeview(tree_frame, columns=cols, show="headings", selectmode="browse")
         for col in cols:
-            history_tree.heading(col, text=col.capitalize())
-            history_tree.column(col, width=200 if col == "items" else 120, anchor=tk.W if col == "items" else tk.CENTER)
-        history_tree.pack(fill=tk.BOTH, expand=True, padx=30, pady=10)
+            self.history_tree.heading(col, text=col.capitalize())
+            self.history_tree.column(col, width=200 if col == "items" else 120, anchor=tk.W if col == "items" else tk.CENTER)
+        self.history_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=self._on_history_scroll)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.history_view = TreeBinding(
+            self.history_tree,
+            key=lambda row: row[0],
+            values=lambda row: (row[1].strftime("%Y-%m-%d %H:%M"), row[2], f"{row[3]:.2f}")
+        )
+        self.history_status = ttk.Label(parent, text="", style="TLabel")
+        self.history_status.pack(pady=(0, 10))
+
+        # Only the first page is read now; the rest follows as the list is scrolled
+        self.history_rows = []
+        self.history_pager = HistoryPager()
+        self._history_loading = False
+        self.load_more_history()
 
-        # Load history from the database
+    def reset_history(self):
+        """Starts the history over with the dates in the filter fields."""
         try:
-            self.db_cursor.execute("""
-                SELECT date, items, total FROM history
-                ORDER BY date DESC
-            """)
-            for row in self.db_cursor.fetchall():
-                date, items, total = row
-                history_tree.insert("", tk.END, values=(date.strftime("%Y-%m-%d %H:%M"), items, f"{total:.2f}"))
-        except Exception as e:
-            ttk.Label(parent, text=f"Could not load history: {e}", foreground="red").pack(pady=10)
+            date_from = self._parse_history_date(self.history_from_var.get())
+            date_to = self._parse_history_date(self.history_to_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Dates must be written as YYYY-MM-DD.")
+            return
+        self.history_pager = HistoryPager(date_from=date_from, date_to=date_to)
+        self.history_rows = []
+        self.history_view.clear()
+        self._history_loading = False
+        self.load_more_history()
+
+    def export_history(self):
+        """Streams the checkouts of the filter's date range to a CSV file, gzipped unless named .csv."""
+        try:
+            date_from = self._parse_history_date(self.history_from_var.get())
+            date_to = self._parse_history_date(self.history_to_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Dates must be written as YYYY-MM-DD.")
+            return
+        kind = self.export_kind_var.get()
+        path = filedialog.asksaveasfilename(
+            parent=self.root, defaultextension=".csv.gz", initialfile=f"{kind}.csv.gz",
+            filetypes=[("Gzipped CSV", "*.csv.gz"), ("Zstandard CSV", "*.csv.zst"), ("CSV", "*.csv")]
+        )
+        if not path:
+            return
+        self.history_status.config(text=f"Exporting {kind} to {path}...")
+
+        def exported(result):
+            self.history_status.config(text=f"Exported {describe(*result)}.")
+
+        def failed(e):
+            self.history_status.config(text="")
+            messagebox.showerror("Export Error", f"Could not export: {e}")
+
+        # Exports open their own connection and may run for a while, so they do not take a worker
+        self.exports.submit(
+            export_sales, path, kind, date_from, date_to,
+            on_done=exported, on_error=failed, with_connection=False
+        )
+
+    @staticmethod
+    def _parse_history_date(text):
+        text = text.strip()
+        return datetime.strptime(text, "%Y-%m-%d").date() if text else None
+
+    def _on_history_scroll(self, first, last):
+        self.history_scrollbar.set(first, last)
+        # Near the bottom, or the list does not fill the view yet
+        if float(last) > 0.9:
+            self.load_more_history()
+
+    def load_more_history(self):
+        """Appends the next page of checkouts, unless one is already on its way."""
+        if self._history_loading or self.history_pager.exhausted:
+            return
+        self._history_loading = True
+        self.history_status.config(text="Loading...")
+        pager = self.history_pager
+        self.db.submit(
+            pager.fetch_next,
+            on_done=lambda rows: self._history_page_loaded(pager, rows),
+            on_error=lambda e: self._history_page_failed(pager, e)
+        )
+
+    def _history_page_loaded(self, pager, rows):
+        if pager is not self.history_pager:
+            return  # The filter changed while this page was loading
+        self._history_loading = False
+        self.history_rows.extend(rows)
+        self.history_view.update(self.history_rows)
+        self.history_status.config(
+            text=f"{len(self.history_rows)} checkout(s)" + ("" if pager.exhausted else ", scroll for more")
+        )
+
+    def _history_page_failed(self, pager, e):
+        if pager is not self.history_pager:
+            return
+        self._history_loading = False
+        self.history_status.config(text=f"Could not load history: {e}")
+
+    def refresh_history(self):
+        """Puts checkouts made since the history was loaded at the top, keeping the pages already read."""
+        if "history" not in self.pages:
+            return  # Loaded fresh when the page is first shown
+        pager = self.history_pager
+        latest = HistoryPager(pager.page_size, pager.date_from, pager.date_to)
+
+        def merge(rows):
+            if pager is not self.history_pager:
+                return
+            known = {row[0] for row in self.history_rows}
+            self.history_rows[:0] = [row for row in rows if row[0] not in known]
+            self.history_view.update(self.history_rows)
+
+        self.db.submit(latest.fetch_next, on_done=merge,
+                       on_error=lambda e: print(f"Could not refresh history: {e}"), busy=False)
 
     def logout(self):
         """Logs out the user and returns to the login page."""
-        # Hide Menu, Order, Stock, and Logout buttons
-        for key in ("Menu", "Order", "Stock", "Logout"):
+        # Hide the page buttons and Logout
+        for key in ("Menu", "Order", "Stock", "History", "Reports", "Diagnostics", "Logout"):
             self.nav_buttons[key].pack_forget()
         # Show Login button
         self.nav_buttons["Login"].pack(fill=tk.X, pady=8, ipadx=10, ipady=8)
@@ -298,6 +626,9 @@ class POSApp:
             self.user_id_var.set("")
         if hasattr(self, "password_var"):
             self.password_var.set("")
+        if self.core.use_reservations:
+            # Stock held for the cart goes back to the other terminals
+            self.db.submit(self.core.release_all, on_error=lambda e: print(f"Could not release reserved stock: {e}"))
         # Clear current user and update label
         self.current_user = None
         self.update_user_label()
@@ -312,10 +643,30 @@ class POSApp:
             self.user_label.config(text="")
 
     def _setup_menu_page(self, parent):
-        # Fetch products with images from the database, removing duplicates by name
-        self.db_cursor.execute("SELECT id, name, photo FROM products WHERE stock > 0 ORDER BY name ASC")
-        products = self.db_cursor.fetchall()
+        # Built once, hidden, and re-bound to each tapped product, see customize_dialog.py
+        self.customize_dialog = CustomizeDialog(
+            self.root, self.core.prices, self.popup_placeholder, self._customize_confirmed
+        )
+        # Only photo hashes are known up front; the image loader reads full photos in
+        # the background, and only for thumbnails that are not cached yet.
+        if SEARCH_SERVER_SIDE:
+            # The catalog is not held in memory, so the menu asks for its products itself
+            self.db.submit(fetchall, """
+                SELECT id, name, photo_hash FROM products
+                WHERE stock > 0 ORDER BY name ASC
+            """, on_done=lambda products: self._build_menu_grid(parent, products))
+        elif self.core.catalog.loaded:
+            self._build_menu_grid(parent, self.core.catalog.in_stock())
+        else:
+            # Built by _set_catalog when the background catalog load arrives
+            ttk.Label(parent, text="Loading menu...", font=("Arial", 16)).pack(pady=30)
+            self._menu_waiting = parent
+
+    def _rebuild_menu(self):
+        """Shows the current catalog in the menu grid, e.g. after products came into or went out of stock."""
+        self._build_menu_grid(self.pages["menu"], self.core.catalog.in_stock())
 
+    def _build_menu_grid(self, parent, products):
         # Remove duplicates by name (keep first occurrence)
         seen_names = set()
         unique_products = []
@@ -324,146 +675,168 @@ class POSApp:
                 unique_products.append(prod)
                 seen_names.add(prod[1])
 
-        if not unique_products:
-            ttk.Label(parent, text="No products found.", font=("Arial", 16)).pack(pady=30)
-            return
-
-        grid_frame = ttk.Frame(parent)
-        grid_frame.pack(fill=tk.BOTH, expand=True, padx=40, pady=20)
+        self.menu_products = unique_products
+        if self.menu_grid is None:
+            # Only the tiles in view exist; they are reused as the menu scrolls, see menu_grid.py
+            self.menu_grid = MenuGrid(parent, self.image_loader, self.menu_placeholder, self.menu_image_selected)
+            self.menu_grid.pack(fill=tk.BOTH, expand=True, padx=40, pady=20)
+        self.menu_grid.set_products(unique_products)
 
-        row = 0
-        col = 0
-        max_cols = 4
-        self.menu_images_refs = []
-
-        for product_id, name, photo_bytes in unique_products:
-            try:
-                image = Image.open(io.BytesIO(photo_bytes)).resize((130, 130), Image.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
-                self.menu_images_refs.append(photo)
+    def menu_image_selected(self, product_id):
+        """Opens the customization dialog for a menu tile, from the catalog held in memory."""
+        started = time.perf_counter()
+        product = self.core.catalog.products.get(product_id)
+        if product is None or "photo_hash" not in product:
+            # Server-side search keeps no catalog in memory; the product is read on a worker
+            self.db.submit(
+                fetchone, "SELECT name, price, stock, photo_hash FROM products WHERE id = %s", (product_id,),
+                on_done=lambda row: self._open_customize_popup(product_id, row, started)
+            )
+            return
+        # Stock is left to check_stock, which reads the catalog
+        self._open_customize_popup(product_id, (product["name"], product["price"], None, product["photo_hash"]), started)
 
-                frame = ttk.Frame(grid_frame, padding=10)
-                frame.grid(row=row, column=col, padx=20, pady=20, sticky="nsew")
+    def _open_customize_popup(self, product_id, row, started):
+        if not row:
+            messagebox.showerror("Error", "Product not found.")
+            return
+        name, price, stock, photo_hash = row
+        binding = self.customize_dialog.show(product_id, name, price, stock)
+        # Idle callbacks run after Tk has drawn the dialog
+        self.root.after_idle(lambda: self.popup_times.append(time.perf_counter() - started))
+        if photo_hash:
+            # Handed over at once if the picture is in memory, else loaded off the Tk thread
+            self.image_loader.request(
+                product_id, photo_hash, POPUP_THUMB_SIZE,
+                lambda image: self.customize_dialog.set_picture(binding, image)
+            )
 
-                label = ttk.Label(frame, image=photo)
-                label.pack()
-                ttk.Label(frame, text=name).pack()
+    def _customize_confirmed(self, product_id, name, price, stock, options):
+        try:
+            # A stock read by the dialog's own query covers products the catalog does not hold
+            self.core.check_stock(product_id, 1, stock)
+        except OutOfStockError as e:
+            messagebox.showwarning("Out of Stock", f"Only {e.shortages[0][2]} {name} in stock.")
+            return
+        if self.core.use_reservations:
+            # The unit is only added once the database has set it aside for this terminal
+            def reserved(ok):
+                if ok:
+                    self._add_menu_item(product_id, name, price, options)
+                else:
+                    messagebox.showwarning("Out of Stock", f"No {name} left to sell.")
 
-                btn = ttk.Button(frame, text="Select", command=lambda pid=product_id: self.menu_image_selected(pid))
-                btn.pack(pady=8)
+            self.db.submit(self.core.reserve, product_id, 1, on_done=reserved)
+            return
+        self._add_menu_item(product_id, name, price, options)
 
-                grid_frame.grid_columnconfigure(col, weight=1)
+    def _add_menu_item(self, product_id, name, price, options):
+        # Lines with the same product and options are merged by the cart
+        line = self.core.add_checked(product_id, name, price, **options)
+        if "order" in self.pages:
+            self.cart_view.put(line)
+            self.update_total_amount()
 
-                col += 1
-                if col >= max_cols:
-                    col = 0
-                    row += 1
-            except Exception as e:
-                print(f"Error loading image for {name}: {e}")
+    def _sweep_reservations(self):
+        """Gives back reservations whose terminal went away; every terminal does this now and then."""
+        self.db.submit(release_expired, on_error=lambda e: print(f"Could not release expired reservations: {e}"),
+                       busy=False)
+        self.root.after(RESERVATION_SWEEP_MS, self._sweep_reservations)
 
-    def menu_image_selected(self, product_id):
-        # Fetch product info from DB
-        self.db_cursor.execute("SELECT name, price, stock, photo FROM products WHERE id = %s", (product_id,))
-        result = self.db_cursor.fetchone()
-        if not result:
-            messagebox.showerror("Error", "Product not found.")
+    def _on_key(self, event):
+        """Watches every key press for scanner bursts and adds a completed scan to the cart."""
+        if self.current_user is None:
+            return
+        code = self.scanner.feed("\r" if event.keysym in ("Return", "KP_Enter") else event.char, event.time)
+        if code is None:
+            return
+        started = time.perf_counter()
+        widget = event.widget
+        if isinstance(widget, tk.Entry):
+            # The digits were typed into the focused field as well; take them back out
+            end = widget.index(tk.INSERT)
+            if widget.get()[end - len(code):end] == code:
+                widget.delete(end - len(code), end)
+        self.scan(code, started)
+
+    def scan(self, code, started=None):
+        """Adds the product labelled `code` to the cart, without a query when the catalog knows it."""
+        started = started or time.perf_counter()
+        product_id = self.core.catalog.barcodes.get(code)
+        if product_id is not None:
+            product = self.core.catalog.products[product_id]
+            self._add_scanned(product_id, product["name"], product["price"], product["stock"], started)
             return
-        name, price, stock, photo_bytes = result
 
-        # Create popup window
-        popup = tk.Toplevel(self.root)
-        popup.title(f"Customize {name}")
-        popup.geometry("370x850")  # Increased height for better visibility
-        popup.transient(self.root)
-        popup.grab_set()
-        popup.configure(bg="#232323")  # Dark mode background
+        def found(row):
+            if row is None:
+                self.root.bell()
+                messagebox.showwarning("Unknown Barcode", f"No product has the barcode {code}.")
+                return
+            product_id, name, price, stock = row
+            self._add_scanned(product_id, name, Decimal(str(price)), stock, started)
 
-        # Card-like frame for modern look
-        card = ttk.Frame(popup, style="TFrame", padding="30 20 30 20")
-        card.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+        self.db.submit(
+            find_barcode, code,
+            on_done=found,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not look up barcode {code}: {e}")
+        )
 
-        # Show product image
+    def _add_scanned(self, product_id, name, price, stock, started):
         try:
-            image = Image.open(io.BytesIO(photo_bytes)).resize((130, 130), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            label_img = ttk.Label(card, image=photo, background="#232323")
-            label_img.image = photo  # Keep reference
-            label_img.pack(pady=(0, 15))
-        except Exception as e:
-            ttk.Label(card, text="Image not available", background="#232323", foreground="#f5f5dc").pack(pady=(0, 15))
-
-        # Show product name and price together
-        ttk.Label(card, text=f"{name}   {price:.2f} €", font=("Segoe UI", 16, "bold"), background="#232323", foreground="#f5f5dc").pack(pady=(0, 18))
-
-        # Size selection
-        size_frame = ttk.LabelFrame(card, text="Size", padding=10, style="TFrame")
-        size_frame.pack(fill=tk.X, padx=5, pady=7)
-        size_var = tk.StringVar(value="Medium")
-        for size in ["Small", "Medium", "Large"]:
-            ttk.Radiobutton(size_frame, text=size, variable=size_var, value=size, style="TRadiobutton").pack(anchor=tk.W, padx=5, pady=2)
-
-        # State selection
-        state_frame = ttk.LabelFrame(card, text="State", padding=10, style="TFrame")
-        state_frame.pack(fill=tk.X, padx=5, pady=7)
-        state_var = tk.StringVar(value="Hot")
-        for state in ["Hot", "Cold"]:
-            ttk.Radiobutton(state_frame, text=state, variable=state_var, value=state, style="TRadiobutton").pack(anchor=tk.W, padx=5, pady=2)
-
-        # Sugar selection
-        sugar_frame = ttk.LabelFrame(card, text="Sugar", padding=10, style="TFrame")
-        sugar_frame.pack(fill=tk.X, padx=5, pady=7)
-        sugar_var = tk.StringVar(value="Normal")
-        for sugar in ["No Sugar", "Less", "Normal", "Extra"]:
-            ttk.Radiobutton(sugar_frame, text=sugar, variable=sugar_var, value=sugar, style="TRadiobutton").pack(anchor=tk.W, padx=5, pady=2)
-
-        # Spacer to push the button to the bottom (make it dark)
-        spacer = tk.Label(card, bg="#232323")
-        spacer.pack(expand=True, fill=tk.BOTH)
-
-        # Confirm button at the bottom
-        def confirm_and_add_to_cart():
-            # Compose a unique name for the customized product
-            custom_name = name
-            custom_size = size_var.get()
-            custom_state = state_var.get()
-            custom_sugar = sugar_var.get()
-            # Check if already in cart (by all custom fields)
-            for item in self.cart:
-                if (
-                    item["product_id"] == product_id and
-                    item.get("size") == custom_size and
-                    item.get("state") == custom_state and
-                    item.get("sugar") == custom_sugar
-                ):
-                    item["quantity"] += 1
-                    break
-            else:
-                self.cart.append({
-                    "product_id": product_id,
-                    "name": custom_name,
-                    "size": custom_size,
-                    "state": custom_state,
-                    "sugar": custom_sugar,
-                    "price": price,
-                    "quantity": 1
-                })
-            self.update_cart_display()
+            line = self.core.add(product_id, name, price, stock=stock)
+        except OutOfStockError as e:
+            self.root.bell()
+            messagebox.showwarning("Out of Stock", f"Only {e.shortages[0][2]} {name} in stock.")
+            return
+        if "order" in self.pages:
+            self.cart_view.put(line)
             self.update_total_amount()
-            popup.destroy()
+        self.scan_times.append(time.perf_counter() - started)
+        if self.core.use_reservations:
+            # Reserved in the background so scanning never waits; a refused unit is taken back out
+            def reserved(ok):
+                if not ok:
+                    self._scan_refused(line.line_id, name)
+
+            self.db.submit(
+                self.core.reserve, product_id, 1,
+                on_done=reserved, on_error=lambda e: print(f"Could not reserve scanned stock: {e}")
+            )
 
-        confirm_btn = ttk.Button(card, text="Confirm", command=confirm_and_add_to_cart, style="Accent.TButton")
-        confirm_btn.pack(pady=20, side=tk.BOTTOM, fill=tk.X)
+    def _scan_refused(self, line_id, name):
+        line = self.core.take_back(line_id)
+        if line is not None:
+            if "order" in self.pages:
+                if self.core.cart.get(line_id) is None:
+                    self.cart_view.discard(line)
+                else:
+                    self.cart_view.put(line)
+                self.update_total_amount()
+        messagebox.showwarning("Out of Stock", f"No {name} left to sell.")
+
+    def ensure_page(self, page_name):
+        """Returns the frame of a page, building the page the first time it is needed."""
+        page = self.pages.get(page_name)
+        if page is None:
+            page = self.pages[page_name] = ttk.Frame(self.content_frame)
+            with self.startup.phase(f"build {page_name} page"):
+                self.page_builders[page_name](page)
+        return page
 
     def show_page(self, page_name):
         """Show the requested page and hide others. Also highlight the active navbar button."""
         self.current_page = page_name
         for name, frame in self.pages.items():
             frame.pack_forget()
-        self.pages[page_name].pack(fill=tk.BOTH, expand=True)
+        self.ensure_page(page_name).pack(fill=tk.BOTH, expand=True)
         nav_map = {
             "menu": "Menu",
             "order": "Order",
             "stock": "Stock",
+            "history": "History",
+            "reports": "Reports",
+            "diagnostics": "Diagnostics",
             "settings": "Login"
         }
         for key, btn in self.nav_buttons.items():
@@ -485,46 +858,137 @@ class POSApp:
         self.show_page("settings")
 
     def load_products(self, search_term=""):
-        """Loads products from the database into the product_tree, removing duplicates by name."""
-        if not self.db_cursor:
-            messagebox.showerror("Error", "Database not connected.")
+        """Reads the whole catalog again in the background; pages showing it are updated when it arrives."""
+        if SEARCH_SERVER_SIDE:
+            # Very large catalogs are not held in memory; each search asks the database instead
+            if "stock" in self.pages:
+                self.show_products(search_term)
+            return
+        self._catalog_reload = True
+        self._sync_catalog()
+
+    def _catalog_changed(self, product_ids, everything):
+        """Listener callback: products changed in the database, at this terminal or another one."""
+        if everything:
+            # Sent on (re)connecting and when modifiers change, see modifiers.py
+            self.db.submit(
+                load_price_book, on_done=self._set_price_book,
+                on_error=lambda e: print(f"Could not load modifier prices: {e}")
+            )
+        if SEARCH_SERVER_SIDE:
+            # Only the current search results are held, so that search is run again
+            if "stock" in self.pages:
+                self.show_products(self.search_var.get())
+            return
+        self._catalog_reload |= everything
+        self._catalog_dirty |= product_ids
+        self._sync_catalog()
+
+    def _set_price_book(self, book):
+        """Prices lines added from now on with newly loaded modifiers; lines in the cart keep their price."""
+        self.core.prices = book
+        if self.customize_dialog is not None:
+            self.customize_dialog.set_price_book(book)
+
+    def _sync_catalog(self):
+        """Fetches pending catalog changes, one fetch at a time so results are applied in order."""
+        if self._catalog_syncing:
+            return
+        if self._catalog_reload:
+            product_ids = None
+            self._catalog_reload = False
+            self._catalog_dirty = set()
+        elif self._catalog_dirty and self.core.catalog.loaded:
+            product_ids, self._catalog_dirty = self._catalog_dirty, set()
+        else:
             return
+        self._catalog_syncing = True
+        started = time.perf_counter()
+
+        def loaded(rows):
+            self._catalog_syncing = False
+            if product_ids is None:
+                if not self.core.catalog.loaded:
+                    self.startup.add("catalog prefetch (background)", time.perf_counter() - started)
+                self._set_catalog(rows)
+            else:
+                self._merge_catalog_rows(product_ids, rows)
+            self._sync_catalog()
 
-        for i in self.product_tree.get_children():
-            self.product_tree.delete(i)
-        
-        self.products_data.clear()
+        def failed(e):
+            self._catalog_syncing = False
+            if product_ids is None:
+                messagebox.showerror("Database Error", f"Failed to load products: {e}")
+            else:
+                # Fetched again with the next change; a reconnect reloads everything anyway
+                self._catalog_dirty |= product_ids
+                print(f"Could not fetch changed products: {e}")
+
+        # Runs behind the user's back, so it leaves the busy cursor alone
+        self.db.submit(fetch_catalog, product_ids, on_done=loaded, on_error=failed, busy=False)
+
+    def _set_catalog(self, products):
+        """Replaces the catalog with freshly loaded products and redraws the pages showing it."""
+        self.core.catalog.replace(products)
+
+        if self._menu_waiting is not None:
+            parent, self._menu_waiting = self._menu_waiting, None
+            for widget in parent.winfo_children():
+                widget.destroy()
+            self._build_menu_grid(parent, self.core.catalog.in_stock())
+        elif "menu" in self.pages and self.core.catalog.in_stock() != self.menu_products:
+            self._rebuild_menu()
+        if "stock" in self.pages:
+            self.show_products(self.search_var.get())
+
+    def _merge_catalog_rows(self, product_ids, rows):
+        """Applies fetched rows of changed products; ids without a row were deleted.
+
+        Only the widgets of affected products are touched: the stock list is
+        diffed, changed thumbnails are reloaded, and the menu grid is only laid
+        out again when products came into or went out of it.
+        """
+        changes = self.core.catalog.merge(product_ids, rows)
+        if "stock" in self.pages:
+            self.show_products(self.search_var.get())
+        if "menu" in self.pages and self._menu_waiting is None:
+            if changes.menu_changed or changes.new_pictures:
+                # The grid only redraws the tiles in view whose product changed
+                self._rebuild_menu()
+
+    def show_products(self, search_term=""):
+        """Fills the product_tree with the products whose name contains search_term."""
+        if SEARCH_SERVER_SIDE:
+            # Searches may finish out of order; only the latest one is shown
+            self._search_seq += 1
+            seq = self._search_seq
+
+            def show_if_latest(rows):
+                if seq == self._search_seq:
+                    self._show_search_rows(rows)
+
+            self.db.submit(
+                search_products_db, search_term,
+                on_done=show_if_latest,
+                on_error=lambda e: messagebox.showerror("Database Error", f"Failed to search products: {e}")
+            )
+            return
 
-        try:
-            query = "SELECT id, name, price, stock FROM products"
-            params = []
-            if search_term:
-                query += " WHERE name ILIKE %s"
-                params.append(f"%{search_term}%")
-            query += " ORDER BY name ASC"
-            
-            self.db_cursor.execute(query, tuple(params))
-            products = self.db_cursor.fetchall()
-
-            # Remove duplicates by name (keep first occurrence)
-            seen_names = set()
-            unique_products = []
-            for prod in products:
-                if prod[1] not in seen_names:
-                    unique_products.append(prod)
-                    seen_names.add(prod[1])
-            
-            for prod in unique_products:
-                product_id, name, price, stock = prod
-                self.product_tree.insert("", tk.END, values=(name, f"{price:.2f}"))
-                self.products_data[product_id] = {"name": name, "price": Decimal(str(price)), "stock": stock}
-        except psycopg2.Error as e:
-            messagebox.showerror("Database Error", f"Failed to load products: {e}")
+        self.product_view.update(self.core.catalog.search_index.search(search_term))
+
+    def _show_search_rows(self, rows):
+        self.core.catalog.replace_search_results(rows)
+        self.product_view.update(list(self.core.catalog.products))
 
     def filter_products(self, *args):
-        """Filters products in the treeview based on search_var content."""
-        search_term = self.search_var.get()
-        self.load_products(search_term)
+        """Filters the product list once typing in the search box pauses for SEARCH_DEBOUNCE_MS."""
+        if self._search_after_id is not None:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_after_id = None
+        self.show_products(self.search_var.get())
 
     def on_product_select(self, event):
         """Handles selection of a product in the product_tree (optional)."""
@@ -542,158 +1006,137 @@ class POSApp:
             messagebox.showwarning("No Selection", "Please select a product to add.")
             return
 
-        item_values = self.product_tree.item(selected_item_iid, "values")
-        product_id = int(item_values[0])
+        product_id = self.product_view.record(selected_item_iid)
         
-        if product_id not in self.products_data:
+        if product_id not in self.core.catalog.products:
             messagebox.showerror("Error", "Selected product data not found.")
             return
             
-        product = self.products_data[product_id]
+        product = self.core.catalog.products[product_id]
         quantity_to_add = self.quantity_var.get()
-
-        if quantity_to_add <= 0:
-            messagebox.showwarning("Invalid Quantity", "Quantity must be greater than zero.")
+        try:
+            line = self.core.add(product_id, product["name"], product["price"], quantity_to_add)
+        except ValueError as e:
+            messagebox.showwarning("Invalid Quantity", str(e))
             return
-
-        if quantity_to_add > product["stock"]:
-            messagebox.showwarning("Insufficient Stock", f"Only {product['stock']} units of {product['name']} available.")
+        except OutOfStockError as e:
+            _, wanted, available = e.shortages[0]
+            if wanted == quantity_to_add:
+                messagebox.showwarning("Insufficient Stock", f"Only {available} units of {product['name']} available.")
+            else:
+                messagebox.showwarning("Insufficient Stock", f"Cannot add {quantity_to_add} more. Total would exceed stock for {product['name']}.")
             return
 
-        # Check if product already in cart, if so, update quantity
-        existing_cart_item = None
-        for item in self.cart:
-            # Also check for size, state, sugar for uniqueness if present
-            if (
-                item["product_id"] == product_id and
-                item.get("size") is None and
-                item.get("state") is None and
-                item.get("sugar") is None
-            ):
-                existing_cart_item = item
-                break
-        
-        if existing_cart_item:
-            if existing_cart_item["quantity"] + quantity_to_add > product["stock"]:
-                 messagebox.showwarning("Insufficient Stock", f"Cannot add {quantity_to_add} more. Total would exceed stock for {product['name']}.")
-                 return
-            existing_cart_item["quantity"] += quantity_to_add
-        else:
-            self.cart.append({
-                "product_id": product_id,
-                "name": product["name"],
-                "size": None,
-                "state": None,
-                "sugar": None,
-                "price": product["price"],
-                "quantity": quantity_to_add
-            })
-        
         self.quantity_var.set(1) # Reset quantity spinbox
-        self.update_cart_display()
+        self.cart_view.put(line)
         self.update_total_amount()
 
     def update_cart_display(self):
         """Updates the cart_tree display with current cart items, including size, state, sugar."""
-        for i in self.cart_tree.get_children():
-            self.cart_tree.delete(i)
-        
-        for item in self.cart:
-            subtotal = item["price"] * item["quantity"]
-            self.cart_tree.insert(
-                "", tk.END,
-                values=(
-                    item['name'],
-                    item.get('size', ''),
-                    item.get('state', ''),
-                    item.get('sugar', ''),
-                    f"{item['price']:.2f}",
-                    item["quantity"],
-                    f"{subtotal:.2f}"
-                )
-            )
+        self.cart_view.update(self.core.cart)
+
+    def _cart_row(self, line):
+        return (
+            line.name,
+            line.size or "",
+            line.state or "",
+            line.sugar or "",
+            f"{line.price:.2f}",
+            line.quantity,
+            f"{line.subtotal:.2f}"
+        )
 
     def remove_from_cart(self):
-        """Removes the selected item from the cart."""
+        """Removes the selected line from the cart."""
         selected_item_iid = self.cart_tree.focus()
         if not selected_item_iid:
             messagebox.showwarning("No Selection", "Please select an item from the cart to remove.")
             return
 
-        # Find the item in the self.cart list based on selection in treeview
-        # This is a bit indirect; a better way would be to store cart item IDs or indices
-        selected_values = self.cart_tree.item(selected_item_iid, "values")
-        if not selected_values: return
-
-        item_name_to_remove = selected_values[0]
-        item_quantity_to_remove = int(selected_values[5]) # Assuming name and quantity make it unique enough for this example
-
-        item_to_remove = None
-        for item in self.cart:
-            if item["name"] == item_name_to_remove and item["quantity"] == item_quantity_to_remove:
-                # For simplicity, removing the first match. For identical items with different entries, this might need refinement.
-                item_to_remove = item
-                break
-        
-        if item_to_remove:
-            self.cart.remove(item_to_remove)
-            self.update_cart_display()
-            self.update_total_amount()
-        else:
+        # The row iid is the cart line id, so the exact line is removed
+        line = self.cart_view.record(selected_item_iid)
+        if line is None or self.core.cart.get(line.line_id) is None:
             messagebox.showerror("Error", "Could not find the selected item in the cart data.")
+            return
+        self.core.remove(line.line_id)
+        self.cart_view.discard(line)
+        self.update_total_amount()
+        if self.core.use_reservations:
+            self.db.submit(
+                self.core.release, line.product_id, line.quantity,
+                on_error=lambda e: print(f"Could not release reserved stock: {e}")
+            )
 
     def update_total_amount(self):
-        """Calculates and updates the total amount for the cart."""
-        total = sum(item["price"] * item["quantity"] for item in self.cart)
-        self.total_amount_var.set(f"{total:.2f}")
+        """Shows the cart total, which the cart keeps up to date on every change."""
+        self.total_amount_var.set(f"{self.core.cart.total:.2f}")
 
     def checkout(self):
         """Handles checkout: show a message, clear the cart, and update stock in the database and stock page."""
-        if not self.cart:
+        if not self.core.cart:
             messagebox.showinfo("Empty Cart", "Cannot checkout with an empty cart.")
             return
 
-        # Update stock in the database for each product in the cart
-        for item in self.cart:
-            product_id = item["product_id"]
-            quantity = item["quantity"]
-            if product_id in self.products_data and self.products_data[product_id]["stock"] is not None:
-                self.db_cursor.execute(
-                    "UPDATE products SET stock = GREATEST(stock - %s, 0) WHERE id = %s",
-                    (quantity, product_id)
-                )
-                self.db_conn.commit()
-
-        # Save checkout to history table
-        try:
-            import datetime
-            items_str = "; ".join(
-                f"{item['name']} x{item['quantity']}" +
-                (f" [{item.get('size','')}/{item.get('state','')}/{item.get('sugar','')}]" if item.get('size') else "")
-                for item in self.cart
-            )
-            total = sum(item["price"] * item["quantity"] for item in self.cart)
-            self.db_cursor.execute(
-                "INSERT INTO history (date, items, total) VALUES (%s, %s, %s)",
-                (datetime.datetime.now(), items_str, total)
-            )
-            self.db_conn.commit()
-        except Exception as e:
-            messagebox.showerror("History Error", f"Could not save checkout history: {e}")
+        # Stock, sale and sale lines are written in one transaction with a single commit
+        checked_out, lines = self.core.sale_lines()
+        self.checkout_button.state(["disabled"])
+        self.checkouts.submit(
+            self.recorder.record, lines, self.core.holder,
+            on_done=lambda result: self._checkout_done(checked_out, result),
+            on_error=self._checkout_failed,
+            with_connection=False
+        )
 
-        # Refresh the stock page display (this reloads from DB)
-        self.load_products(self.search_var.get())
+    def _checkout_done(self, checked_out, result):
+        sale_id, elapsed = result
+        self.checkout_button.state(["!disabled"])
+        if sale_id is None:
+            print(f"Checkout: saved offline, {len(checked_out)} line(s), {elapsed * 1000:.1f} ms")
+        else:
+            print(f"Checkout: sale #{sale_id}, {len(checked_out)} line(s), {elapsed * 1000:.1f} ms")
+            # Stock changes come back as a catalog notification, see _catalog_changed
+            self.refresh_history()
 
-        # Clear the cart and update UI
-        self.cart.clear()
+        self.core.finish_checkout(checked_out)
         self.update_cart_display()
         self.update_total_amount()
         messagebox.showinfo("Checkout Complete", "Checkout complete!")
 
+    def _checkout_failed(self, e):
+        self.checkout_button.state(["!disabled"])
+        if isinstance(e, OutOfStockError):
+            names = {line.product_id: line.name for line in self.core.cart}
+            short = "\n".join(
+                f"{names.get(product_id, product_id)}: {wanted} in the cart, {available} in stock"
+                for product_id, wanted, available in e.shortages
+            )
+            messagebox.showerror("Not Enough Stock", f"Nothing was charged. Please adjust the cart:\n{short}")
+            return
+        messagebox.showerror("Checkout Error", f"Could not save the sale, nothing was charged: {e}")
+
     def on_closing(self):
         """Handles window close event."""
-        if self.db_conn:
-            self.db_conn.close()
+        self.image_loader.shutdown()
+        self.catalog_listener.stop()
+        if self.db:
+            if self.core.use_reservations:
+                try:
+                    with self.pool.connection(retries=0) as conn:
+                        self.core.release_all(conn)
+                except Exception as e:
+                    print(f"Could not release reserved stock, it expires on its own: {e}")
+            self.recorder.stop()
+            self.journal.close()
+            self.checkouts.shutdown()
+            self.db.shutdown()
+            self.exports.shutdown()  # An export already running still finishes its file
+            print(f"Connection pool: {self.pool.stats()}")
+            try:
+                query_stats.dump_json(QUERY_STATS_PATH, {"pool": self.pool.stats(), "startup": self.startup.as_dict()})
+                print(f"Query statistics saved to {QUERY_STATS_PATH}")
+            except OSError as e:
+                print(f"Could not save query statistics: {e}")
+            self.pool.closeall()
             print("Database connection closed.")
         self.root.destroy()
 
@@ -730,34 +1173,42 @@ class POSApp:
             if not user_id or not password:
                 messagebox.showwarning("Input Error", "Please enter both User ID and Password.")
                 return
-            try:
-                self.db_cursor.execute(
-                    "SELECT id FROM users WHERE id = %s AND password = %s",
-                    (user_id, password)
-                )
-                result = self.db_cursor.fetchone()
-                if result:
-                    self.current_user = user_id  # Set current user
-                    self.update_user_label()     # Update label in navbar
-                    for key in ("Menu", "Order", "Stock"):
-                        self.nav_buttons[key].pack(fill=tk.X, pady=12, ipadx=10, ipady=12)
-                    self.nav_buttons["Login"].pack_forget()
-                    self.nav_buttons["Logout"].pack(fill=tk.X, pady=12, ipadx=10, ipady=12)
-                    self.show_menu_page()
-                else:
-                    messagebox.showerror("Login Failed", "Invalid User ID or Password.")
-            except psycopg2.Error as e:
-                messagebox.showerror("Database Error", f"Login failed: {e}")
+            login_btn.state(["disabled"])
+            self.db.submit(
+                fetchone, "SELECT id FROM users WHERE id = %s AND password = %s", (user_id, password),
+                on_done=lambda result: login_finished(user_id, result),
+                on_error=login_failed
+            )
+
+        def login_finished(user_id, result):
+            login_btn.state(["!disabled"])
+            if result:
+                self.current_user = user_id  # Set current user
+                self.update_user_label()     # Update label in navbar
+                for key in ("Menu", "Order", "Stock", "History", "Reports", "Diagnostics"):
+                    self.nav_buttons[key].pack(fill=tk.X, pady=12, ipadx=10, ipady=12)
+                self.nav_buttons["Login"].pack_forget()
+                self.nav_buttons["Logout"].pack(fill=tk.X, pady=12, ipadx=10, ipady=12)
+                self.show_menu_page()
+            else:
+                messagebox.showerror("Login Failed", "Invalid User ID or Password.")
+
+        def login_failed(e):
+            login_btn.state(["!disabled"])
+            messagebox.showerror("Database Error", f"Login failed: {e}")
 
         login_btn = ttk.Button(card, text="Login", command=attempt_login, style="Accent.TButton")
         login_btn.pack(pady=20, fill=tk.X)
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    try:
-        root.state('zoomed')  # Works on Windows, some Linux
-    except tk.TclError:
-        root.attributes('-zoomed', True)  # Works on some Linux (like GNOME)
-    app = POSApp(root)
+    startup = PhaseTimer(_STARTED)
+    startup.add("imports", _IMPORTED - _STARTED)
+    with startup.phase("main window"):
+        root = tk.Tk()
+        try:
+            root.state('zoomed')  # Works on Windows, some Linux
+        except tk.TclError:
+            root.attributes('-zoomed', True)  # Works on some Linux (like GNOME)
+    app = POSApp(root, startup)
     root.protocol("WM_DELETE_WINDOW", app.on_closing) # Handle window close gracefully
     root.mainloop()
@@ -0,0 +1,81 @@
+"""Case-insensitive product search over the catalog held in memory.
+
+Every 1-, 2- and 3-character substring of a lowered product name is mapped to
+the products containing it, so queries up to three characters are a single
+lookup and longer ones check only the products listed under their rarest
+trigram. Names starting with the query are listed first, each group in
+name order, using bisect over the sorted names.
+
+For catalogs too large to keep in memory, search_products_db() runs the same
+substring search in PostgreSQL, backed by the pg_trgm index from tbt.txt.
+"""
+from bisect import bisect_left
+
+MAX_GRAM = 3
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class ProductSearchIndex:
+    def __init__(self, products=()):
+        self.build(products)
+
+    def build(self, products):
+        """Indexes (product_id, name) pairs; replaces any previous contents."""
+        entries = sorted(((name.lower(), product_id) for product_id, name in products))
+        self._names = [name for name, _ in entries]
+        self._ids = [product_id for _, product_id in entries]
+        self._postings = {}
+        for position, name in enumerate(self._names):
+            for n in range(1, MAX_GRAM + 1):
+                for gram in _grams(name, n):
+                    self._postings.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def search(self, term):
+        """Returns the ids of products whose name contains `term`, prefix matches first."""
+        term = term.strip().lower()
+        if not term:
+            return list(self._ids)
+
+        if len(term) <= MAX_GRAM:
+            positions = self._postings.get(term, [])
+        else:
+            # The rarest trigram bounds the candidates; a substring check settles the rest
+            rarest = None
+            for gram in _grams(term, MAX_GRAM):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    return []
+                if rarest is None or len(posting) < len(rarest):
+                    rarest = posting
+            names = self._names
+            positions = [p for p in rarest if term in names[p]]
+
+        # Names are sorted, so the ones starting with the term form one contiguous run
+        start = bisect_left(self._names, term)
+        end = bisect_left(self._names, term + "\uffff", start)
+        ids = self._ids
+        if start == end:
+            return [ids[p] for p in positions]
+        return ids[start:end] + [ids[p] for p in positions if p < start or p >= end]
+
+
+def search_products_db(conn, term, limit=500):
+    """Server-side substring search; returns [(id, name, price, stock)] ordered by name."""
+    pattern = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, name, price, stock FROM products
+            WHERE name ILIKE %s
+            ORDER BY name ASC
+            LIMIT %s
+            """,
+            (f"%{pattern}%", limit)
+        )
+        return cursor.fetchall()
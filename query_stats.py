@@ -0,0 +1,261 @@
+"""Timing and counting every SQL statement.
+
+Connections opened through db.py use InstrumentedCursor, so every statement
+that reaches PostgreSQL is recorded in `query_stats` without touching the
+call sites: app queries, photo fetches, checkout writes, journal replay and
+the command line scripts. Statements are grouped by their text with
+literals replaced by "?". Each group keeps a latency histogram, the rows
+returned or affected, the bytes sent (the SQL after parameters are bound)
+and the bytes received (the size of the fetched values, so BYTEA photos
+count in full).
+
+For named (server-side) cursors, the time spent fetching counts towards
+the statement. A statement's figures are recorded when the cursor runs its
+next statement or is closed. Statements slower than SLOW_QUERY_MS are
+appended to SLOW_QUERY_LOG_PATH. Parameters are never logged, because the
+login query carries a password.
+"""
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from psycopg2 import extensions
+
+from config import SLOW_QUERY_MS, SLOW_QUERY_LOG_PATH, QUERY_STATS_MEASURE_BYTES
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+MAX_STATEMENTS = 500  # Further distinct statements are counted together as OTHER_STATEMENT
+OTHER_STATEMENT = "(other statements)"
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ROW_LISTS = re.compile(r"(\((?:[^()]|\([^()]*\))*\))(?:,\s*\((?:[^()]|\([^()]*\))*\))+")
+_SPACES = re.compile(r"\s+")
+_SIZED = {bytes, bytearray, memoryview, str}
+
+
+def normalize(query):
+    """The grouping key of a statement: literals become "?" and multi-row VALUES lists one row."""
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)  # psycopg2.sql.Composed and the like
+    query = _LITERALS.sub("?", query)
+    query = _ROW_LISTS.sub(r"\1, ...", query)
+    return _SPACES.sub(" ", query).strip()
+
+
+def _rows_size(rows):
+    """Approximate bytes received for `rows`: the length of text and binary values, 8 for the rest."""
+    sized = [len(value) for row in rows for value in row if type(value) in _SIZED]
+    cells = sum(map(len, rows))
+    return sum(sized) + 8 * (cells - len(sized))
+
+
+class _Statement:
+    __slots__ = ("calls", "errors", "total_s", "max_s", "buckets", "rows", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def percentile_ms(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of calls."""
+        if not self.calls:
+            return 0.0
+        wanted = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max_s * 1000)
+        return self.max_s * 1000
+
+
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_path=SLOW_QUERY_LOG_PATH):
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self.slow_count = 0
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._keys = {}  # query template -> normalized key, for queries sent with parameters
+        self.started = datetime.now()
+
+    def key(self, query, vars=None):
+        """Grouping key of `query`; templates sent with parameters are normalized once."""
+        if vars is None:
+            return normalize(query)  # execute_values and the like send a different text every time
+        key = self._keys.get(query)
+        if key is None:
+            if len(self._keys) > 4 * MAX_STATEMENTS:
+                self._keys.clear()
+            key = self._keys[query] = normalize(query)
+        return key
+
+    def record(self, key, elapsed, rows=0, bytes_in=0, bytes_out=0, error=False):
+        ms = elapsed * 1000
+        bucket = bisect_left(LATENCY_BUCKETS_MS, ms)
+        with self._lock:
+            stat = self._statements.get(key)
+            if stat is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENT
+                stat = self._statements.setdefault(key, _Statement())
+            stat.calls += 1
+            stat.errors += error
+            stat.total_s += elapsed
+            stat.max_s = max(stat.max_s, elapsed)
+            stat.buckets[bucket] += 1
+            stat.rows += rows
+            stat.bytes_in += bytes_in
+            stat.bytes_out += bytes_out
+            slow = ms >= self.slow_ms
+            self.slow_count += slow
+        if slow:
+            self._log_slow(key, ms, rows, bytes_in, error)
+
+    def _log_slow(self, key, ms, rows, bytes_in, error):
+        line = (f"{datetime.now().isoformat(timespec='milliseconds')}\t{ms:.1f} ms\t{rows} rows\t"
+                f"{bytes_in} bytes{' FAILED' if error else ''}\t{key}\n")
+        print(f"Slow query ({ms:.0f} ms): {key[:120]}")
+        try:
+            os.makedirs(os.path.dirname(self.slow_log_path), exist_ok=True)
+            with open(self.slow_log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Could not write the slow query log: {e}")
+
+    def snapshot(self):
+        """Per-statement figures, the statements with the most total time first."""
+        with self._lock:
+            items = list(self._statements.items())
+            rows = []
+            for key, stat in items:
+                rows.append({
+                    "statement": key,
+                    "calls": stat.calls,
+                    "errors": stat.errors,
+                    "total_ms": round(stat.total_s * 1000, 3),
+                    "mean_ms": round(stat.total_s * 1000 / stat.calls, 3),
+                    "p50_ms": round(stat.percentile_ms(0.50), 3),
+                    "p95_ms": round(stat.percentile_ms(0.95), 3),
+                    "p99_ms": round(stat.percentile_ms(0.99), 3),
+                    "max_ms": round(stat.max_s * 1000, 3),
+                    "rows": stat.rows,
+                    "bytes_in": stat.bytes_in,
+                    "bytes_out": stat.bytes_out,
+                    "histogram_ms": {
+                        ("inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in zip(LATENCY_BUCKETS_MS, stat.buckets)
+                    },
+                })
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def dump_json(self, path, extra=None):
+        """Writes the snapshot, plus any `extra` top-level fields, as JSON to `path`."""
+        report = {
+            "since": self.started.isoformat(timespec="seconds"),
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "slow_query_ms": self.slow_ms,
+            "slow_queries": self.slow_count,
+            "statements": self.snapshot(),
+        }
+        report.update(extra or {})
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self.slow_count = 0
+            self.started = datetime.now()
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(extensions.cursor):
+    """Cursor that reports each statement it runs to query_stats."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sample = None  # [key, seconds, rows, bytes_in, bytes_out] of the statement being read
+
+    def _timed(self, method, query, vars):
+        self._flush()
+        key = query_stats.key(query, vars)
+        start = time.perf_counter()
+        try:
+            result = method(query, vars)
+        except Exception:
+            query_stats.record(key, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        # Named cursors only declare the query here; their rows are counted as they are fetched
+        rows = max(self.rowcount, 0) if self.name is None else 0
+        self._sample = [key, elapsed, rows, 0, len(self.query or b"")]
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def _fetched(self, start, rows):
+        sample = self._sample
+        if sample is None:
+            return
+        sample[1] += time.perf_counter() - start
+        if self.name is not None:
+            sample[2] += len(rows)
+        if QUERY_STATS_MEASURE_BYTES:
+            sample[3] += _rows_size(rows)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, () if row is None else (row,))
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        self._fetched(start, rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, rows)
+        return rows
+
+    def __iter__(self):
+        # Named cursors fetch `itersize` rows per round trip, like the plain cursor does
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def _flush(self):
+        if self._sample is not None:
+            query_stats.record(*self._sample)
+            self._sample = None
+
+    def close(self):
+        self._flush()
+        super().close()
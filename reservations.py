@@ -0,0 +1,124 @@
+"""Short-lived stock reservations.
+
+With STOCK_RESERVATIONS on, a terminal holds stock for an item while it
+sits in the cart. products.reserved counts the units held by all terminals.
+stock_reservations records who holds them: one row per (holder, product)
+with an expiry. Checkout (sales.take_stock) uses up the holder's
+reservations for the units it sells. release() and release_all() give
+them back when an item is removed or the user logs out. release_expired()
+gives back the reservations of terminals that went away; every terminal
+runs it periodically.
+
+Every operation touches only the rows of the products involved, so
+terminals selling different products never wait for each other. Locks are
+always taken on reservation rows first and then on product rows in id
+order, the order checkout uses too.
+"""
+from psycopg2.extras import execute_values
+
+from config import RESERVATION_TTL_S
+
+
+def reserve(conn, holder, product_id, quantity, ttl_s=RESERVATION_TTL_S):
+    """Database job: holds `quantity` more units for `holder`; returns False if not enough are free."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO stock_reservations (holder, product_id, quantity, expires_at)
+            VALUES (%s, %s, %s, LOCALTIMESTAMP + %s * interval '1 second')
+            ON CONFLICT (holder, product_id) DO UPDATE SET
+                quantity = stock_reservations.quantity + EXCLUDED.quantity,
+                expires_at = EXCLUDED.expires_at
+        """, (holder, product_id, quantity, ttl_s))
+        cur.execute("""
+            UPDATE products SET reserved = reserved + %s
+            WHERE id = %s AND stock - reserved >= %s
+        """, (quantity, product_id, quantity))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+    return True
+
+
+def consume(cur, holder, quantities):
+    """Uses up the holder's reservations for sold `quantities`, {product_id: quantity}; returns {product_id: units used}.
+
+    Only the sold units are used: a reservation for more than was sold keeps
+    the rest, and its row goes only when nothing is left. Runs in the
+    checkout transaction, which takes the used units off products.reserved
+    together with the sold units off products.stock.
+    """
+    cur.execute("""
+        SELECT product_id, quantity FROM stock_reservations
+        WHERE holder = %s AND product_id = ANY(%s)
+        ORDER BY product_id FOR UPDATE
+    """, (holder, sorted(quantities)))
+    used = {product_id: min(held, quantities[product_id]) for product_id, held in cur.fetchall()}
+    if used:
+        cur.execute("""
+            UPDATE stock_reservations AS r SET quantity = r.quantity - v.quantity
+            FROM unnest(%s::int[], %s::int[]) AS v(product_id, quantity)
+            WHERE r.holder = %s AND r.product_id = v.product_id
+        """, (list(used), list(used.values()), holder))
+        cur.execute("""
+            DELETE FROM stock_reservations WHERE holder = %s AND product_id = ANY(%s) AND quantity <= 0
+        """, (holder, list(used)))
+    return used
+
+
+def _give_back(cur, rows):
+    """Takes released (product_id, quantity) rows off products.reserved."""
+    released = {}
+    for product_id, quantity in rows:
+        released[product_id] = released.get(product_id, 0) + quantity
+    if not released:
+        return 0
+    product_ids = sorted(released)
+    cur.execute("SELECT id FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (product_ids,))
+    execute_values(
+        cur,
+        """
+        UPDATE products AS p SET reserved = GREATEST(p.reserved - v.quantity, 0)
+        FROM (VALUES %s) AS v(id, quantity)
+        WHERE p.id = v.id
+        """,
+        [(product_id, released[product_id]) for product_id in product_ids],
+        template="(%s::int, %s::int)",
+        page_size=len(product_ids)
+    )
+    return sum(released.values())
+
+
+def release(conn, holder, product_id, quantity):
+    """Database job: gives back up to `quantity` units the holder reserved; returns how many."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT quantity FROM stock_reservations WHERE holder = %s AND product_id = %s FOR UPDATE
+        """, (holder, product_id))
+        row = cur.fetchone()
+        if row is None:
+            return 0
+        released = min(row[0], quantity)
+        if released == row[0]:
+            cur.execute("DELETE FROM stock_reservations WHERE holder = %s AND product_id = %s", (holder, product_id))
+        else:
+            cur.execute("""
+                UPDATE stock_reservations SET quantity = quantity - %s WHERE holder = %s AND product_id = %s
+            """, (released, holder, product_id))
+        return _give_back(cur, [(product_id, released)])
+
+
+def release_all(conn, holder):
+    """Database job: gives back everything the holder reserved; returns the number of units."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM stock_reservations WHERE holder = %s RETURNING product_id, quantity", (holder,))
+        return _give_back(cur, cur.fetchall())
+
+
+def release_expired(conn):
+    """Database job: gives back reservations past their expiry; returns the number of units."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM stock_reservations WHERE expires_at < LOCALTIMESTAMP
+            RETURNING product_id, quantity
+        """)
+        return _give_back(cur, cur.fetchall())
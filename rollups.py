@@ -0,0 +1,261 @@
+"""Sales rollups for the Reports page.
+
+Four small tables hold running totals: sales per hour and per day, and
+quantity and revenue per product per hour and per day. apply_sale() adds a
+sale to them inside the checkout transaction, so they are always exactly as
+current as sales/sale_items, and reports read a few hundred rollup rows
+instead of scanning sale_items. Every checkout would update the same hour
+and day row, so the sales totals are split into ROLLUP_SHARDS rows per
+hour and day, one chosen by the checkout's connection, and reports add the
+shards up. Terminals that check out at the same time then rarely wait for
+each other's totals row. If the rollups ever drift (sales deleted or
+edited by hand, tables created after sales already existed), rebuild them
+from the raw tables with:
+
+    python rollups.py --rebuild
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+from config import ROLLUP_REBUILD_BATCH_DAYS, ROLLUP_SHARDS
+from db import connect
+from partitions import oldest_month
+
+ROLLUP_TABLES = ("sales_hourly", "sales_daily", "product_hourly", "product_daily")
+
+# Longest range, in days, that the Reports page charts by hour instead of by day
+HOURLY_RANGE_DAYS = 2
+
+
+def ensure_rollup_schema(cur):
+    """Creates the rollup tables if they do not exist yet, and shards older totals tables (see also tbt.txt)."""
+    for table, bucket, column in (("sales_hourly", "hour TIMESTAMP", "hour"), ("sales_daily", "day DATE", "day")):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {bucket} NOT NULL,
+                shard SMALLINT NOT NULL DEFAULT 0,
+                sales_count INT NOT NULL,
+                items_count INT NOT NULL,
+                revenue NUMERIC(14, 2) NOT NULL,
+                PRIMARY KEY ({column}, shard)
+            )
+        """)
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'shard'", (table,)
+        )
+        if cur.fetchone() is None:
+            # Tables from before sharding: their rows become shard 0
+            cur.execute(f"""
+                ALTER TABLE {table} ADD COLUMN shard SMALLINT NOT NULL DEFAULT 0,
+                    DROP CONSTRAINT {table}_pkey, ADD PRIMARY KEY ({column}, shard)
+            """)
+    for table, bucket, column in (("product_hourly", "hour TIMESTAMP", "hour"), ("product_daily", "day DATE", "day")):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {bucket} NOT NULL,
+                product_id INT NOT NULL,
+                quantity INT NOT NULL,
+                revenue NUMERIC(14, 2) NOT NULL,
+                PRIMARY KEY ({column}, product_id)
+            )
+        """)
+
+
+def apply_sale(cur, sale_timestamp, lines):
+    """Adds one sale to every rollup; runs in the caller's (checkout) transaction.
+
+    `lines` holds (product_id, quantity, price, options) tuples. The totals
+    go to the shard of this connection's backend, so concurrent checkouts
+    update different rows. Rows are locked in the same order by every
+    checkout (totals first, then products by id), so checkouts that do share
+    rows queue instead of deadlocking.
+    """
+    per_product = {}
+    for product_id, quantity, price, _ in lines:
+        qty, revenue = per_product.get(product_id, (0, Decimal("0.00")))
+        per_product[product_id] = (qty + quantity, revenue + Decimal(str(price)) * quantity)
+    items = sum(qty for qty, _ in per_product.values())
+    revenue = sum((rev for _, rev in per_product.values()), Decimal("0.00"))
+
+    for table, bucket, expr in (("sales_hourly", "hour", "date_trunc('hour', %s::timestamp)"),
+                                ("sales_daily", "day", "%s::date")):
+        cur.execute(f"""
+            INSERT INTO {table} ({bucket}, shard, sales_count, items_count, revenue)
+            VALUES ({expr}, pg_backend_pid() %% %s, 1, %s, %s)
+            ON CONFLICT ({bucket}, shard) DO UPDATE SET
+                sales_count = {table}.sales_count + 1,
+                items_count = {table}.items_count + EXCLUDED.items_count,
+                revenue = {table}.revenue + EXCLUDED.revenue
+        """, (sale_timestamp, ROLLUP_SHARDS, items, revenue))
+
+    rows = [(sale_timestamp, product_id, qty, rev) for product_id, (qty, rev) in sorted(per_product.items())]
+    for table, bucket, expr in (("product_hourly", "hour", "date_trunc('hour', %s::timestamp)"),
+                                ("product_daily", "day", "%s::date")):
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO {table} ({bucket}, product_id, quantity, revenue) VALUES %s
+            ON CONFLICT ({bucket}, product_id) DO UPDATE SET
+                quantity = {table}.quantity + EXCLUDED.quantity,
+                revenue = {table}.revenue + EXCLUDED.revenue
+            """,
+            rows,
+            template=f"({expr}, %s, %s, %s)",
+            page_size=len(rows)
+        )
+
+
+def _rebuild_range(cur, start, end):
+    """Recomputes every rollup row for sales in [start, end).
+
+    The range is given for sale_items as well as sales, so only the
+    partitions of those months are read from either table.
+    """
+    # Checkouts that add to the rollups wait for this transaction, and this one waits for
+    # checkouts that already did, so no sale is counted twice or missed.
+    cur.execute(f"LOCK TABLE {', '.join(ROLLUP_TABLES)} IN SHARE ROW EXCLUSIVE MODE")
+    for table in ("sales_hourly", "product_hourly"):
+        cur.execute(f"DELETE FROM {table} WHERE hour >= %s AND hour < %s", (start, end))
+    for table in ("sales_daily", "product_daily"):
+        cur.execute(f"DELETE FROM {table} WHERE day >= %s AND day < %s", (start, end))
+
+    # Rebuilt totals go to shard 0; checkouts add to the other shards again from then on
+    for table, bucket, expr in (("sales_hourly", "hour", "date_trunc('hour', s.sale_timestamp)"),
+                                ("sales_daily", "day", "s.sale_timestamp::date")):
+        cur.execute(f"""
+            INSERT INTO {table} ({bucket}, sales_count, items_count, revenue)
+            SELECT {expr}, count(*), sum(i.items), sum(i.revenue)
+            FROM sales s
+            JOIN (SELECT sale_id, sale_timestamp, sum(quantity) AS items, sum(quantity * price_at_sale) AS revenue
+                  FROM sale_items
+                  WHERE sale_timestamp >= %(start)s AND sale_timestamp < %(end)s
+                  GROUP BY sale_id, sale_timestamp) i ON i.sale_id = s.id AND i.sale_timestamp = s.sale_timestamp
+            WHERE s.sale_timestamp >= %(start)s AND s.sale_timestamp < %(end)s
+            GROUP BY 1
+        """, {"start": start, "end": end})
+    for table, bucket, expr in (("product_hourly", "hour", "date_trunc('hour', s.sale_timestamp)"),
+                                ("product_daily", "day", "s.sale_timestamp::date")):
+        cur.execute(f"""
+            INSERT INTO {table} ({bucket}, product_id, quantity, revenue)
+            SELECT {expr}, si.product_id, sum(si.quantity), sum(si.quantity * si.price_at_sale)
+            FROM sales s JOIN sale_items si ON si.sale_id = s.id AND si.sale_timestamp = s.sale_timestamp
+            WHERE s.sale_timestamp >= %(start)s AND s.sale_timestamp < %(end)s
+              AND si.sale_timestamp >= %(start)s AND si.sale_timestamp < %(end)s
+            GROUP BY 1, 2
+        """, {"start": start, "end": end})
+
+
+def rebuild_rollups(conn, batch_days=ROLLUP_REBUILD_BATCH_DAYS):
+    """Recomputes the rollups from sales and sale_items, `batch_days` days per transaction.
+
+    Checkouts keep working during a rebuild; each one waits at most for the
+    batch being rewritten. Returns the number of batches.
+    """
+    with conn.cursor() as cur:
+        ensure_rollup_schema(cur)
+        cur.execute("SELECT min(sale_timestamp)::date, max(sale_timestamp)::date FROM sales")
+        first, last = cur.fetchone()
+    conn.commit()
+
+    batches = 0
+    if first is not None:
+        start = first
+        while start <= last:
+            end = start + timedelta(days=batch_days)
+            with conn.cursor() as cur:
+                _rebuild_range(cur, start, end)
+            conn.commit()
+            batches += 1
+            print(f"Rebuilt rollups for {start} .. {end - timedelta(days=1)}")
+            start = end
+
+    # Drop rows left over from sales that no longer exist outside the rebuilt span. Months
+    # detached from sales (see partitions.py) keep their rollups, which are all that is left of them.
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {', '.join(ROLLUP_TABLES)} IN SHARE ROW EXCLUSIVE MODE")
+        kept = oldest_month(cur, "sales") or date.min
+        lower, upper = (first, start) if first is not None else (date.max, date.max)
+        for table, bucket in (("sales_hourly", "hour"), ("product_hourly", "hour"),
+                              ("sales_daily", "day"), ("product_daily", "day")):
+            cur.execute(
+                f"DELETE FROM {table} WHERE ({bucket} >= %s AND {bucket} < %s) OR {bucket} >= %s",
+                (kept, lower, upper)
+            )
+    conn.commit()
+    return batches
+
+
+def load_report(conn, date_from, date_to, top_products=20):
+    """Database job: the report for the inclusive date range, read from the rollups only.
+
+    Returns a dict with "summary" (sales, items, revenue), "series" rows of
+    (bucket, sales, revenue) by hour for short ranges and by day otherwise,
+    "hourly" telling which, "products" rows of (name, quantity, revenue) and
+    "elapsed" seconds.
+    """
+    start = time.perf_counter()
+    end = date_to + timedelta(days=1)
+    hourly = (end - date_from).days <= HOURLY_RANGE_DAYS
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(sum(sales_count), 0), COALESCE(sum(items_count), 0), COALESCE(sum(revenue), 0)
+            FROM sales_daily WHERE day >= %s AND day < %s
+        """, (date_from, end))
+        summary = cur.fetchone()
+        if hourly:
+            cur.execute("""
+                SELECT hour, sum(sales_count), sum(revenue) FROM sales_hourly
+                WHERE hour >= %s AND hour < %s GROUP BY hour ORDER BY hour
+            """, (date_from, end))
+        else:
+            cur.execute("""
+                SELECT day, sum(sales_count), sum(revenue) FROM sales_daily
+                WHERE day >= %s AND day < %s GROUP BY day ORDER BY day
+            """, (date_from, end))
+        series = cur.fetchall()
+        cur.execute("""
+            SELECT COALESCE(p.name, '#' || r.product_id), r.quantity, r.revenue
+            FROM (SELECT product_id, sum(quantity) AS quantity, sum(revenue) AS revenue
+                  FROM product_daily WHERE day >= %s AND day < %s
+                  GROUP BY product_id ORDER BY revenue DESC LIMIT %s) r
+            LEFT JOIN products p ON p.id = r.product_id
+            ORDER BY r.revenue DESC
+        """, (date_from, end, top_products))
+        products = cur.fetchall()
+    return {
+        "summary": summary,
+        "series": series,
+        "hourly": hourly,
+        "products": products,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the sales rollup tables used by the Reports page.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every rollup from sales and sale_items")
+    parser.add_argument("--batch-days", type=int, default=ROLLUP_REBUILD_BATCH_DAYS,
+                        help="days of sales recomputed per transaction")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.rebuild:
+            started = time.perf_counter()
+            batches = rebuild_rollups(conn, args.batch_days)
+            print(f"Rollups rebuilt in {batches} batch(es), {time.perf_counter() - started:.1f} s.")
+        else:
+            with conn.cursor() as cur:
+                ensure_rollup_schema(cur)
+            conn.commit()
+            print("Rollup tables are in place; use --rebuild to recompute them.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
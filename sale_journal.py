@@ -0,0 +1,191 @@
+"""Selling through database outages.
+
+SaleJournal is a local SQLite file, written with synchronous=FULL so an
+accepted sale survives a crash or power loss. SaleRecorder sends each sale
+to PostgreSQL when it can, and appends it to the journal when the server is
+unreachable or older sales are still waiting, so sales reach the database
+in the order they were made. A replayer thread drains the journal in
+batches, one transaction per batch; every sale carries a client_ref UUID,
+so a batch that is sent twice is only recorded once. A sale the database
+refuses for any reason other than a lost connection (a product deleted
+meanwhile, a month without a partition) is moved to the journal's
+failed_sales table with the error, so the sales after it are not held up;
+the terminal shows how many there are.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import JOURNAL_PATH, JOURNAL_REPLAY_BATCH, JOURNAL_REPLAY_INTERVAL_S, JOURNAL_SLOT_WAIT_S
+from db import is_disconnect
+from sales import record_sale, write_sale
+
+
+class SaleJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pending_sales (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_ref TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL,
+                lines TEXT NOT NULL
+            )
+        """)
+        # Sales the database refused; they stay here for someone to look at
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS failed_sales (
+                seq INTEGER PRIMARY KEY,
+                client_ref TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL,
+                lines TEXT NOT NULL,
+                error TEXT NOT NULL,
+                failed_at TEXT NOT NULL
+            )
+        """)
+
+    def append(self, client_ref, created_at, lines):
+        """Durably stores a sale; `lines` holds (product_id, quantity, price, options) tuples."""
+        payload = json.dumps([[pid, qty, str(price), options] for pid, qty, price, options in lines])
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO pending_sales (client_ref, created_at, lines) VALUES (?, ?, ?)",
+                (client_ref, created_at.isoformat(), payload)
+            )
+
+    def peek(self, limit):
+        """Returns up to `limit` of the oldest sales as (seq, client_ref, created_at, lines)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, client_ref, created_at, lines FROM pending_sales ORDER BY seq LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            (seq, client_ref, datetime.fromisoformat(created_at), [tuple(line) for line in json.loads(lines)])
+            for seq, client_ref, created_at, lines in rows
+        ]
+
+    def remove_through(self, seq, failed=()):
+        """Forgets every sale up to and including `seq`, moving the `failed` ones, (seq, error), to failed_sales."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for failed_seq, error in failed:
+                    self._db.execute("""
+                        INSERT OR REPLACE INTO failed_sales (seq, client_ref, created_at, lines, error, failed_at)
+                        SELECT seq, client_ref, created_at, lines, ?, ? FROM pending_sales WHERE seq = ?
+                    """, (error, datetime.now().isoformat(), failed_seq))
+                self._db.execute("DELETE FROM pending_sales WHERE seq <= ?", (seq,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM pending_sales").fetchone()[0]
+
+    def failed_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM failed_sales").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SaleRecorder:
+    def __init__(self, pool, journal, batch_size=JOURNAL_REPLAY_BATCH, interval=JOURNAL_REPLAY_INTERVAL_S):
+        self.pool = pool
+        self.journal = journal
+        self.batch_size = batch_size
+        self.interval = interval
+        self.backlog = journal.count()  # sales waiting in the journal
+        self.failed = journal.failed_count()  # sales the database refused, see SaleJournal.remove_through
+        self.replayed = 0
+        # Held while writing online and while replaying, so journaled sales are never overtaken
+        self._order_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name="journal-replay", daemon=True)
+        self._thread.start()
+
+    def record(self, lines, holder=None):
+        """Records a sale; returns (sale_id, elapsed) online or (None, elapsed) when journaled.
+
+        Meant to run on a worker thread. `holder` is the terminal whose stock
+        reservations the sale consumes. Errors other than a lost connection
+        propagate, including sales.OutOfStockError.
+        """
+        start = time.perf_counter()
+        client_ref = str(uuid.uuid4())
+        created_at = datetime.now()
+        if self.backlog == 0:
+            with self._order_lock:
+                if self.backlog == 0:
+                    try:
+                        # No connect retries: while the server is away the sale goes to the journal at once.
+                        # Nor a long wait for a slot held by a background job that is still retrying.
+                        with self.pool.connection(retries=0, wait=JOURNAL_SLOT_WAIT_S) as conn:
+                            sale_id, _ = record_sale(conn, lines, client_ref, created_at, holder)
+                        return sale_id, time.perf_counter() - start
+                    except Exception as e:
+                        if not is_disconnect(e):
+                            raise
+        # Appending never waits for the replayer, so the counter keeps selling during an outage
+        self.journal.append(client_ref, created_at, lines)
+        self.backlog = self.journal.count()
+        return None, time.perf_counter() - start
+
+    def replay_batch(self):
+        """Sends the oldest journaled sales in one transaction; returns how many were taken off the journal.
+
+        Each sale is written under a savepoint: one the database refuses is
+        rolled back alone and set aside, and the rest of the batch is
+        committed. A lost connection propagates and the batch stays.
+        """
+        with self._order_lock:
+            batch = self.journal.peek(self.batch_size)
+            if not batch:
+                return 0
+            failed = []
+            with self.pool.connection(retries=0) as conn:
+                with conn.cursor() as cur:
+                    for seq, client_ref, created_at, lines in batch:
+                        cur.execute("SAVEPOINT replay_sale")
+                        try:
+                            # Journaled sales already happened, so a shortage is recorded rather than refused
+                            write_sale(conn, lines, client_ref, created_at, strict=False)
+                        except Exception as e:
+                            if is_disconnect(e):
+                                raise
+                            cur.execute("ROLLBACK TO SAVEPOINT replay_sale")
+                            print(f"Journaled sale {client_ref} was refused and set aside: {e}")
+                            failed.append((seq, str(e).strip()))
+                        else:
+                            cur.execute("RELEASE SAVEPOINT replay_sale")
+            self.journal.remove_through(batch[-1][0], failed)
+            self.backlog = self.journal.count()
+            self.failed += len(failed)
+            self.replayed += len(batch) - len(failed)
+        return len(batch)
+
+    def _replay_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                while self.backlog and not self._stop.is_set() and self.replay_batch():
+                    pass
+            except Exception as e:
+                if not is_disconnect(e):
+                    print(f"Journal replay failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
@@ -0,0 +1,145 @@
+"""Writing sales to the database.
+
+A sale is recorded in one transaction with a fixed number of statements,
+however many lines the cart has: one insert into sales, the stock check and
+set-based stock update of take_stock(), one multi-row insert into sale_items
+and the rollup upserts from rollups.py.
+
+Stock is never oversold: the product rows are locked and checked before
+they are decremented, and a shortage raises OutOfStockError naming every
+short line, leaving the database untouched.
+"""
+import time
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+from reservations import consume
+from rollups import apply_sale
+
+
+class OutOfStockError(Exception):
+    """Raised when a sale asks for more than is available; nothing was written."""
+
+    def __init__(self, shortages):
+        # (product_id, quantity wanted, quantity available) for every short product
+        self.shortages = shortages
+        super().__init__(", ".join(
+            f"product {product_id}: wanted {wanted}, {available} available" for product_id, wanted, available in shortages
+        ))
+
+
+def format_options(size, state, sugar):
+    """The options text stored with a sale line, e.g. "Medium/Hot/Normal"."""
+    if not size:
+        return None
+    return f"{size}/{state}/{sugar}"
+
+
+def take_stock(cur, quantities, holder=None, strict=True):
+    """Takes sold quantities, {product_id: quantity}, off products.stock in the caller's transaction.
+
+    Product rows are locked in id order, so checkouts sharing products queue
+    instead of deadlocking, and checkouts of other products never wait. Units
+    that `holder` reserved count as available to it, and the sold ones are
+    taken off its reservations. With strict=False a shortage is clamped at
+    zero instead of raised; journal replay uses that, because the goods have
+    already left the counter.
+    """
+    product_ids = sorted(quantities)
+    held = consume(cur, holder, quantities) if holder is not None else {}
+    cur.execute(
+        "SELECT id, stock - reserved FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+        (product_ids,)
+    )
+    available = {product_id: free + held.get(product_id, 0) for product_id, free in cur.fetchall()}
+    shortages = [
+        (product_id, quantities[product_id], max(available.get(product_id, 0), 0))
+        for product_id in product_ids if available.get(product_id, 0) < quantities[product_id]
+    ]
+    if shortages and strict:
+        raise OutOfStockError(shortages)
+
+    execute_values(
+        cur,
+        """
+        UPDATE products AS p
+        SET stock = GREATEST(p.stock - v.quantity, 0), reserved = GREATEST(p.reserved - v.held, 0)
+        FROM (VALUES %s) AS v(id, quantity, held)
+        WHERE p.id = v.id
+        """,
+        [(product_id, quantities[product_id], held.get(product_id, 0)) for product_id in product_ids],
+        template="(%s::int, %s::int, %s::int)",
+        page_size=len(product_ids)
+    )
+    return shortages
+
+
+def write_sale(conn, lines, client_ref=None, sale_timestamp=None, holder=None, strict=True):
+    """Writes a sale inside the caller's transaction and returns its id; does not commit.
+
+    `lines` holds (product_id, quantity, price, options) tuples. A sale whose
+    client_ref is already stored with the same sale_timestamp is not written
+    again and its existing id is returned, which makes replaying a sale
+    idempotent: the journal replays every sale with the timestamp it was
+    first recorded with. (client_ref is only unique per timestamp, because
+    sales is partitioned on it, see partitions.py.) `holder` and `strict`
+    are passed to take_stock().
+    """
+    lines = list(lines)
+    if not lines:
+        raise ValueError("A sale needs at least one line.")
+    total = sum((Decimal(str(price)) * quantity for _, quantity, price, _ in lines), Decimal("0.00"))
+
+    quantities = {}
+    for product_id, quantity, _, _ in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO sales (total_amount, sale_timestamp, client_ref)
+            VALUES (%s, COALESCE(%s, CURRENT_TIMESTAMP), %s::uuid)
+            ON CONFLICT (client_ref, sale_timestamp) DO NOTHING
+            RETURNING id, sale_timestamp
+            """,
+            (total, sale_timestamp, client_ref)
+        )
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(
+                "SELECT id FROM sales WHERE client_ref = %s::uuid AND sale_timestamp = %s",
+                (client_ref, sale_timestamp)
+            )
+            return cur.fetchone()[0]
+        sale_id, sale_timestamp = row
+
+        shortages = take_stock(cur, quantities, holder, strict)
+        if shortages:
+            print(f"Sale {client_ref} recorded with too little stock: {OutOfStockError(shortages)}")
+        execute_values(
+            cur,
+            "INSERT INTO sale_items (sale_id, sale_timestamp, product_id, quantity, price_at_sale, options) VALUES %s",
+            [(sale_id, sale_timestamp, product_id, quantity, price, options)
+             for product_id, quantity, price, options in lines],
+            page_size=len(lines)
+        )
+        apply_sale(cur, sale_timestamp, lines)
+    return sale_id
+
+
+def record_sale(conn, lines, client_ref=None, sale_timestamp=None, holder=None):
+    """Records a sale and commits it once.
+
+    Returns (sale_id, elapsed_seconds); on error, including OutOfStockError,
+    the transaction is rolled back and the exception propagates.
+    """
+    start = time.perf_counter()
+    try:
+        sale_id = write_sale(conn, lines, client_ref, sale_timestamp, holder)
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    return sale_id, time.perf_counter() - start
@@ -0,0 +1,82 @@
+"""Barcode scanning with a keyboard-wedge scanner.
+
+A wedge scanner types the digits of a barcode followed by Enter, far faster
+than anyone types by hand. ScanDetector picks those bursts out of the key
+presses the window receives. BarcodeIndex then resolves a code to a product
+from the catalog held in memory, so a scan adds the item to the cart
+without a popup or a database round trip. Codes the index does not know,
+e.g. of a product added a moment ago or when the catalog is not held in
+memory, are looked up with find_barcode(), which uses the unique barcode
+index from tbt.txt.
+
+Codes are compared without leading zeros, so a 12-digit UPC-A label matches
+the same product stored as a 13-digit EAN and the other way round.
+"""
+from config import SCAN_MAX_GAP_MS, SCAN_MIN_LENGTH
+
+DIGITS = frozenset("0123456789")
+
+
+def _key(code):
+    return code.lstrip("0")
+
+
+class ScanDetector:
+    def __init__(self, max_gap_ms=SCAN_MAX_GAP_MS, min_length=SCAN_MIN_LENGTH):
+        self.max_gap_ms = max_gap_ms
+        self.min_length = min_length
+        self._digits = []
+        self._last_ms = None
+
+    def feed(self, char, time_ms):
+        """Feeds one key press ("\\r" for Enter) with its event time; returns the code it completes, or None.
+
+        Only digits that each follow the previous one within max_gap_ms form
+        a burst; a slower digit starts a new one and any other key drops it.
+        """
+        in_burst = self._last_ms is not None and 0 <= time_ms - self._last_ms <= self.max_gap_ms
+        if char in DIGITS:
+            if not in_burst:
+                self._digits.clear()
+            self._digits.append(char)
+            self._last_ms = time_ms
+            return None
+        code = "".join(self._digits) if char == "\r" and in_burst and len(self._digits) >= self.min_length else None
+        self._digits.clear()
+        self._last_ms = None
+        return code
+
+
+class BarcodeIndex:
+    def __init__(self, products=()):
+        self.build(products)
+
+    def build(self, products):
+        """Indexes (product_id, barcode) pairs, skipping products without one; replaces any previous contents."""
+        self._ids = {_key(barcode): product_id for product_id, barcode in products if barcode}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, code):
+        """The id of the product labelled `code`, or None."""
+        return self._ids.get(_key(code))
+
+    def put(self, product_id, old_barcode, barcode):
+        """Moves one product from its old barcode to its new one (either may be None)."""
+        if old_barcode and self._ids.get(_key(old_barcode)) == product_id:
+            del self._ids[_key(old_barcode)]
+        if barcode:
+            self._ids[_key(barcode)] = product_id
+
+
+def find_barcode(conn, code):
+    """Database job: (id, name, price, stock) of the product labelled `code`, or None."""
+    stripped = _key(code)
+    with conn.cursor() as cur:
+        # Each candidate is an equality lookup on the unique barcode index
+        cur.execute(
+            "SELECT id, name, price, stock FROM products WHERE barcode = ANY(%s) LIMIT 1",
+            ([code, stripped, "0" + stripped],)
+        )
+        return cur.fetchone()
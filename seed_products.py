@@ -0,0 +1,118 @@
+"""Seeds the products table from the pictures in pics/.
+
+Run it once after creating the schema (see tbt.txt) and again whenever a
+picture is added or replaced:
+
+    python seed_products.py [--force]
+
+Rows are upserted by barcode in a single batch, and pictures whose content
+hash is already stored are skipped, so running it twice changes nothing.
+The pictures themselves go to the photo store (see photo_store.py).
+"""
+import argparse
+import os
+
+from psycopg2.extras import execute_values
+
+from db import connect
+from photo_store import ensure_photo_schema, migrate, photo_hash, store_photos
+
+# Example mapping: filename (without extension) to (stock, price, barcode)
+product_info = {
+    "espresso": (50, 2.50, "1234567890123"),
+    "latte macchiato": (30, 3.00, "1234567890124"),
+    "cappucino": (20, 3.50, "1234567890125"),
+    "espresso macchiato": (40, 2.00, "1234567890126"),
+    "mocha": (25, 3.75, "1234567890127"),
+    "macchiato": (15, 3.25, "1234567890128"),
+    "caffe late": (10, 4.00, "1234567890129"),
+    "cortado": (5, 4.50, "1234567890130"),
+    "flat white": (8, 3.50, "1234567890131"),
+
+}
+
+pics_dir = os.path.join(os.path.dirname(__file__), "pics")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+
+
+def ensure_seed_schema(cur):
+    """Adds the photo store, photo hash column and barcode unique index the upsert relies on."""
+    ensure_photo_schema(cur)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS products_barcode_key ON products (barcode)")
+
+
+def scan_pictures(directory):
+    """Returns [(name, stock, price, barcode, photo_bytes, photo_hash)] for every known picture."""
+    rows = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        name = os.path.splitext(filename)[0]
+        if name not in product_info:
+            print(f"Skipping {filename}: no info in mapping.")
+            continue
+        stock, price, barcode = product_info[name]
+        with open(os.path.join(directory, filename), "rb") as f:
+            photo_bytes = f.read()
+        rows.append((name, stock, price, barcode, photo_bytes, photo_hash(photo_bytes)))
+    return rows
+
+
+def seed_products(conn, directory=pics_dir, force=False):
+    """Upserts the pictures in `directory` into products and returns the number of rows written."""
+    rows = scan_pictures(directory)
+    # Inline photos left by older versions would otherwise be moved over the new ones later
+    migrate(conn)
+    with conn.cursor() as cur:
+        ensure_seed_schema(cur)
+
+        if not force:
+            cur.execute(
+                "SELECT barcode, photo_hash FROM products WHERE barcode = ANY(%s)",
+                ([row[3] for row in rows],)
+            )
+            stored = dict(cur.fetchall())
+            rows = [row for row in rows if stored.get(row[3]) != row[5]]
+
+        if rows:
+            # Identical pictures are stored once, however many products show them
+            store_photos(cur, [row[4] for row in rows])
+            # Stock is only set for new products; re-seeding must not undo sales.
+            execute_values(
+                cur,
+                """
+                INSERT INTO products (name, stock, price, barcode, photo_hash)
+                VALUES %s
+                ON CONFLICT (barcode) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    price = EXCLUDED.price,
+                    photo_hash = EXCLUDED.photo_hash
+                """,
+                [
+                    (name, stock, price, barcode, photo_hash)
+                    for name, stock, price, barcode, _, photo_hash in rows
+                ]
+            )
+    conn.commit()
+    for row in rows:
+        print(f"Upserted {row[0]}")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the products table from the pics/ directory.")
+    parser.add_argument("--pics", default=pics_dir, help="directory holding the product pictures")
+    parser.add_argument("--force", action="store_true", help="rewrite every product even if its picture is unchanged")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        count = seed_products(conn, args.pics, force=args.force)
+    finally:
+        conn.close()
+    print(f"Seeding done: {count} product(s) written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Where startup time goes.
+
+PhaseTimer collects named phases (imports, database setup, each page build)
+measured from process start. ready() prints them once the login screen can
+be used. Phases that finish later, such as the background catalog prefetch
+or pages built on first use, are printed as they happen.
+"""
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    def __init__(self, origin=None):
+        """`origin` is the perf_counter() value phases are measured from, e.g. taken before imports."""
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases = []  # (name, seconds) in the order they finished
+        self.ready_s = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+        if self.ready_s is not None:
+            print(f"Startup: {name}: {seconds * 1000:.1f} ms")
+
+    @contextmanager
+    def phase(self, name):
+        """with timer.phase("build menu page"): ... records how long the block took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def ready(self, what="login screen"):
+        """Marks the app as usable and prints the phases measured so far."""
+        self.ready_s = self.elapsed()
+        for name, seconds in self.phases:
+            print(f"Startup: {name}: {seconds * 1000:.1f} ms")
+        print(f"Startup: {what} interactive after {self.ready_s * 1000:.1f} ms")
+
+    def as_dict(self):
+        return {
+            "ready_ms": None if self.ready_s is None else round(self.ready_s * 1000, 1),
+            "phases_ms": [[name, round(seconds * 1000, 1)] for name, seconds in self.phases],
+        }
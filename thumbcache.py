@@ -0,0 +1,104 @@
+"""Two-level cache of pre-rendered product pictures.
+
+Pictures are the variants rendered when a photo is stored (see
+photo_variants.py), keyed by the photo's content hash and the variant name,
+so a changed picture never serves a stale image and products sharing a
+picture share one entry. The first level is an in-memory LRU of decoded
+images bounded in bytes, the second a directory holding the variants'
+encoded bytes, which survives restarts. Nothing is resized here.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import THUMB_CACHE_DIR, THUMB_CACHE_MAX_BYTES
+
+# Sizes the UI displays product pictures at; each is served by the nearest variant
+MENU_THUMB_SIZE = (130, 130)
+POPUP_THUMB_SIZE = (260, 260)
+
+
+def decode(data):
+    """Decodes an encoded variant into a loaded PIL image."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def _image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class ThumbnailCache:
+    def __init__(self, directory=THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # key -> PIL image, least recently used first
+        self._memory_bytes = 0
+        self._lock = threading.Lock()  # the image loader workers share one cache
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, photo_hash, variant):
+        return os.path.join(self.directory, f"{photo_hash}-{variant}")
+
+    def _remember(self, key, image):
+        if key in self._memory:
+            self._memory_bytes -= _image_nbytes(self._memory.pop(key))
+        self._memory[key] = image
+        self._memory_bytes += _image_nbytes(image)
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= _image_nbytes(evicted)
+
+    def peek(self, photo_hash, variant):
+        """Returns the picture if it is in memory, else None; never reads the disk."""
+        with self._lock:
+            image = self._memory.get((photo_hash, variant))
+            if image is not None:
+                self._memory.move_to_end((photo_hash, variant))
+                self.hits += 1
+            return image
+
+    def get(self, photo_hash, variant):
+        """Returns the cached picture or None, checking memory first and then disk."""
+        if not photo_hash:
+            return None
+        key = (photo_hash, variant)
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return image
+        try:
+            with open(self._path(photo_hash, variant), "rb") as f:
+                image = decode(f.read())
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, image)
+        return image
+
+    def put(self, photo_hash, variant, data):
+        """Stores a variant's encoded bytes in both levels and returns it decoded."""
+        image = decode(data)
+        with self._lock:
+            self._remember((photo_hash, variant), image)
+        path = self._path(photo_hash, variant)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write thumbnail {path}: {e}")
+        return image
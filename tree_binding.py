@@ -0,0 +1,103 @@
+"""Incremental updates of a ttk.Treeview from a list of records.
+
+A TreeBinding gives every record a stable iid derived from its key and
+remembers the values last shown for it. update() then compares the new
+record list with what is on screen and issues only the Tcl calls needed:
+one delete for all vanished rows, and an insert, move or item() call for
+each row that is new, out of place or changed. put() and discard() handle a
+single record when the caller already knows which one changed.
+"""
+
+
+class TreeBinding:
+    def __init__(self, tree, key, values):
+        """key(record) gives the record identity, values(record) the tuple shown in the columns."""
+        self.tree = tree
+        self.key = key
+        self.values = values
+        self._order = []     # iids in display order
+        self._shown = {}     # iid -> values tuple currently displayed
+        self._records = {}   # iid -> record
+
+    def _iids(self, records):
+        iids = []
+        seen = {}
+        for record in records:
+            iid = str(self.key(record))
+            # Records sharing a key still get distinct, stable iids
+            count = seen.get(iid, 0)
+            seen[iid] = count + 1
+            iids.append(iid if count == 0 else f"{iid}#{count}")
+        return iids
+
+    def update(self, records):
+        """Shows `records` in order and returns the number of rows that had to be touched."""
+        records = list(records)
+        iids = self._iids(records)
+        new_shown = {iid: tuple(self.values(record)) for iid, record in zip(iids, records)}
+        touched = 0
+
+        gone = [iid for iid in self._order if iid not in new_shown]
+        if gone:
+            self.tree.delete(*gone)
+            touched += len(gone)
+            order = [iid for iid in self._order if iid in new_shown]
+        else:
+            order = self._order
+
+        # Invariant: order[:index] already matches iids[:index]
+        for index, iid in enumerate(iids):
+            values = new_shown[iid]
+            if iid not in self._shown:
+                self.tree.insert("", index, iid=iid, values=values)
+                order.insert(index, iid)
+                touched += 1
+                continue
+            changed = False
+            if order[index] != iid:
+                self.tree.move(iid, "", index)
+                order.remove(iid)
+                order.insert(index, iid)
+                changed = True
+            if self._shown[iid] != values:
+                self.tree.item(iid, values=values)
+                changed = True
+            touched += changed
+
+        self._order = order
+        self._shown = new_shown
+        self._records = dict(zip(iids, records))
+        return touched
+
+    def put(self, record):
+        """Shows or refreshes a single record, appending it if it is new. Touches one row at most."""
+        iid = str(self.key(record))
+        values = tuple(self.values(record))
+        if iid not in self._shown:
+            self.tree.insert("", "end", iid=iid, values=values)
+            self._order.append(iid)
+        elif self._shown[iid] != values:
+            self.tree.item(iid, values=values)
+        self._shown[iid] = values
+        self._records[iid] = record
+
+    def discard(self, record):
+        """Removes a single record's row if it is shown."""
+        iid = str(self.key(record))
+        if iid in self._shown:
+            self.tree.delete(iid)
+            self._order.remove(iid)
+            del self._shown[iid]
+            del self._records[iid]
+
+    def record(self, iid):
+        """Returns the record displayed in row `iid`, or None."""
+        return self._records.get(iid)
+
+    def clear(self):
+        """Removes every row."""
+        if self._order:
+            self.tree.delete(*self._order)
+        self._order = []
+        self._shown = {}
+        self._records = {}